@@ -0,0 +1,158 @@
+"""Admission control in front of ``/analyze`` and ``/recommend``.
+
+Each worker runs at most ``ADMISSION_MAX_ACTIVE`` analyses and recommendations
+at once: synchronous requests and queued analysis jobs alike. Up to
+``ADMISSION_MAX_WAITING`` more requests wait, interactive work ahead of
+background work, for at most ``ADMISSION_QUEUE_TIMEOUT_SECONDS``. Anything
+beyond that gets ``429`` with ``Retry-After`` straight away, instead of holding a
+request thread while the upstreams are saturated. JSON ``/analyze`` requests
+only enqueue a job; they are refused once ``ADMISSION_MAX_QUEUED_JOBS``
+interactive (or ``ADMISSION_MAX_QUEUED_BACKGROUND_JOBS`` background) jobs are
+waiting across all workers.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+from flask import current_app, flash, jsonify, redirect, url_for
+import metrics
+import ratelimit
+import utils
+
+class Rejected(Exception):
+    """The work was not admitted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+_DEFAULT_TIMEOUT = object()
+
+class AdmissionQueue:
+    """A bounded, two-priority queue of requests waiting for one of ``max_active`` slots."""
+
+    def __init__(self, max_active: int = 16, max_waiting: int = 8, timeout: float = 10, retry_after: int = 5):
+        self.max_active = max(1, int(max_active))
+        self.max_waiting = max(0, int(max_waiting))
+        self.timeout = float(timeout)
+        self.retry_after = int(retry_after)
+        self.active = 0
+        self._waiting: Dict[str, Deque[object]] = {ratelimit.INTERACTIVE: deque(), ratelimit.BACKGROUND: deque()}
+        self._cond = threading.Condition()
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def _head(self) -> Optional[object]:
+        for waiting in self._waiting.values():
+            if waiting:
+                return waiting[0]
+        return None
+
+    def _reject(self, reason: str, message: str) -> None:
+        self.stats[f"rejected_{reason}"] += 1
+        metrics.ADMISSION_REJECTIONS.labels("requests").inc()
+        raise Rejected(message, self.retry_after)
+
+    def acquire(self, priority: str = ratelimit.INTERACTIVE, timeout: Any = _DEFAULT_TIMEOUT) -> None:
+        """Take a slot, waiting behind higher-priority and earlier work.
+
+        Raises ``Rejected`` when the waiting line is full or ``timeout`` passes. With
+        ``timeout=None`` the caller (a job worker) always waits its turn.
+        """
+        timeout = self.timeout if timeout is _DEFAULT_TIMEOUT else timeout
+        started = time.perf_counter()
+        with self._cond:
+            if self.active < self.max_active and self._head() is None:
+                self.active += 1
+            else:
+                waiting_now = sum(len(waiting) for waiting in self._waiting.values())
+                if timeout is not None and waiting_now >= self.max_waiting:
+                    self._reject("full", "The server is busy; try again shortly.")
+                ticket = object()
+                line = self._waiting.get(priority, self._waiting[ratelimit.BACKGROUND])
+                line.append(ticket)
+                deadline = None if timeout is None else time.monotonic() + timeout
+                try:
+                    while not (self.active < self.max_active and self._head() is ticket):
+                        left = None if deadline is None else deadline - time.monotonic()
+                        if left is not None and left <= 0:
+                            self._reject("timeout", "The server is busy; try again shortly.")
+                        self._cond.wait(left)
+                    self.active += 1
+                finally:
+                    line.remove(ticket)
+                    # Whoever is next in line may now be at the head.
+                    self._cond.notify_all()
+            self.stats["admitted"] += 1
+        metrics.ADMISSION_WAIT_SECONDS.labels(priority).observe(time.perf_counter() - started)
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, priority: str = ratelimit.INTERACTIVE, timeout: Any = _DEFAULT_TIMEOUT) -> Iterator[None]:
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "active": self.active,
+                "max_active": self.max_active,
+                "waiting": {priority: len(waiting) for priority, waiting in self._waiting.items()},
+                "max_waiting": self.max_waiting,
+                **self.stats,
+            }
+
+_queue: Optional[AdmissionQueue] = None
+_queue_pid: Optional[int] = None
+_queue_lock = threading.Lock()
+
+def get_admission_queue() -> AdmissionQueue:
+    """This worker process's admission queue, built from the current app's config."""
+    global _queue, _queue_pid
+    if _queue is None or _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue_pid != os.getpid():
+                config = current_app.config
+                _queue = AdmissionQueue(
+                    max_active=config.get("ADMISSION_MAX_ACTIVE", 16),
+                    max_waiting=config.get("ADMISSION_MAX_WAITING", 8),
+                    timeout=config.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", 10),
+                    retry_after=config.get("ADMISSION_RETRY_AFTER_SECONDS", 5),
+                )
+                _queue_pid = os.getpid()
+    return _queue
+
+def admit(priority: Optional[str] = None, timeout: Any = _DEFAULT_TIMEOUT):
+    """``with admission.admit(): ...`` holds one of this worker's slots (at the current work priority)."""
+    return get_admission_queue().admit(priority or ratelimit.current_priority(), timeout)
+
+def check_job_backlog(queue, priority: str = ratelimit.INTERACTIVE) -> None:
+    """Refuse a new job while its priority's limit of jobs is already waiting.
+
+    Interactive jobs are limited by ``ADMISSION_MAX_QUEUED_JOBS``, background ones
+    separately by ``ADMISSION_MAX_QUEUED_BACKGROUND_JOBS``, so a bulk backlog never
+    turns users away.
+    """
+    setting = "ADMISSION_MAX_QUEUED_JOBS" if priority == ratelimit.INTERACTIVE else "ADMISSION_MAX_QUEUED_BACKGROUND_JOBS"
+    limit = int(current_app.config.get(setting, 200 if priority == ratelimit.INTERACTIVE else 1000) or 0)
+    if limit > 0 and queue.depth(priority) >= limit:
+        metrics.ADMISSION_REJECTIONS.labels("jobs").inc()
+        raise Rejected("Too many analyses are queued; try again shortly.", int(current_app.config.get("ADMISSION_RETRY_AFTER_SECONDS", 5)))
+
+def too_busy(exc: Rejected):
+    """``429`` with ``Retry-After`` for API clients; the usual flash and redirect for browser forms."""
+    if utils.wants_json_response():
+        response = jsonify({"error": str(exc), "retry_after": exc.retry_after})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(exc.retry_after)
+        return response
+    flash(f"{exc} (retry in about {exc.retry_after}s)", "error")
+    return redirect(url_for("main.home"))
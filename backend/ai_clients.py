@@ -0,0 +1,121 @@
+"""Per-process registry of AI model clients.
+
+``google.generativeai`` (and the gRPC stack under it) takes most of a second to
+import, and ``genai.configure`` plus a new ``GenerativeModel`` per call built a
+fresh transport client for every request. Here the SDK is imported on first
+use, and each worker process configures it and builds one model per API key,
+which keeps its transport (gRPC channel or REST session) across calls.
+
+Under gunicorn, the ``post_worker_init`` hook in ``gunicorn_config.py`` runs
+``warm_up`` on a background thread as each worker boots, so the import and
+client construction happen off the request path (``AI_CLIENT_WARMUP``). Importing lazily also keeps gRPC out of the master
+process, where it must not be initialised before forking.
+
+``genai.configure`` is process-global, so it is not used: each API key gets its
+own ``generativelanguage`` service clients, built from the public client classes.
+``GenerativeModel`` has no public way to take a client, so they are bound through
+its ``_client`` and ``_async_client`` attributes, which is how google-generativeai
+0.8 holds them; check ``get_gemini_model`` when upgrading the SDK.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+_settings: Dict[str, Any] = {"gemini_base_url": None}
+_models: Dict[Tuple[str, str], Any] = {}
+_models_pid: Optional[int] = None
+_lock = threading.Lock()
+_stats: Dict[str, float] = {"import_ms": 0.0, "build_ms": 0.0, "builds": 0, "hits": 0}
+
+def configure(config: Dict[str, Any]) -> None:
+    """Send Gemini calls to ``GEMINI_BASE_URL`` over REST when it is set (e.g. a local stub server)."""
+    base_url = (config.get("GEMINI_BASE_URL") or "").rstrip("/") or None
+    with _lock:
+        if base_url != _settings["gemini_base_url"]:
+            _settings["gemini_base_url"] = base_url
+            _models.clear()
+
+def gemini_base_url() -> Optional[str]:
+    return _settings["gemini_base_url"]
+
+def _import_genai():
+    started = time.perf_counter()
+    import google.generativeai as genai
+    from google.ai import generativelanguage as glm
+    from google.api_core.client_options import ClientOptions
+    from google.api_core.gapic_v1.client_info import ClientInfo
+
+    if not _stats["import_ms"]:
+        _stats["import_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return genai, glm, ClientOptions, ClientInfo
+
+def _client_config(api_key: str) -> Dict[str, Any]:
+    """What ``genai.configure`` would set up for ``api_key``, for this key's clients only."""
+    genai, _, ClientOptions, ClientInfo = _import_genai()
+    base_url = _settings["gemini_base_url"]
+    config = {
+        "client_options": ClientOptions(api_key=api_key, api_endpoint=base_url),
+        "client_info": ClientInfo(user_agent=f"genai-py/{genai.__version__}"),
+    }
+    if base_url:
+        config["transport"] = "rest"
+    return config
+
+def get_gemini_model(api_key: str, model_name: str, bind_async: bool = False) -> Any:
+    """This process's ``GenerativeModel`` for ``api_key``, built on first use.
+
+    Pass ``bind_async`` from coroutines on the ``aio`` loop: the async client is
+    created there, on the loop it belongs to, the first time it is needed.
+    """
+    global _models_pid
+    pid = os.getpid()
+    key = (api_key, model_name)
+    with _lock:
+        if _models_pid != pid:
+            # Clients (and their sockets) inherited over fork belong to the parent.
+            _models.clear()
+            _models_pid = pid
+        model = _models.get(key)
+        if model is not None:
+            _stats["hits"] += 1
+        else:
+            genai, glm, _, _ = _import_genai()
+            started = time.perf_counter()
+            model = genai.GenerativeModel(model_name=model_name)
+            model._client = glm.GenerativeServiceClient(**_client_config(api_key))
+            _models[key] = model
+            _stats["builds"] += 1
+            _stats["build_ms"] += (time.perf_counter() - started) * 1000
+        if bind_async and model._async_client is None and not _settings["gemini_base_url"]:
+            # The REST transport has no async client; ai_services runs those calls on a thread.
+            _, glm, _, _ = _import_genai()
+            model._async_client = glm.GenerativeServiceAsyncClient(**_client_config(api_key))
+        return model
+
+def warm_up(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the Gemini model, the HTTP clients and the aio loop now rather than on the first request."""
+    import ai_services
+    import aio
+    import http_client
+
+    started = time.perf_counter()
+    configure(config)
+    if config.get("GEMINI_API_KEY"):
+        get_gemini_model(config["GEMINI_API_KEY"], ai_services.GEMINI_MODEL)
+    http_client.get_http_client()
+    if config.get("AIO_PIPELINE_ENABLED", True):
+        aio.get_loop()
+        # The async HTTP client belongs to the loop; create it there.
+        aio.run(_build_async_http_client())
+    return {**stats(), "warm_up_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+async def _build_async_http_client() -> None:
+    import http_client
+
+    http_client.get_async_http_client()
+
+def stats() -> Dict[str, Any]:
+    # Not under ``_lock``: a warm-up can hold it for the whole SDK import.
+    models = [name for _, name in list(_models)] if _models_pid == os.getpid() else []
+    return {"pid": os.getpid(), "models": models, **_stats, "build_ms": round(_stats["build_ms"], 1)}
@@ -1,15 +1,52 @@
+import asyncio
 import json
-from typing import Any, Dict, List, Optional
-import google.generativeai as genai
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import httpx
 import requests
-from utils import clean_json_response, _extract_text_from_gemini, parse_numbered_list
+import ai_clients
+import aio
+import cache
+import metrics
+import ratelimit
+import resilience
+from http_client import get_async_http_client, get_http_client
+from text_pipeline import parse_numbered_list
+from utils import clean_json_response, _extract_text_from_gemini
 
-def call_gemini_for_greenery(image_part: Optional[Dict[str, str]], metadata: Dict[str, Any], api_key: str) -> Dict[str, Any]:
-    genai.configure(api_key=api_key)
+GEMINI_MODEL = "gemini-2.5-pro"
+PERPLEXITY_MODEL = "sonar-pro"
+PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+# Upper bounds per call; the request's latency budget (``resilience.timeout``) can only shorten them.
+GEMINI_TIMEOUT_SECONDS = 120
+PERPLEXITY_TIMEOUT_SECONDS = 60
+
+# Bump these whenever the matching prompt text changes so cached outputs are not reused.
+GREENERY_PROMPT_VERSION = "greenery-v2"
+TREES_PROMPT_VERSION = "trees-v1"
+RECOMMENDATION_PROMPT_VERSION = "recommendations-v1"
+
+def _gemini_model(api_key: str, bind_async: bool = False) -> Any:
+    # Built once per process and reused (see ai_clients).
+    return ai_clients.get_gemini_model(api_key, GEMINI_MODEL, bind_async=bind_async)
+
+async def _generate_content_async(model: Any, contents: Any, **kwargs: Any) -> Any:
+    if ai_clients.gemini_base_url():
+        # The SDK's REST transport has no async client; run the blocking call on a worker thread.
+        return await asyncio.to_thread(model.generate_content, contents, **kwargs)
+    return await model.generate_content_async(contents, **kwargs)
+
+def _gemini_request_options() -> Dict[str, float]:
+    return {"timeout": resilience.timeout(GEMINI_TIMEOUT_SECONDS)}
+
+def _request_bytes(contents: Any) -> int:
+    # Prompt text plus base64 image data, as serialized for the wire.
+    return len(json.dumps(contents, separators=(",", ":")).encode("utf-8"))
+
+def _greenery_parts(image_part: Optional[Dict[str, str]], metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
     prompt = (
         """You are an urban analysis assistant focused on Delhi, India. 
         Using the provided ward metadata and satellite imagery, estimate a greenery score 
-        between 0 and 10 (higher means more visible vegetation), summarize what you see, 
+        between 0 and 100 (higher means more visible vegetation), summarize what you see, 
         and relate it to the population density. Respond ONLY with valid JSON in this structure:
         {
           \"greenery_score\": <integer 0-100>,
@@ -21,7 +58,7 @@ def call_gemini_for_greenery(image_part: Optional[Dict[str, str]], metadata: Dic
     ) if image_part else (
         """You are an urban analysis assistant focused on Delhi, India. 
         There is no current satellite imagery available, so rely solely on the ward metadata 
-        to infer greenery conditions. Estimate a greenery score between 0 and 10, summarize 
+        to infer greenery conditions. Estimate a greenery score between 0 and 100, summarize 
         likely vegetation, and relate it to the population density. Respond ONLY with valid JSON in this structure:
         {
           \"greenery_score\": <integer 0-100>,
@@ -36,13 +73,31 @@ def call_gemini_for_greenery(image_part: Optional[Dict[str, str]], metadata: Dic
     if image_part:
         parts.append({"role": "user", "parts": [image_part]})
     parts.append({"role": "user", "parts": [{"text": "Ward metadata (JSON):\n" + json.dumps(metadata, indent=2)}]})
+    return parts
 
-    model = genai.GenerativeModel(model_name="gemini-2.5-pro")
-    response = model.generate_content(parts)
-    text = _extract_text_from_gemini(response)
+def call_gemini_for_greenery(image_part: Optional[Dict[str, str]], metadata: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+    model = _gemini_model(api_key)
+    contents = _greenery_parts(image_part, metadata)
+    ratelimit.wait("gemini")
+    with resilience.guard("gemini"):
+        with metrics.upstream_call("gemini", "greenery"):
+            response = model.generate_content(contents, request_options=_gemini_request_options())
+            text = _extract_text_from_gemini(response)
+    metrics.count_bytes("gemini", sent=_request_bytes(contents), received=len(text.encode("utf-8")))
+    return clean_json_response(text)
+
+async def call_gemini_for_greenery_async(image_part: Optional[Dict[str, str]], metadata: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+    model = _gemini_model(api_key, bind_async=True)
+    contents = _greenery_parts(image_part, metadata)
+    async with aio.limit("gemini"):
+        with resilience.guard("gemini"):
+            with metrics.upstream_call("gemini", "greenery"):
+                response = await _generate_content_async(model, contents, request_options=_gemini_request_options())
+                text = _extract_text_from_gemini(response)
+    metrics.count_bytes("gemini", sent=_request_bytes(contents), received=len(text.encode("utf-8")))
     return clean_json_response(text)
 
-def suggest_trees_via_perplexity(metadata: Dict[str, Any], api_key: str) -> List[str]:
+def _trees_request(metadata: Dict[str, Any], api_key: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
@@ -58,7 +113,7 @@ def suggest_trees_via_perplexity(metadata: Dict[str, Any], api_key: str) -> List
         "- No headings, no extra paragraphs, no code fences, no trailing commentary."
     )
     payload = {
-        "model": "sonar-pro",
+        "model": PERPLEXITY_MODEL,
         "temperature": 0.2,
         "max_tokens": 400,
         "messages": [
@@ -66,19 +121,61 @@ def suggest_trees_via_perplexity(metadata: Dict[str, Any], api_key: str) -> List
             {"role": "user", "content": prompt},
         ],
     }
+    return headers, payload
+
+def prompt_fingerprint() -> str:
+    """Hash of the greenery and tree prompts as sent, with the ward's data left out.
+
+    Covers the prompt text as well as the models and versions, so an edited prompt
+    counts as a change even if its version was not bumped.
+    """
+    return cache.content_hash({
+        "models": [GEMINI_MODEL, PERPLEXITY_MODEL],
+        "versions": [GREENERY_PROMPT_VERSION, TREES_PROMPT_VERSION],
+        "greenery": [_greenery_parts({"mime_type": "image/jpeg", "data": ""}, {}), _greenery_parts(None, {})],
+        "trees": _trees_request({}, "")[1],
+    })
+
+def suggest_trees_via_perplexity(metadata: Dict[str, Any], api_key: str, base_url: str = PERPLEXITY_BASE_URL) -> List[str]:
+    headers, payload = _trees_request(metadata, api_key)
     try:
-        r = requests.post("https://api.perplexity.ai/chat/completions", headers=headers, json=payload, timeout=60)
-        r.raise_for_status()
+        ratelimit.wait("perplexity")
+        with resilience.guard("perplexity"):
+            with metrics.upstream_call("perplexity", "trees"):
+                r = get_http_client().post(
+                    f"{base_url.rstrip('/')}/chat/completions", headers=headers, json=payload,
+                    timeout=resilience.timeout(PERPLEXITY_TIMEOUT_SECONDS),
+                )
+                r.raise_for_status()
     except requests.exceptions.RequestException as e:
         err = getattr(e, "response", None)
         raise RuntimeError(f"Perplexity request failed: {e}\n{getattr(err, 'text', '')}")
+    metrics.count_bytes("perplexity", sent=_request_bytes(payload), received=len(r.content))
     data = r.json()
     content = data["choices"][0]["message"]["content"]
     return parse_numbered_list(content)
 
-def generate_construction_recommendations(metadata: Dict[str, Any], greenery: Dict[str, Any], trees: List[str], construction_type: str, api_key: str) -> str:
-    genai.configure(api_key=api_key)
-    prompt = (
+async def suggest_trees_via_perplexity_async(metadata: Dict[str, Any], api_key: str, base_url: str = PERPLEXITY_BASE_URL) -> List[str]:
+    headers, payload = _trees_request(metadata, api_key)
+    try:
+        async with aio.limit("perplexity"):
+            with resilience.guard("perplexity"):
+                with metrics.upstream_call("perplexity", "trees"):
+                    r = await get_async_http_client().post(
+                        f"{base_url.rstrip('/')}/chat/completions", headers=headers, json=payload,
+                        timeout=resilience.timeout(PERPLEXITY_TIMEOUT_SECONDS),
+                    )
+                    r.raise_for_status()
+    except httpx.HTTPError as e:
+        err = getattr(e, "response", None)
+        raise RuntimeError(f"Perplexity request failed: {e}\n{getattr(err, 'text', '')}")
+    metrics.count_bytes("perplexity", sent=_request_bytes(payload), received=len(r.content))
+    data = r.json()
+    content = data["choices"][0]["message"]["content"]
+    return parse_numbered_list(content)
+
+def _recommendation_prompt(metadata: Dict[str, Any], greenery: Dict[str, Any], trees: List[str], construction_type: str) -> str:
+    return (
         "You are an urban planner for Delhi adhering to SDG 11 and Delhi Development Authority rules.\n"
         f"Construction type requested: {construction_type}.\n"
         f"Ward metadata: {json.dumps(metadata)}\n"
@@ -94,6 +191,43 @@ def generate_construction_recommendations(metadata: Dict[str, Any], greenery: Di
         "Give heading for each point like *SDG11 requirements:* and *DDA Rules Compliance* that should be in bold like Actionable Next Steps."
     )
 
-    model = genai.GenerativeModel(model_name="gemini-2.5-pro")
-    response = model.generate_content(prompt)
-    return response.text.strip()
+def generate_construction_recommendations(metadata: Dict[str, Any], greenery: Dict[str, Any], trees: List[str], construction_type: str, api_key: str) -> str:
+    model = _gemini_model(api_key)
+    prompt = _recommendation_prompt(metadata, greenery, trees, construction_type)
+    ratelimit.wait("gemini")
+    with resilience.guard("gemini"):
+        with metrics.upstream_call("gemini", "recommendations"):
+            text = model.generate_content(prompt, request_options=_gemini_request_options()).text.strip()
+    metrics.count_bytes("gemini", sent=len(prompt.encode("utf-8")), received=len(text.encode("utf-8")))
+    return text
+
+async def generate_construction_recommendations_async(metadata: Dict[str, Any], greenery: Dict[str, Any], trees: List[str], construction_type: str, api_key: str) -> str:
+    model = _gemini_model(api_key, bind_async=True)
+    prompt = _recommendation_prompt(metadata, greenery, trees, construction_type)
+    async with aio.limit("gemini"):
+        with resilience.guard("gemini"):
+            with metrics.upstream_call("gemini", "recommendations"):
+                response = await _generate_content_async(model, prompt, request_options=_gemini_request_options())
+                text = response.text.strip()
+    metrics.count_bytes("gemini", sent=len(prompt.encode("utf-8")), received=len(text.encode("utf-8")))
+    return text
+
+def stream_construction_recommendations(metadata: Dict[str, Any], greenery: Dict[str, Any], trees: List[str], construction_type: str, api_key: str) -> Iterator[str]:
+    """Yield the recommendation text piece by piece as Gemini generates it."""
+    model = _gemini_model(api_key)
+    prompt = _recommendation_prompt(metadata, greenery, trees, construction_type)
+    received = 0
+    ratelimit.wait("gemini")
+    with resilience.guard("gemini"):
+        with metrics.upstream_call("gemini", "recommendations_stream"):
+            response = model.generate_content(prompt, stream=True, request_options=_gemini_request_options())
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. a trailing finish_reason) raise on .text.
+                    continue
+                if text:
+                    received += len(text.encode("utf-8"))
+                    yield text
+    metrics.count_bytes("gemini", sent=len(prompt.encode("utf-8")), received=received)
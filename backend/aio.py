@@ -0,0 +1,84 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional
+import ratelimit
+
+DEFAULT_LIMITS: Dict[str, int] = {
+    "gemini": 32,
+    "perplexity": 16,
+    "static_maps": 16,
+}
+
+_limits: Dict[str, int] = dict(DEFAULT_LIMITS)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_loop_lock = threading.Lock()
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_in_flight: Dict[str, int] = {}
+
+def configure(config: Dict[str, Any]) -> None:
+    """Record per-provider concurrency limits from the app config (request rates are ``ratelimit``'s)."""
+    _limits.update({
+        "gemini": config.get("AIO_GEMINI_CONCURRENCY", DEFAULT_LIMITS["gemini"]),
+        "perplexity": config.get("AIO_PERPLEXITY_CONCURRENCY", DEFAULT_LIMITS["perplexity"]),
+        "static_maps": config.get("AIO_STATIC_MAPS_CONCURRENCY", DEFAULT_LIMITS["static_maps"]),
+    })
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return this process's event loop, running on a daemon thread.
+
+    Request and job threads hand coroutines to it with ``run``; every upstream
+    call in the process is multiplexed on this one loop. Built lazily so each
+    gunicorn worker starts its own loop after fork.
+    """
+    global _loop, _loop_pid
+    pid = os.getpid()
+    if _loop is None or _loop_pid != pid:
+        with _loop_lock:
+            if _loop is None or _loop_pid != pid:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="aio-loop", daemon=True).start()
+                _semaphores.clear()
+                _in_flight.clear()
+                _loop, _loop_pid = loop, pid
+    return _loop
+
+def submit(coro: Awaitable[Any]) -> Future:
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+def run(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run ``coro`` on the shared loop and block the calling thread for its result."""
+    future = submit(coro)
+    try:
+        return future.result(timeout=timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+@asynccontextmanager
+async def limit(provider: str) -> AsyncIterator[None]:
+    """Hold one of ``provider``'s concurrency slots, after waiting for its shared quota (``ratelimit``).
+
+    Must run on the shared loop.
+    """
+    await ratelimit.wait_async(provider)
+    semaphore = _semaphores.get(provider)
+    if semaphore is None:
+        semaphore = _semaphores[provider] = asyncio.Semaphore(max(1, int(_limits.get(provider, 8))))
+    async with semaphore:
+        _in_flight[provider] = _in_flight.get(provider, 0) + 1
+        try:
+            yield
+        finally:
+            _in_flight[provider] -= 1
+
+def stats() -> Dict[str, Any]:
+    return {
+        "pid": os.getpid(),
+        "running": _loop is not None and _loop_pid == os.getpid(),
+        "limits": dict(_limits),
+        "in_flight": dict(_in_flight),
+    }
@@ -3,25 +3,65 @@ from flask_cors import CORS
 from config import load_configuration
 from routes import main_bp
 from pathlib import Path
+import os
+import ai_clients
+import aio
+import http_client
+import image_store
+import jobs
+import metrics
+import pipeline
+import ratelimit
+import resilience
+import session_store
+import static_assets
 import utils
+import ward_features
 
 def create_app():
-    app = Flask(__name__, static_folder='../../delhiInfra', static_url_path='')
+    app = Flask(__name__, static_folder='../../delhiInfra', static_url_path='', instance_path=os.getenv("INSTANCE_PATH") or None)
     
     # Load configuration
     app.config.update(load_configuration())
+    http_client.configure(app.config)
+    ai_clients.configure(app.config)
+    aio.configure(app.config)
+    resilience.configure(app.config)
+    ratelimit.configure(app.config, app.instance_path)
 
     # Initialize CORS
     CORS(app, origins=list(app.config.get("FRONTEND_ALLOWED_ORIGINS", [])), supports_credentials=True)
 
-    # Create image storage directory
+    # Create image storage directory and start its background GC
     with app.app_context():
         image_storage_dir = Path(app.instance_path) / "analysis_images"
         image_storage_dir.mkdir(parents=True, exist_ok=True)
+    image_store.start_sweeper(app)
+
+    # Fingerprinted, precompressed copies of ../js and ../css, reused across workers and restarts
+    static_assets.init_app(app)
+
+    # Per-ward area, density and centroid for the prompts, memory-mapped and shared by all workers
+    ward_features.init_app(app)
+
+    # Keep analysis state server-side; expired sessions give back their image references
+    session_interface = session_store.build_session_interface(
+        app, on_expire=lambda data: utils.release_analysis_image((data.get("analysis") or {}).get("image_token"))
+    )
+    if session_interface is not None:
+        app.session_interface = session_interface
+
+    # Queued /analyze jobs run on worker threads in this process (JOB_WORKER_THREADS)
+    # or in a dedicated `python jobs.py` process.
+    jobs.register_handler("analysis", pipeline.run_analysis_job)
+    jobs.start_workers(app)
 
     # Register blueprint
     app.register_blueprint(main_bp)
 
+    # Request latency histograms and Server-Timing headers; /metrics adds up every gunicorn worker
+    metrics.init_app(app)
+
     @app.after_request
     def after_request(response):
         return utils.set_security_headers(response)
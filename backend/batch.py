@@ -0,0 +1,377 @@
+"""Analyze many wards in one run and stream the results to NDJSON or CSV.
+
+    python batch.py --district "North West" --output north_west.ndjson
+    python batch.py --all --output delhi.csv --workers 16 --gemini-rpm 60 --resume
+    python batch.py --all --incremental delhi.csv --output delhi-refresh.csv [--dry-run]
+
+Each ward goes through the same stages as /analyze (static map, Gemini greenery,
+Perplexity trees) on the shared asyncio loop. Results are appended and flushed
+one ward at a time; the output file doubles as the checkpoint, so ``--resume``
+skips every ward already written and re-runs the rest, including failures.
+
+Every record carries the fingerprint of the ward's inputs (static map, AI
+metadata, prompts; see ``pipeline.input_fingerprint``). ``--incremental`` compares
+them with an earlier output file: wards whose inputs have not changed get their
+earlier record copied forward and only the rest are analyzed. ``--dry-run``
+reports what would be recomputed and the upstream calls it would take.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+import aio
+import cache
+import pipeline
+import ratelimit
+import resilience
+import utils
+import wards
+
+CSV_FIELDS = [
+    "ward_id", "name", "district", "population", "area_sq_km",
+    "greenery_score", "greenery_summary", "population_context", "observations",
+    "trees", "image_token", "image_error", "image_bytes_saved", "total_ms", "analyzed_at",
+    "input_fingerprint", "carried_forward",
+]
+PROVIDERS = ("gemini", "perplexity", "static_maps")
+# Dry runs do not fetch static maps, so a ward without a stored one may or may not have changed.
+MAP_NOT_CACHED = "map not cached, would fetch"
+
+def select_wards(registry, district: Optional[str], ward_ids: List[str]) -> List[str]:
+    if ward_ids:
+        unknown = [ward_id for ward_id in ward_ids if registry.get(ward_id) is None]
+        if unknown:
+            raise SystemExit(f"Unknown ward id(s): {', '.join(unknown)}")
+        return [str(ward_id).strip() for ward_id in ward_ids]
+    if district is None:
+        return list(registry.wards)
+    wanted = district.strip().lower()
+    names = sorted({ward["district"] for ward in registry.wards.values() if ward["district"]})
+    # Accept both the map's names ("North West") and the GeoJSON's ("North West Delhi").
+    match = next((name for name in names if wanted in {name.lower(), f"{name.lower()} delhi"}), None)
+    if match is None:
+        raise SystemExit(f"Unknown district {district!r}. Known districts: {', '.join(names)}")
+    return [ward_id for ward_id, ward in registry.wards.items() if ward["district"] == match]
+
+def _truncate_partial_line(path: Path) -> None:
+    # A crash can leave half a record at the end of the file; drop it so appends start clean.
+    with open(path, "rb+") as handle:
+        data = handle.read()
+        if data and not data.endswith(b"\n"):
+            handle.truncate(data.rfind(b"\n") + 1)
+
+def read_records(path: Path, fmt: str) -> Dict[str, Dict[str, Any]]:
+    """The records (NDJSON objects or CSV rows) of an output file by ward id; unreadable lines are skipped."""
+    records: Dict[str, Dict[str, Any]] = {}
+    with open(path, newline="", encoding="utf-8") as handle:
+        if fmt == "csv":
+            for row in csv.DictReader(handle):
+                if row.get("ward_id"):
+                    records[row["ward_id"]] = row
+        else:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                    records[str(record["ward_id"])] = record
+                except (ValueError, KeyError, TypeError):
+                    continue
+    return records
+
+def completed_wards(path: Path, fmt: str) -> Set[str]:
+    """Ward ids already present in an existing output file."""
+    if not path.exists():
+        return set()
+    _truncate_partial_line(path)
+    return set(read_records(path, fmt))
+
+class ResultWriter:
+    """Appends one record per ward and makes it durable before the next one."""
+
+    def __init__(self, path: Path, fmt: str):
+        self.fmt = fmt
+        new_file = not path.exists() or path.stat().st_size == 0
+        fieldnames = CSV_FIELDS
+        if fmt == "csv" and not new_file:
+            # Keep the columns of a file being resumed, even one written before columns were added.
+            with open(path, newline="", encoding="utf-8") as existing:
+                fieldnames = next(csv.reader(existing), CSV_FIELDS)
+        self.handle = open(path, "a", newline="", encoding="utf-8")
+        self.csv = csv.DictWriter(self.handle, fieldnames=fieldnames, extrasaction="ignore") if fmt == "csv" else None
+        if self.csv is not None and new_file:
+            self.csv.writeheader()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.csv is not None:
+            greenery = record["greenery"] or {}
+            self.csv.writerow({
+                "ward_id": record["ward_id"],
+                "name": record["name"],
+                "district": record["district"],
+                "population": record["population"],
+                "area_sq_km": record["area_sq_km"],
+                "greenery_score": greenery.get("greenery_score"),
+                "greenery_summary": greenery.get("greenery_summary"),
+                "population_context": greenery.get("population_context"),
+                "observations": "; ".join(str(item) for item in greenery.get("observations") or []),
+                "trees": " | ".join(record["trees"]),
+                "image_token": record["image_token"],
+                "image_error": record["image_error"],
+                "image_bytes_saved": (record["image_stats"] or {}).get("bytes_saved"),
+                "total_ms": record["stage_timings"].get("total"),
+                "analyzed_at": record["analyzed_at"],
+                "input_fingerprint": record["input_fingerprint"],
+                "carried_forward": record["carried_forward"],
+            })
+            self._flush()
+        else:
+            self._emit(record)
+
+    def carry(self, previous: Dict[str, Any]) -> None:
+        """Write a record (NDJSON object or CSV row) from an earlier output file again, marked as carried forward."""
+        self._emit({**previous, "carried_forward": True})
+
+    def _emit(self, row: Dict[str, Any]) -> None:
+        if self.csv is not None:
+            self.csv.writerow(row)
+        else:
+            self.handle.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._flush()
+
+    def _flush(self) -> None:
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def close(self) -> None:
+        self.handle.close()
+
+async def ward_inputs(registry, ward_id: str, fast: bool, fetch: bool = True) -> Tuple[str, bool]:
+    """``(input fingerprint, static map was already stored)`` for a ward.
+
+    A static map missing from the image store is fetched (and stored, so the
+    analysis that may follow reads it from there); with ``fetch=False`` it is left
+    out and the fingerprint's static map part is ``none``.
+    """
+    metadata = registry.analysis_metadata(ward_id)
+    static_map = None
+    stored = False
+    try:
+        static_map = await asyncio.to_thread(utils.cached_static_map, metadata)
+        stored = static_map is not None
+        if static_map is None and fetch:
+            static_map = await utils.fetch_static_map_image_async(metadata)
+    except Exception as exc:
+        # The analysis falls back to the metadata-only prompt the same way.
+        print(f"{ward_id}: static map unavailable ({exc})", file=sys.stderr, flush=True)
+    return pipeline.input_fingerprint(static_map, utils.build_ai_metadata(metadata), fast), stored
+
+async def plan_wards(
+    registry, ward_ids: List[str], previous: Dict[str, Dict[str, Any]], workers: int, fast: bool, fetch_maps: bool = True,
+    ward_budget: Optional[float] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Fingerprint each ward's inputs and compare them with its ``previous`` record.
+
+    Returns ``{ward_id: {"fingerprint", "changed", "map_stored"}}``; ``changed`` lists the
+    inputs that differ (``["new"]`` without a previous record) and is empty when the
+    previous record can be carried forward. With ``fetch_maps=False`` (dry runs) no
+    static map is fetched: a ward whose map is not stored is compared on its other
+    inputs and listed as ``MAP_NOT_CACHED``. Each ward's map fetch is bounded by ``ward_budget``.
+    """
+    slots = asyncio.Semaphore(max(1, workers))
+    plan: Dict[str, Dict[str, Any]] = {}
+
+    async def check(ward_id: str) -> None:
+        async with slots:
+            with resilience.budget(ward_budget):
+                fingerprint, stored = await ward_inputs(registry, ward_id, fast, fetch_maps)
+        record = previous.get(ward_id)
+        changed = ["new"] if record is None else pipeline.changed_inputs(record.get("input_fingerprint"), fingerprint)
+        if not stored and not fetch_maps:
+            changed = [reason for reason in changed if reason != "static_map"] + [MAP_NOT_CACHED]
+        plan[ward_id] = {"fingerprint": fingerprint, "changed": changed, "map_stored": stored}
+
+    await asyncio.gather(*(check(ward_id) for ward_id in ward_ids))
+    return {ward_id: plan[ward_id] for ward_id in ward_ids}
+
+def plan_report(registry, plan: Dict[str, Dict[str, Any]], config: Dict[str, Any], fast: bool, maps_fetched: bool = True) -> List[str]:
+    """Lines describing which wards would be recomputed, why, and the upstream calls that takes."""
+    rerun = [ward_id for ward_id, entry in plan.items() if entry["changed"]]
+    reasons: Dict[str, int] = {}
+    for ward_id in rerun:
+        for reason in plan[ward_id]["changed"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    missing = sum(1 for entry in plan.values() if not entry["map_stored"])
+    lines = [f"{ward_id} {registry.get(ward_id)['name']}: {', '.join(plan[ward_id]['changed'])}" for ward_id in rerun]
+    lines.append(
+        f"{len(plan)} wards checked: {len(plan) - len(rerun)} unchanged, {len(rerun)} to recompute"
+        + (f" ({', '.join(f'{reason} {count}' for reason, count in sorted(reasons.items()))})" if reasons else "")
+    )
+    if not maps_fetched:
+        lines.append(f"static maps not in the image store: {missing}, to be fetched when their wards are analyzed")
+    else:
+        lines.append(f"static maps fetched to fingerprint: {missing} ({len(plan) - missing} read from the image store)")
+    # Either way each missing map is fetched once; the analysis reads it from the image store afterwards.
+    calls = {"gemini": 0 if fast else len(rerun), "perplexity": len(rerun), "static_maps": missing}
+    for provider in PROVIDERS:
+        rpm = float(config.get(f"{provider.upper()}_RPM", 0) or 0)
+        pace = f", at least {calls[provider] / rpm:.1f} min at {rpm:g}/min" if rpm and calls[provider] else ""
+        lines.append(f"  {provider:<12} {calls[provider]:>4} calls{pace}")
+    lines.append("Upper bounds: answers already in the AI cache cost nothing unless --refresh is given.")
+    return lines
+
+async def analyze_one(registry, ward_id: str, config: Dict[str, Any], ai_cache, refresh: bool, fingerprint: Optional[str] = None) -> Dict[str, Any]:
+    ward = registry.get(ward_id)
+    fast = config.get("GREENERY_FAST_MODE", False)
+    if fingerprint is None:
+        fingerprint, _ = await ward_inputs(registry, ward_id, fast)
+    result = await pipeline.analyze_ward_async(
+        registry.analysis_metadata(ward_id), None, None, None, config, ai_cache=ai_cache, bypass_cache=refresh, fast=fast,
+    )
+    return {
+        "ward_id": ward_id,
+        "name": ward["name"],
+        "district": ward["district"],
+        "population": ward["population"],
+        "area_sq_km": ward["area_sq_km"],
+        "greenery": result["greenery"],
+        "trees": result["trees"],
+        "image_token": result["image_token"],
+        "image_error": result["image_error"],
+        "image_stats": result["image_stats"],
+        "stage_timings": result["stage_timings"],
+        "analyzed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "input_fingerprint": fingerprint,
+        "carried_forward": False,
+    }
+
+async def run_batch(registry, ward_ids: List[str], writer: ResultWriter, workers: int, config: Dict[str, Any], ai_cache, refresh: bool, fingerprints: Optional[Dict[str, str]] = None) -> List[str]:
+    """Analyze ``ward_ids`` with at most ``workers`` wards in flight; returns the ids that failed.
+
+    ``fingerprints`` holds input fingerprints already computed by ``plan_wards``.
+    """
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    for ward_id in ward_ids:
+        queue.put_nowait(ward_id)
+    failed: List[str] = []
+    finished = 0
+
+    async def worker() -> None:
+        nonlocal finished
+        while True:
+            try:
+                ward_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                # Without a budget a starved quota would make the ward wait for its tokens indefinitely.
+                with resilience.budget(config.get("BATCH_WARD_BUDGET_SECONDS")):
+                    record = await analyze_one(registry, ward_id, config, ai_cache, refresh, (fingerprints or {}).get(ward_id))
+            except resilience.DeadlineExceeded as exc:
+                failed.append(ward_id)
+                status = f"failed, over the ward budget: {exc}"
+            except Exception as exc:
+                failed.append(ward_id)
+                status = f"failed: {exc}"
+            else:
+                await asyncio.to_thread(writer.write, record)
+                status = "ok"
+            finished += 1
+            print(f"[{finished}/{len(ward_ids)}] {ward_id} {registry.get(ward_id)['name']}: {status} "
+                  f"({time.perf_counter() - started:.1f}s)", file=sys.stderr, flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(ward_ids))))))
+    return failed
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Batch greenery and tree analysis for Delhi wards.")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--district", help='District name, e.g. "North West" or "North West Delhi"')
+    scope.add_argument("--all", action="store_true", help="Analyze every ward")
+    scope.add_argument("--ward", action="append", dest="wards", help="Ward id (repeatable)")
+    parser.add_argument("--output", type=Path, help="Output file (.ndjson or .csv); not needed with --dry-run")
+    parser.add_argument("--format", choices=("ndjson", "csv"), help="Defaults to the output file extension")
+    parser.add_argument("--workers", type=int, default=8, help="Wards analyzed concurrently (default 8)")
+    parser.add_argument("--gemini-rpm", type=float, help="Gemini requests per minute across all processes (overrides GEMINI_RPM)")
+    parser.add_argument("--perplexity-rpm", type=float, help="Perplexity requests per minute across all processes (overrides PERPLEXITY_RPM)")
+    parser.add_argument("--maps-rpm", type=float, help="Static Maps requests per minute across all processes (overrides STATIC_MAPS_RPM)")
+    parser.add_argument("--ward-budget", type=float, help="Seconds one ward may take, quota waits included (overrides BATCH_WARD_BUDGET_SECONDS; 0 = none)")
+    parser.add_argument("--resume", action="store_true", help="Skip wards already in the output file")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached AI outputs")
+    parser.add_argument("--fast", action="store_true", help="Score greenery locally from the satellite image instead of calling Gemini")
+    parser.add_argument("--incremental", type=Path, metavar="PREVIOUS", help="Carry records forward from this earlier output file for wards whose inputs have not changed")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which wards would be recomputed and the upstream calls needed")
+    args = parser.parse_args(argv)
+
+    if args.output is None and not args.dry_run:
+        parser.error("--output is required unless --dry-run is given")
+    reference = args.output or args.incremental
+    fmt = args.format or ("csv" if reference is not None and reference.suffix.lower() == ".csv" else "ndjson")
+    if args.incremental is not None:
+        if not args.incremental.exists():
+            parser.error(f"{args.incremental} does not exist")
+        if ("csv" if args.incremental.suffix.lower() == ".csv" else "ndjson") != fmt:
+            parser.error("--incremental needs a previous file in the same format as --output")
+    if not args.dry_run and args.output.exists() and args.output.stat().st_size and not args.resume:
+        parser.error(f"{args.output} already exists; pass --resume to continue it or choose another file")
+
+    # Only the loop and the stores are needed; do not start this process's job workers.
+    os.environ["JOB_WORKER_THREADS"] = "0"
+    from app import app
+
+    overrides = {
+        "GEMINI_RPM": args.gemini_rpm, "PERPLEXITY_RPM": args.perplexity_rpm, "STATIC_MAPS_RPM": args.maps_rpm,
+        "GREENERY_FAST_MODE": True if args.fast else None, "BATCH_WARD_BUDGET_SECONDS": args.ward_budget,
+    }
+    app.config.update({key: value for key, value in overrides.items() if value is not None})
+    aio.configure(app.config)
+    ratelimit.configure(app.config, app.instance_path)
+
+    # Bulk work: leave the interactive share of every quota and admission slot to users.
+    with app.app_context(), ratelimit.priority(ratelimit.BACKGROUND):
+        registry = wards.get_ward_registry()
+        selected = select_wards(registry, args.district, args.wards or [])
+        done = completed_wards(args.output, fmt) if args.resume and args.output is not None else set()
+        pending = [ward_id for ward_id in selected if ward_id not in done]
+        print(f"{len(selected)} wards selected, {len(selected) - len(pending)} already done, {len(pending)} to analyze",
+              file=sys.stderr, flush=True)
+        if not pending:
+            return 0
+        previous: Dict[str, Dict[str, Any]] = {}
+        plan = None
+        if args.incremental is not None or args.dry_run:
+            previous = read_records(args.incremental, fmt) if args.incremental is not None else {}
+            fast = app.config.get("GREENERY_FAST_MODE", False)
+            plan = aio.run(resilience.bind(pipeline.in_app_context(app, plan_wards(
+                registry, pending, previous, args.workers, fast, fetch_maps=not args.dry_run,
+                ward_budget=app.config.get("BATCH_WARD_BUDGET_SECONDS"),
+            ))))
+            print("\n".join(plan_report(registry, plan, app.config, fast, maps_fetched=not args.dry_run)), file=sys.stdout if args.dry_run else sys.stderr, flush=True)
+            if args.dry_run:
+                return 0
+        writer = ResultWriter(args.output, fmt)
+        try:
+            if plan is not None:
+                for ward_id in pending:
+                    if not plan[ward_id]["changed"]:
+                        writer.carry(previous[ward_id])
+                pending = [ward_id for ward_id in pending if plan[ward_id]["changed"]]
+            failed = aio.run(resilience.bind(pipeline.in_app_context(app, run_batch(
+                registry, pending, writer, args.workers, app.config, cache.get_ai_cache(), args.refresh,
+                {ward_id: entry["fingerprint"] for ward_id, entry in (plan or {}).items()},
+            ))))
+        finally:
+            writer.close()
+
+    if failed:
+        print(f"{len(failed)} ward(s) failed: {', '.join(failed)}. Re-run with --resume to retry them.", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
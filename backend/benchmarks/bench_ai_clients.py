@@ -0,0 +1,90 @@
+"""Measure worker boot time and per-call Gemini client overhead, with the
+Gemini SDK imported at module load and building a client per call (as before)
+against the lazy per-process registry in ``ai_clients``.
+
+Boot is timed in fresh interpreters: ``import app`` (which runs ``create_app``)
+with and without the SDK import in front of it. Per-call overhead is the client
+setup each Gemini call used to do (``genai.configure`` + ``GenerativeModel`` +
+its transport client) against a registry lookup. No request leaves the machine.
+
+Run from ``backend/``::
+
+    python benchmarks/bench_ai_clients.py [--boots 5] [--calls 200] [--transport grpc|rest]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+import ai_clients  # noqa: E402
+import ai_services  # noqa: E402
+
+BOOT_SNIPPET = """
+import time, warnings
+warnings.filterwarnings("ignore")
+started = time.perf_counter()
+{eager}
+import app
+print((time.perf_counter() - started) * 1000)
+"""
+
+def boot_ms(eager: bool, env: dict) -> float:
+    code = BOOT_SNIPPET.format(eager="import google.generativeai" if eager else "")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def per_call_us(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boots", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--transport", choices=("grpc", "rest"), default="grpc")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as instance:
+        env = {
+            **os.environ, "INSTANCE_PATH": instance, "JOB_WORKER_THREADS": "0", "IMAGE_STORE_SWEEP_INTERVAL_SECONDS": "0",
+            "GEMINI_API_KEY": "bench", "PERPLEXITY_API_KEY": "bench", "GOOGLE_MAPS_API_KEY": "bench",
+        }
+        boot_ms(False, env)  # build static assets and topology caches once
+        eager = [boot_ms(True, env) for _ in range(args.boots)]
+        lazy = [boot_ms(False, env) for _ in range(args.boots)]
+    print(f"worker boot (import app), median of {args.boots}:")
+    print(f"  SDK imported at load  {statistics.median(eager):8.0f} ms")
+    print(f"  SDK imported lazily   {statistics.median(lazy):8.0f} ms")
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+
+    options = {"transport": "rest", "client_options": {"api_endpoint": "http://127.0.0.1:9"}} if args.transport == "rest" else {}
+    ai_clients.configure({"GEMINI_BASE_URL": "http://127.0.0.1:9" if args.transport == "rest" else ""})
+
+    def per_call_client():
+        genai.configure(api_key="bench", **options)
+        model = genai.GenerativeModel(model_name=ai_services.GEMINI_MODEL)
+        model._client = genai_client.get_default_generative_client()
+
+    started = time.perf_counter()
+    ai_clients.get_gemini_model("bench", ai_services.GEMINI_MODEL)
+    first_ms = (time.perf_counter() - started) * 1000
+    print(f"Gemini client setup per call ({args.transport}), mean of {args.calls}:")
+    print(f"  configure + new model {per_call_us(per_call_client, args.calls):8.1f} us")
+    print(f"  registry, first use   {first_ms * 1000:8.1f} us")
+    print(f"  registry, reused      {per_call_us(lambda: ai_clients.get_gemini_model('bench', ai_services.GEMINI_MODEL), args.calls):8.1f} us")
+
+if __name__ == "__main__":
+    main()
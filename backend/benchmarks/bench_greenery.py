@@ -0,0 +1,150 @@
+"""Time and check the local greenery scorer (``vegetation``) on every ward's satellite image.
+
+Each ward's static map is read from the image store in ``--instance`` (where
+``/analyze`` and ``batch.py`` cache them). Wards without a cached map get a
+synthetic one instead: a field of vegetation and built-up patches with a known
+vegetation share, drawn over with the ward fill and boundary the way Static
+Maps renders them, so the scorer's error can be measured too. Every image goes
+through the same steps as an analysis: re-encoded for Gemini by ``image_prep``,
+then scored inside the ward. A per-pixel Python scorer is timed on a few wards
+for comparison. No request leaves the machine.
+
+Run from ``backend/``::
+
+    python benchmarks/bench_greenery.py [--instance instance] [--naive 3]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from flask import Flask
+from PIL import Image, ImageDraw
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+import geometry  # noqa: E402
+import image_prep  # noqa: E402
+import image_store  # noqa: E402
+import utils  # noqa: E402
+import vegetation  # noqa: E402
+import wards  # noqa: E402
+
+SIZE = vegetation.STATIC_MAP_SIZE * vegetation.STATIC_MAP_SCALE
+VEGETATION_RGB = (70, 95, 55)
+BUILT_UP_RGB = (150, 140, 125)
+
+def synthetic_map(metadata, view, share: float, rng) -> "tuple[bytes, float]":
+    """A Static Maps-like PNG of the ward with about ``share`` vegetation; returns ``(png, true share inside the ward)``."""
+    noise = Image.fromarray((rng.random((40, 40)) * 255).astype(np.uint8)).resize((SIZE, SIZE), Image.BICUBIC)
+    field = np.asarray(noise, dtype=float)
+    is_vegetation = field < np.quantile(field, share)
+    pixels = np.where(is_vegetation[..., None], VEGETATION_RGB, BUILT_UP_RGB) + rng.normal(0, 8, (SIZE, SIZE, 3))
+    inside = vegetation.ward_mask(metadata["ward_geojson"], view, SIZE, SIZE)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGBA")
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    lat, lng, zoom = view
+    centre = vegetation._world_pixels(np.array([[lng, lat]]), zoom)[0]
+    fill = tuple(int(v) for v in vegetation.FILL_RGB) + (round(vegetation.FILL_ALPHA * 255),)
+    for ring in geometry.outer_rings(metadata["ward_geojson"]):
+        points = (vegetation._world_pixels(ring, zoom) - centre) * vegetation.STATIC_MAP_SCALE + SIZE / 2
+        draw.polygon([tuple(p) for p in points], fill=fill, outline=(0x00, 0x44, 0xFF, 255), width=3 * vegetation.STATIC_MAP_SCALE)
+    buffer = io.BytesIO()
+    Image.alpha_composite(image, overlay).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue(), float(is_vegetation[inside].mean())
+
+def naive_score(image_bytes: bytes, metadata, view) -> float:
+    """Per-pixel Python: point-in-polygon, fill removal and thresholds one pixel at a time.
+
+    It keeps the rim and boundary-stroke pixels ``vegetation`` drops, so its ratio differs slightly.
+    """
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    image.thumbnail((vegetation.MAX_EDGE, vegetation.MAX_EDGE))
+    width, height = image.size
+    lat, lng, zoom = view
+    centre = vegetation._world_pixels(np.array([[lng, lat]]), zoom)[0]
+    rings = [
+        ((vegetation._world_pixels(ring, zoom) - centre) * width / vegetation.STATIC_MAP_SIZE + width / 2).tolist()
+        for ring in geometry.outer_rings(metadata["ward_geojson"])
+    ]
+    alpha, fill = vegetation.FILL_ALPHA, vegetation.FILL_RGB.tolist()
+    pixels = image.load()
+    total = green = 0
+    for y in range(height):
+        for x in range(width):
+            inside = sum(wards._point_in_ring(x + 0.5, y + 0.5, ring) for ring in rings) % 2 == 1
+            if not inside:
+                continue
+            r, g, b = ((pixels[x, y][i] - alpha * fill[i]) / (1 - alpha) for i in range(3))
+            total += 1
+            brightest, darkest = max(r, g, b), min(r, g, b)
+            if (2 * g - r - b > vegetation.EXG_THRESHOLD * (r + g + b) and g >= r and g >= b
+                    and brightest - darkest > vegetation.MIN_SATURATION * brightest and brightest > vegetation.MIN_VALUE * 255):
+                green += 1
+    return green / total if total else 0.0
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instance", type=Path, default=BACKEND / "instance", help="Instance folder holding analysis_images/")
+    parser.add_argument("--naive", type=int, default=3, help="Wards to also score with the per-pixel Python scorer")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Just enough of the app for utils to build the same static map request (and cache alias) as /analyze.
+    app = Flask("bench_greenery", instance_path=str(args.instance.resolve()))
+    app.config.update(
+        GOOGLE_MAPS_API_KEY="benchmark",
+        STATIC_MAPS_URL=os.getenv("STATIC_MAPS_URL", "https://maps.googleapis.com/maps/api/staticmap"),
+        STATIC_MAP_URL_MAX_LENGTH=int(os.getenv("STATIC_MAP_URL_MAX_LENGTH", "16384")),
+    )
+    app.logger.disabled = True
+    registry = wards.WardRegistry()
+    rng = np.random.default_rng(args.seed)
+    prep_ms, score_ms, errors, naive = [], [], [], []
+    cached = 0
+    with app.app_context():
+        store = image_store.get_image_store() if (args.instance / "analysis_images").exists() else None
+        for ward_id in registry.wards:
+            metadata = registry.analysis_metadata(ward_id)
+            view = utils.static_map_view(metadata)
+            _, _, alias = utils._static_map_request(metadata)
+            png = store.get_by_alias(alias) if store is not None else None
+            truth = None
+            if png is None:
+                png, truth = synthetic_map(metadata, view, rng.uniform(0.05, 0.6), rng)
+            else:
+                cached += 1
+
+            started = time.perf_counter()
+            jpeg, _, _ = image_prep.preprocess(io.BytesIO(png), len(png))
+            prep_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            result = vegetation.score_image(jpeg, metadata["ward_geojson"], view)
+            score_ms.append((time.perf_counter() - started) * 1000)
+            if truth is not None:
+                errors.append(result["vegetation_ratio"] - truth)
+            if len(naive) < args.naive:
+                started = time.perf_counter()
+                naive_ratio = naive_score(jpeg, metadata, view)
+                naive.append(((time.perf_counter() - started) * 1000, abs(naive_ratio - result["vegetation_ratio"])))
+
+    print(f"wards                   {len(score_ms)} ({cached} cached static maps, {len(score_ms) - cached} synthetic)")
+    print(f"image_prep (for Gemini) p50 {statistics.median(prep_ms):7.1f} ms   p95 {percentile(prep_ms, 95):7.1f} ms")
+    print(f"local score             p50 {statistics.median(score_ms):7.2f} ms   p95 {percentile(score_ms, 95):7.2f} ms   max {max(score_ms):7.2f} ms")
+    if naive:
+        print(f"per-pixel Python        mean {statistics.mean(ms for ms, _ in naive):7.0f} ms over {len(naive)} wards "
+              f"(largest ratio difference {max(diff for _, diff in naive):.4f})")
+    if errors:
+        print(f"synthetic error         mean {statistics.mean(errors) * 100:+.2f} points, "
+              f"max |error| {max(abs(e) for e in errors) * 100:.2f} points (vegetation share, 0-100)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Compare the stride-based ``utils._simplify_path`` with the Douglas–Peucker engine in
+``geometry`` on every ward in ``js/delhi_wards.json``.
+
+Most wards fit the default budget unsimplified, so the wards are also run at a
+tight budget, and synthetic dense rings (jittered circles with thousands of
+vertices) at the default one. Wherever Douglas–Peucker simplifies, the boundary
+must stay within its tolerance of the original; the run exits non-zero if not.
+
+Run from ``backend/``::
+
+    python benchmarks/bench_simplify.py [--budget 15000] [--tight-budget 400]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from urllib.parse import quote_plus
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import geometry  # noqa: E402
+from utils import _simplify_path  # noqa: E402
+
+WARDS_FILE = Path(__file__).resolve().parent.parent.parent / "js" / "delhi_wards.json"
+
+def max_deviation_m(original: np.ndarray, simplified: np.ndarray) -> float:
+    """Largest distance (m) from an original vertex to the simplified boundary."""
+    lat0 = np.radians(original[:, 1].mean())
+    scale = np.array([geometry.METERS_PER_DEGREE_LNG * np.cos(lat0), geometry.METERS_PER_DEGREE_LAT])
+    points = original * scale
+    simplified = simplified * scale
+    a, b = simplified[:-1], simplified[1:]
+    ab = b - a
+    length_sq = np.maximum((ab * ab).sum(axis=1), 1e-12)
+    t = np.clip(((points[:, None, :] - a[None]) * ab[None]).sum(axis=2) / length_sq, 0, 1)
+    nearest = a[None] + t[..., None] * ab[None]
+    return float(np.sqrt(((points[:, None, :] - nearest) ** 2).sum(axis=2)).min(axis=1).max())
+
+def stride_paths(rings):
+    # The previous implementation: every Nth vertex of the first ring only.
+    simplified = _simplify_path(rings[0].tolist())
+    if simplified[0] != simplified[-1]:
+        simplified = simplified + [simplified[0]]
+    path = geometry.STATIC_MAP_PATH_STYLE + "|".join(f"{lat},{lng}" for lng, lat in simplified)
+    return [path], [np.asarray(simplified)]
+
+def dp_paths(geometry_json, rings, budget):
+    paths, tolerance = geometry.fit_static_map_paths(geometry_json, budget)
+    importances = [geometry.dp_importance(geometry.to_meters(ring)) for ring in rings]
+    kept = [ring[geometry._keep_mask(imp, tolerance)] for ring, imp in zip(rings, importances)]
+    return paths, kept, tolerance
+
+def dense_ring(rng, vertices: int, radius_m: float = 1500.0, jitter_m: float = 40.0):
+    """A closed Polygon: a circle around central Delhi with ``vertices`` radially jittered points."""
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radii = radius_m + rng.normal(0, jitter_m, vertices)
+    lat0 = 28.61
+    lng = 77.21 + radii * np.cos(angles) / (geometry.METERS_PER_DEGREE_LNG * np.cos(np.radians(lat0)))
+    lat = lat0 + radii * np.sin(angles) / geometry.METERS_PER_DEGREE_LAT
+    ring = np.column_stack((lng, lat)).round(6).tolist()
+    return {"type": "Polygon", "coordinates": [ring + ring[:1]]}
+
+def compare(label: str, geometries, budget: int) -> int:
+    """Print the stride vs Douglas–Peucker table; return how many shapes strayed past their tolerance."""
+    rows = {"stride": [], "douglas-peucker": []}
+    tolerances = []
+    for geometry_json in geometries:
+        rings = geometry.outer_rings(geometry_json)
+        if not rings:
+            continue
+        for name in rows:
+            started = time.perf_counter()
+            if name == "stride":
+                paths, kept = stride_paths(rings)
+            else:
+                paths, kept, tolerance = dp_paths(geometry_json, rings, budget)
+            elapsed = time.perf_counter() - started
+            url_chars = sum(len("&path=") + len(quote_plus(p)) for p in paths)
+            covered = sum(len(ring) for ring in rings[: len(kept)])
+            deviation = max(max_deviation_m(ring, simplified) for ring, simplified in zip(rings, kept))
+            rows[name].append((elapsed, sum(len(k) for k in kept), url_chars, deviation, covered / sum(len(r) for r in rings)))
+        tolerances.append(tolerance)
+
+    print(f"{label}: {len(rows['stride'])} shapes, path budget {budget} chars\n")
+    print(f"{'method':<16}{'ms/shape':>9}{'vertices':>10}{'url chars p50/max':>20}{'max dev m p50/p95/max':>26}{'polygons':>10}")
+    for name, data in rows.items():
+        arr = np.asarray(data)
+        dev = arr[:, 3]
+        print(
+            f"{name:<16}{arr[:, 0].mean() * 1000:>9.2f}{arr[:, 1].mean():>10.0f}"
+            f"{np.median(arr[:, 2]):>12.0f}/{arr[:, 2].max():<7.0f}"
+            f"{np.median(dev):>10.1f}/{np.percentile(dev, 95):.1f}/{dev.max():<8.1f}"
+            f"{arr[:, 4].mean() * 100:>8.0f}%"
+        )
+    dp = np.asarray(rows["douglas-peucker"])
+    tolerances = np.asarray(tolerances)
+    simplified = tolerances > 0
+    # 1 cm of slack for float error in the projection.
+    strayed = int(np.count_nonzero(dp[:, 3] > tolerances + 0.01))
+    print(f"\ndouglas-peucker shapes over budget: {int(np.count_nonzero(dp[:, 2] > budget))}")
+    if simplified.any():
+        print(f"douglas-peucker simplified {np.count_nonzero(simplified)} shapes, tolerance p50 "
+              f"{np.median(tolerances[simplified]):.1f} m / max {tolerances.max():.1f} m, "
+              f"max deviation / tolerance {(dp[simplified, 3] / tolerances[simplified]).max():.2f}")
+    print(f"douglas-peucker shapes past their tolerance: {strayed}\n")
+    return strayed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=15000, help="characters available for path parameters")
+    parser.add_argument("--tight-budget", type=int, default=400, help="a budget small enough that wards must be simplified")
+    parser.add_argument("--dense", type=int, default=20, help="synthetic dense rings to add")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    wards = [feature["geometry"] for feature in json.loads(WARDS_FILE.read_text(encoding="utf-8"))["features"]]
+    rng = np.random.default_rng(args.seed)
+    dense = [dense_ring(rng, int(rng.integers(4000, 8000))) for _ in range(args.dense)]
+    strayed = compare("wards", wards, args.budget)
+    strayed += compare("wards", wards, args.tight_budget)
+    if dense:
+        strayed += compare("dense rings", dense, args.budget)
+    if strayed:
+        sys.exit(f"{strayed} simplified boundaries deviate from the original by more than their tolerance")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Point-to-ward and viewport lookup throughput of ``spatial_index`` on the bundled wards.
+
+Run from ``backend/``::
+
+    python benchmarks/bench_spatial_index.py [--points 10000]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import spatial_index  # noqa: E402
+import wards  # noqa: E402
+
+def naive_locate(registry, lat: float, lng: float):
+    for ward_id, ward in registry.wards.items():
+        rings = spatial_index._polygon_rings(ward["geometry"])
+        inside = False
+        for ring in rings:
+            if wards._point_in_ring(lng, lat, ring):
+                inside = not inside
+        if inside:
+            return ward_id
+    return None
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    registry = wards.WardRegistry()
+    registry_s = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as cache_dir:
+        started = time.perf_counter()
+        index = spatial_index.load_or_build(registry, Path(cache_dir))
+        build_s = time.perf_counter() - started
+        started = time.perf_counter()
+        spatial_index.load_or_build(registry, Path(cache_dir))
+        mmap_s = time.perf_counter() - started
+
+        rng = np.random.default_rng(args.seed)
+        x0, y0, x1, y1 = index.poly_bbox[:, 0].min(), index.poly_bbox[:, 1].min(), index.poly_bbox[:, 2].max(), index.poly_bbox[:, 3].max()
+        lats = rng.uniform(y0, y1, args.points)
+        lngs = rng.uniform(x0, x1, args.points)
+
+        batch_s = timed(lambda: index.locate(lats, lngs))
+        single_s = timed(lambda: [index.locate(lats[i:i + 1], lngs[i:i + 1]) for i in range(200)]) / 200
+        viewport_s = timed(lambda: index.intersecting(77.15, 28.58, 77.25, 28.66))
+
+        found = index.locate(lats, lngs)
+        sample = range(min(500, args.points))
+        started = time.perf_counter()
+        expected = [naive_locate(registry, lats[i], lngs[i]) for i in sample]
+        naive_s = (time.perf_counter() - started) / len(sample)
+        mismatches = sum(1 for i, want in zip(sample, expected) if (index.keys[found[i]] if found[i] >= 0 else None) != want)
+
+    print(f"registry parse        {registry_s * 1000:9.1f} ms")
+    print(f"index build + save    {build_s * 1000:9.1f} ms")
+    print(f"index mmap load       {mmap_s * 1000:9.1f} ms")
+    print(f"batch of {args.points:<6}        {batch_s * 1000:9.2f} ms  ({batch_s / args.points * 1e6:.2f} us/point, {np.count_nonzero(found >= 0)} inside a ward)")
+    print(f"single point          {single_s * 1e6:9.1f} us")
+    print(f"viewport query        {viewport_s * 1e6:9.1f} us")
+    print(f"naive python scan     {naive_s * 1e6:9.1f} us/point")
+    print(f"mismatches vs naive   {mismatches} of {len(sample)}")
+
+if __name__ == "__main__":
+    main()
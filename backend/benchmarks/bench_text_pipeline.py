@@ -0,0 +1,109 @@
+"""Time the AI text post-processing in ``text_pipeline`` against the previous
+inline-regex implementation: tree suggestion cleanup and rendering,
+recommendation rendering, and ``parse_numbered_list``.
+
+Run from ``backend/``::
+
+    python benchmarks/bench_text_pipeline.py [--repeat 2000]
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+import markdown2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import text_pipeline  # noqa: E402
+
+PERPLEXITY_ANSWER = "\n".join([
+    "1. **Neem (Azadirachta indica)** — drought tolerant, filters dust along arterial roads [1][3].",
+    "2. **Peepal (Ficus religiosa)** — dense canopy for parks and temple grounds [2] .",
+    "3. **Jamun (Syzygium cumini)** — fruiting shade tree suited to school and colony lanes [4].",
+    "4. **Arjun (Terminalia arjuna)** — tolerates waterlogging near drains [1].",
+    "5. **Amaltas (Cassia fistula)** — ornamental, low water needs, for medians [5][6].",
+])
+
+RECOMMENDATION = (
+    "**Location 1: Vacant DDA plot near the ward's eastern arterial road** The plot sits beside the bus depot. "
+    "**SDG11 requirements:** * walkable from two bus stops * step-free access * shaded waiting areas "
+    "**DDA Rules Compliance** * 3 m front setback * 15% of the plot as green buffer * FAR within the zone cap\n"
+    "**Location 2: Underused community hall compound** Reuse keeps the existing trees. "
+    "**SDG11 requirements:** * inclusive entrances * cycle parking "
+    "**DDA Rules Compliance** * no change of land use needed * rainwater harvesting pit\n"
+    "**Actionable Next Steps:** Commission a site survey of both plots and consult the RWA within 30 days."
+)
+
+# The previous implementation, with patterns passed to ``re`` on every call.
+def old_parse_numbered_list(content):
+    suggestions = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        m = re.match(r"^(?:[-•]\s*)?(\d+)[\.\)]\s*(.+)$", line)
+        if m:
+            suggestions.append(m.group(2).strip())
+            continue
+        m2 = re.match(r"^(?:[-•]\s*)(.+)$", line)
+        if m2:
+            suggestions.append(m2.group(1).strip())
+    return suggestions or [content.strip()]
+
+def old_strip_reference_citations(text):
+    cleaned = re.sub(r"(?:\s*\[\d+\])+", "", text)
+    cleaned = re.sub(r"\s+([,.;:)])", r"\1", cleaned)
+    return re.sub(r"\s{2,}", " ", cleaned).strip()
+
+def old_normalize_tree_bold_markdown(text):
+    line = text.strip()
+    m = re.match(r"^(?:\d+[\.)]\s*)?\*\*([^*()]+?)\s*\(([^)]+)\)\*\*(.*)$", line)
+    if m:
+        return f"**{m.group(1).strip()}** ({m.group(2).strip()}){m.group(3)}"
+    return line
+
+def old_render_markdown_html(text):
+    normalized = re.sub(r"(?<!\n)\s\*\s", "\n* ", text)
+    normalized = re.sub(r"\n\*(?=\s)", "\n\n*", normalized)
+    return markdown2.markdown(normalized, extras=["fenced-code-blocks", "tables", "strike"])
+
+def timed(label, repeat, func):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    per_call_us = (time.perf_counter() - started) / repeat * 1e6
+    print(f"{label:<48} {per_call_us:10.1f} us/call")
+    return per_call_us
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    repeat = args.repeat
+    trees = text_pipeline.parse_numbered_list(PERPLEXITY_ANSWER)
+
+    assert old_parse_numbered_list(PERPLEXITY_ANSWER) == trees
+    assert [old_render_markdown_html(old_normalize_tree_bold_markdown(old_strip_reference_citations(t))) for t in trees] \
+        == text_pipeline.process_trees(trees)[1]
+    assert old_render_markdown_html(RECOMMENDATION) == text_pipeline.render_markdown_html(RECOMMENDATION, memoize=False)
+
+    print(f"parse_numbered_list ({len(trees)} items)")
+    timed("  inline patterns", repeat, lambda: old_parse_numbered_list(PERPLEXITY_ANSWER))
+    timed("  precompiled", repeat, lambda: text_pipeline.parse_numbered_list(PERPLEXITY_ANSWER))
+
+    print(f"tree suggestions: cleanup + markdown ({len(trees)} items, one page view)")
+    timed("  inline patterns, rendered every view", repeat // 10, lambda: [
+        old_render_markdown_html(old_normalize_tree_bold_markdown(old_strip_reference_citations(t))) for t in trees
+    ])
+    timed("  pipeline, first render", repeat // 10, lambda: (
+        text_pipeline._html_memo.clear(), text_pipeline.process_trees(trees)
+    ))
+    timed("  pipeline, memoized", repeat, lambda: text_pipeline.process_trees(trees))
+
+    print(f"recommendations markdown ({len(RECOMMENDATION)} chars)")
+    timed("  rendered every view", repeat // 10, lambda: old_render_markdown_html(RECOMMENDATION))
+    timed("  memoized", repeat, lambda: text_pipeline.render_markdown_html(RECOMMENDATION))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compare the quantized topology served by ``/api/topology`` with the GeoJSON
+files the map used to download (``js/delhi_wards.json`` and ``js/districts.geojson``).
+
+Reports bytes on the wire (raw and gzip) and the time to parse each payload and,
+for the topology, to decode it back to GeoJSON. Decoding here is Python's, which
+tracks the browser's ``JSON.parse`` + ``decodeTopology`` closely enough to rank them.
+
+Run from ``backend/``::
+
+    python benchmarks/bench_topology.py [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import topology  # noqa: E402
+import wards  # noqa: E402
+
+def best_of(repeat, func):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def row(label, body, decode_ms):
+    print(f"{label:<36} {len(body) / 1024:9.1f} KiB {len(gzip.compress(body, 6)) / 1024:9.1f} KiB {decode_ms:9.1f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'payload':<36} {'raw':>13} {'gzip':>13} {'decode':>12}")
+    sources = [(wards.DEFAULT_DATA_DIR / filename).read_bytes() for filename, _ in topology.LAYERS.values()]
+    row("GeoJSON files (current)", b"".join(sources), best_of(args.repeat, lambda: [json.loads(body) for body in sources]))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        started = time.perf_counter()
+        topo = topology.load_or_build(wards.DEFAULT_DATA_DIR, Path(cache_dir))
+        print(f"(topology built in {(time.perf_counter() - started) * 1000:.0f} ms: "
+              f"{len(topo.arcs)} arcs, {sum(len(arc) for arc in topo.arcs)} vertices)")
+    for level in (*topology.ZOOM_LEVELS, topology.FULL_DETAIL):
+        body, _ = topo.encoded(level)
+        label = f"topology, level {level}" if level != topology.FULL_DETAIL else "topology, full detail"
+        row(label, body, best_of(args.repeat, lambda body=body: topology.to_geojson(json.loads(body))))
+    viewport = (77.18, 28.6, 77.26, 28.67)  # central Delhi at about zoom 13
+    body, _ = topo.encoded(topo.level_for_zoom(13), bbox=viewport)
+    row("topology, level 12, one viewport", body, best_of(args.repeat, lambda: topology.to_geojson(json.loads(body))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""Load-test the backend against local stub upstreams: throughput, tail latency
+and worker saturation for ``/analyze``, ``/recommend`` and ``/analysis/latest``.
+
+The driver starts ``stub_upstreams.py`` and the real app under the production
+``gunicorn_config.py`` (with ``INSTANCE_PATH`` and ``PROMETHEUS_MULTIPROC_DIR`` in a
+temporary directory, so nothing under ``instance/`` is touched). Each virtual
+user has its own session and runs one analysis before the measured phases; every
+scenario then runs closed-loop for ``--duration`` seconds:
+
+- ``analyze``: JSON ``POST /analyze`` for a random ward, polled to completion
+  and opened (the job path the map page uses); latency is submit to results page
+- ``recommend``: form ``POST /recommend``
+- ``latest``: ``GET /analysis/latest``
+
+Saturation is sampled from ``/metrics`` during each phase: busy request threads
+over ``workers * threads`` and running jobs over ``workers * JOB_WORKER_THREADS``.
+The AI output cache is off unless ``--ai-cache`` is given, so every call reaches
+the stubs.
+
+Results are written to ``benchmarks/results/<time>-<commit>.json``; ``--compare``
+prints the change against an earlier file (``latest`` picks the newest one).
+
+Run from ``backend/``::
+
+    python benchmarks/loadtest.py --users 32 --duration 30 --workers 2
+    python benchmarks/loadtest.py --compare latest
+"""
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import requests
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import stub_upstreams  # noqa: E402
+
+SCENARIOS = ("analyze", "recommend", "latest")
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+CONSTRUCTION_TYPES = ("community park", "primary health clinic", "bus depot", "public library", "affordable housing block")
+_GAUGE = re.compile(r"^(urbaninfra_http_requests_in_flight|urbaninfra_jobs_running)\s+([0-9.eE+-]+)$", re.MULTILINE)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_until_up(name: str, url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{name} did not come up within {timeout:g}s")
+
+def _stop(process: Optional[subprocess.Popen]) -> None:
+    if process is None or process.poll() is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class VirtualUser:
+    """One browser: its own cookie jar, so its analysis and recommendations stay in its session."""
+
+    def __init__(self, base_url: str, ward_ids: List[str], rng: random.Random, poll_interval: float):
+        self.base_url = base_url
+        self.ward_ids = ward_ids
+        self.rng = rng
+        self.poll_interval = poll_interval
+        self.http = requests.Session()
+
+    def analyze(self) -> bool:
+        response = self.http.post(
+            f"{self.base_url}/analyze", json={"ward_id": self.rng.choice(self.ward_ids)},
+            headers={"Accept": "application/json"}, timeout=600,
+        )
+        if response.status_code == 200:
+            return True
+        if response.status_code != 202:
+            return False
+        status_url = self.base_url + response.json()["status_url"]
+        while True:
+            time.sleep(self.poll_interval)
+            state = self.http.get(status_url, timeout=60).json()
+            if state["status"] == "failed":
+                return False
+            if state["status"] == "done":
+                # Opening the result is what makes it the session's analysis, as in the browser.
+                return self.http.get(self.base_url + state["redirect_url"], timeout=60).status_code == 200
+
+    def recommend(self) -> bool:
+        response = self.http.post(
+            f"{self.base_url}/recommend", data={"construction_type": self.rng.choice(CONSTRUCTION_TYPES)},
+            allow_redirects=False, timeout=600,
+        )
+        # Failures flash a message and redirect home.
+        return response.status_code == 200
+
+    def latest(self) -> bool:
+        return self.http.get(f"{self.base_url}/analysis/latest", allow_redirects=False, timeout=60).status_code == 200
+
+def _sample_saturation(base_url: str, stop: threading.Event, samples: List[Tuple[float, float]]) -> None:
+    while not stop.wait(0.5):
+        try:
+            text = requests.get(f"{base_url}/metrics", timeout=5).text
+        except requests.RequestException:
+            continue
+        gauges = {name: float(value) for name, value in _GAUGE.findall(text)}
+        # The scrape itself is one of the in-flight requests.
+        samples.append((max(0.0, gauges.get("urbaninfra_http_requests_in_flight", 0.0) - 1), gauges.get("urbaninfra_jobs_running", 0.0)))
+
+def run_scenario(name: str, users: List[VirtualUser], duration: float, base_url: str, capacity: Dict[str, int]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(user: VirtualUser) -> None:
+        action = getattr(user, name)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = action()
+            except (requests.RequestException, ValueError, KeyError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    stop = threading.Event()
+    samples: List[Tuple[float, float]] = []
+    sampler = threading.Thread(target=_sample_saturation, args=(base_url, stop, samples), daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+
+    ordered = sorted(latencies)
+    busy_threads = [sample[0] for sample in samples]
+    busy_jobs = [sample[1] for sample in samples]
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 1) if value is not None else None
+
+    def ratio(values: List[float], total: int, reduce) -> Optional[float]:
+        return round(reduce(values) / total, 3) if values and total else None
+
+    return {
+        "requests": len(ordered),
+        "errors": errors[0],
+        "rps": round(len(ordered) / wall, 2),
+        "p50_ms": ms(percentile(ordered, 0.50)),
+        "p95_ms": ms(percentile(ordered, 0.95)),
+        "p99_ms": ms(percentile(ordered, 0.99)),
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "max_ms": ms(ordered[-1]) if ordered else None,
+        "thread_saturation_mean": ratio(busy_threads, capacity["threads"], lambda v: sum(v) / len(v)),
+        "thread_saturation_max": ratio(busy_threads, capacity["threads"], max),
+        "job_saturation_mean": ratio(busy_jobs, capacity["jobs"], lambda v: sum(v) / len(v)),
+        "job_saturation_max": ratio(busy_jobs, capacity["jobs"], max),
+    }
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=BACKEND, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def print_table(result: Dict[str, Any]) -> None:
+    print(f"{'scenario':<10} {'req':>6} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'threads':>8} {'jobs':>6}")
+    for name, row in result["scenarios"].items():
+        cells = [row["p50_ms"], row["p95_ms"], row["p99_ms"]]
+        print(f"{name:<10} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8.2f} "
+              + " ".join(f"{cell:>9.1f}" if cell is not None else f"{'-':>9}" for cell in cells)
+              + f" {_pct(row['thread_saturation_max']):>8} {_pct(row['job_saturation_max']):>6}")
+    print("(threads / jobs: peak share of request threads and job workers busy)")
+
+def _pct(value: Optional[float]) -> str:
+    return f"{value * 100:.0f}%" if value is not None else "-"
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], baseline_name: str) -> None:
+    print(f"\nchange vs {baseline_name} (commit {baseline.get('commit') or '?'}):")
+    for name, row in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if row.get(key) is not None and before.get(key):
+                changes.append(f"{key} {row[key] / before[key] - 1:+.1%}")
+        print(f"  {name:<10} " + ", ".join(changes))
+
+def _baseline_path(value: str, exclude: Optional[Path]) -> Optional[Path]:
+    if value != "latest":
+        return Path(value)
+    candidates = sorted(path for path in RESULTS_DIR.glob("*.json") if path != exclude)
+    return candidates[-1] if candidates else None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of analyze,recommend,latest")
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per scenario")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (the config's default scales with CPUs)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("GUNICORN_THREADS", "32")), help="threads per worker")
+    parser.add_argument("--job-threads", type=int, default=2, help="JOB_WORKER_THREADS per worker")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="job status polling interval")
+    parser.add_argument("--ai-cache", action="store_true", help="leave the AI output cache on")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting, repeatable")
+    parser.add_argument("--compare", metavar="FILE|latest", help="print the change against an earlier result")
+    parser.add_argument("--no-save", action="store_true", help="do not write a result file")
+    stub_upstreams.add_arguments(parser)
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="urbaninfra-loadtest-"))
+    stub_port, app_port = _free_port(), _free_port()
+    stub_url, base_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    stub_args = []
+    for provider in stub_upstreams.PROVIDERS:
+        flag = provider.replace("_", "-")
+        stub_args += [f"--{flag}-latency", getattr(args, f"{provider}_latency"), f"--{flag}-error-rate", str(getattr(args, f"{provider}_error_rate"))]
+    stub_args += ["--error-status", str(args.error_status)] + (["--seed", str(args.seed)] if args.seed is not None else [])
+
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "stub", "PERPLEXITY_API_KEY": "stub", "GOOGLE_MAPS_API_KEY": "stub",
+        "GEMINI_BASE_URL": stub_url,
+        "PERPLEXITY_BASE_URL": f"{stub_url}/perplexity",
+        "STATIC_MAPS_URL": f"{stub_url}/staticmap",
+        "AI_CACHE_ENABLED": "true" if args.ai_cache else "false",
+        "JOB_WORKER_THREADS": str(args.job_threads),
+        "GUNICORN_THREADS": str(args.threads),
+        "INSTANCE_PATH": str(workdir / "instance"),
+        "PROMETHEUS_MULTIPROC_DIR": str(workdir / "prometheus"),
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    stub = server = None
+    try:
+        stub = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve().parent / "stub_upstreams.py"), "--port", str(stub_port), *stub_args],
+            stdout=subprocess.PIPE, text=True,
+        )
+        _wait_until_up("stub server", f"{stub_url}/", stub)
+        with open(workdir / "gunicorn.log", "w") as log:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "-b", f"127.0.0.1:{app_port}", "-w", str(args.workers), "app:app"],
+                cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+        _wait_until_up("gunicorn", f"{base_url}/health", server)
+        ward_ids = [ward["ward_id"] for ward in requests.get(f"{base_url}/api/wards", timeout=30).json()["wards"]]
+        capacity = {"threads": args.workers * args.threads, "jobs": args.workers * args.job_threads}
+
+        rng = random.Random(args.seed)
+        users = [VirtualUser(base_url, ward_ids, random.Random(rng.random()), args.poll_interval) for _ in range(args.users)]
+        print(f"{args.users} users, {args.workers} workers x {args.threads} threads, {args.job_threads} job threads per worker; "
+              f"warming up (one analysis per user)...", flush=True)
+        warmups = [threading.Thread(target=user.analyze) for user in users]
+        for thread in warmups:
+            thread.start()
+        for thread in warmups:
+            thread.join()
+
+        result = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git("rev-parse", "--short", "HEAD"),
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "settings": {
+                "users": args.users, "duration": args.duration, "workers": args.workers, "threads": args.threads,
+                "job_threads": args.job_threads, "ai_cache": args.ai_cache, "env": args.env,
+                "stubs": {provider: {"latency": getattr(args, f"{provider}_latency"), "error_rate": getattr(args, f"{provider}_error_rate")}
+                          for provider in stub_upstreams.PROVIDERS},
+            },
+            "scenarios": {},
+        }
+        for name in scenarios:
+            print(f"running {name} for {args.duration:g}s...", flush=True)
+            result["scenarios"][name] = run_scenario(name, users, args.duration, base_url, capacity)
+    finally:
+        _stop(server)
+        _stop(stub)
+
+    if stub is not None and stub.stdout is not None:
+        lines = stub.stdout.read().strip().splitlines()
+        try:
+            result["upstream_calls"] = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            pass
+    print()
+    print_table(result)
+    saved = None
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        saved = RESULTS_DIR / f"{stamp}-{result['commit'] or 'nogit'}{'-dirty' if result['dirty'] else ''}.json"
+        saved.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"\nsaved {saved.relative_to(BACKEND)} (server log: {workdir / 'gunicorn.log'})")
+    if args.compare:
+        baseline = _baseline_path(args.compare, saved)
+        if baseline is None or not baseline.exists():
+            print(f"\nno baseline result found for {args.compare!r}")
+        else:
+            compare(result, json.loads(baseline.read_text()), baseline.name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Local stand-ins for Gemini, Perplexity and Google Static Maps, so load tests
+spend no API quota.
+
+One threaded HTTP server answers:
+
+- ``POST /v1beta/models/<model>:generateContent`` and ``:streamGenerateContent``
+  in the Gemini REST shape (``GEMINI_BASE_URL=<url>``)
+- ``POST /perplexity/chat/completions`` (``PERPLEXITY_BASE_URL=<url>/perplexity``)
+- ``GET /staticmap``, a 640x640 PNG (``STATIC_MAPS_URL=<url>/staticmap``)
+
+Each provider has its own latency distribution and error rate. Latencies are
+``fixed:SECONDS``, ``uniform:LOW,HIGH`` or ``lognormal:MEDIAN,SIGMA``; a failed
+call answers with ``--error-status`` in the provider's error shape.
+
+Run from ``backend/``::
+
+    python benchmarks/stub_upstreams.py --port 8900 --gemini-latency lognormal:2.5,0.35 --gemini-error-rate 0.01
+
+``benchmarks/loadtest.py`` starts one itself.
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+import numpy as np
+from PIL import Image
+
+PROVIDERS = ("gemini", "perplexity", "static_maps")
+DEFAULT_LATENCY = {
+    "gemini": "lognormal:2.5,0.35",
+    "perplexity": "lognormal:1.5,0.3",
+    "static_maps": "lognormal:0.25,0.3",
+}
+
+GREENERY_JSON = {
+    "greenery_score": 42,
+    "greenery_summary": "Scattered street trees and two small parks; most plots are built up.",
+    "population_context": "Dense housing leaves little open ground per resident.",
+    "observations": ["Tree cover follows the arterial road", "Rooftops dominate the north-east", "One large park in the south"],
+}
+TREES_ANSWER = "\n".join([
+    "1. **Neem** (Azadirachta indica) — drought tolerant and filters road dust along the busier arterial streets.",
+    "2. **Peepal** (Ficus religiosa) — long-lived, dense canopy suited to parks and temple grounds in the ward.",
+    "3. **Jamun** (Syzygium cumini) — fruiting shade tree that suits colony lanes and school compounds nearby.",
+    "4. **Arjun** (Terminalia arjuna) — tolerates seasonal waterlogging near drains and low-lying open plots.",
+    "5. **Amaltas** (Cassia fistula) — ornamental, low water needs, a good fit for road medians and verges.",
+])
+RECOMMENDATION_CHUNKS = [
+    "**Location 1: Vacant plot beside the arterial road** Close to two bus stops. ",
+    "**SDG11 requirements:** * walkable from transit * step-free access * shaded waiting areas ",
+    "**DDA Rules Compliance** * 3 m front setback * 15% green buffer * FAR within the zone cap\n",
+    "**Actionable Next Steps:** Commission a site survey and consult the RWA within 30 days.",
+]
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """``fixed:S``, ``uniform:LO,HI`` or ``lognormal:MEDIAN,SIGMA`` (seconds) as a sampler."""
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = float(np.log(values[0]))
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise argparse.ArgumentTypeError(f"Bad latency spec {spec!r}: use fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+
+def _satellite_png() -> bytes:
+    # Smooth noise upscaled to 640x640 compresses about as well as a real satellite tile.
+    rng = np.random.default_rng(0)
+    low = rng.integers(30, 200, size=(40, 40, 3), dtype=np.uint8)
+    low[..., 1] = np.clip(low[..., 1].astype(int) + 30, 0, 255)
+    image = Image.fromarray(low, "RGB").resize((640, 640), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+class StubState:
+    def __init__(self, latency: Dict[str, str], error_rate: Dict[str, float], error_status: int, seed: Optional[int]):
+        self.samplers = {provider: parse_latency(latency[provider]) for provider in PROVIDERS}
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.png = _satellite_png()
+        self.counts = {provider: {"requests": 0, "errors": 0} for provider in PROVIDERS}
+
+    def draw(self, provider: str):
+        """Return ``(delay_seconds, fail)`` for one call."""
+        with self.lock:
+            delay = self.samplers[provider](self.rng)
+            fail = self.rng.random() < self.error_rate[provider]
+            self.counts[provider]["requests"] += 1
+            self.counts[provider]["errors"] += int(fail)
+        return delay, fail
+
+def _gemini_payload(text: str) -> Dict:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": 600, "candidatesTokenCount": 180, "totalTokenCount": 780},
+    }
+
+def make_handler(state: StubState):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status: int, payload) -> None:
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def _fail(self, provider: str) -> None:
+            status = state.error_status
+            if provider == "gemini":
+                self._send_json(status, {"error": {"code": status, "message": "stub failure", "status": "UNAVAILABLE"}})
+            elif provider == "perplexity":
+                self._send_json(status, {"error": {"message": "stub failure", "type": "server_error", "code": status}})
+            else:
+                self._send(status, b"stub failure", "text/plain")
+
+        def do_GET(self):
+            if not self.path.startswith("/staticmap"):
+                return self._send(404, b"not found", "text/plain")
+            delay, fail = state.draw("static_maps")
+            time.sleep(delay)
+            if fail:
+                return self._fail("static_maps")
+            self._send(200, state.png, "image/png")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path.startswith("/perplexity/chat/completions"):
+                return self._perplexity()
+            if self.path.startswith("/v1beta/models/") and ":generateContent" in self.path:
+                return self._gemini(body)
+            if self.path.startswith("/v1beta/models/") and ":streamGenerateContent" in self.path:
+                return self._gemini_stream()
+            self._send(404, b"not found", "text/plain")
+
+        def _perplexity(self):
+            delay, fail = state.draw("perplexity")
+            time.sleep(delay)
+            if fail:
+                return self._fail("perplexity")
+            self._send_json(200, {
+                "id": "stub", "model": "sonar-pro", "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": TREES_ANSWER}}],
+                "usage": {"prompt_tokens": 220, "completion_tokens": 160, "total_tokens": 380},
+            })
+
+        def _gemini(self, body: bytes):
+            delay, fail = state.draw("gemini")
+            time.sleep(delay)
+            if fail:
+                return self._fail("gemini")
+            if b"greenery_score" in body:
+                text = "```json\n" + json.dumps(GREENERY_JSON, indent=2) + "\n```"
+            else:
+                text = "".join(RECOMMENDATION_CHUNKS)
+            self._send_json(200, _gemini_payload(text))
+
+        def _gemini_stream(self):
+            # The REST transport reads a JSON array of responses; send its elements as
+            # chunks spread over the drawn latency, like tokens arriving.
+            delay, fail = state.draw("gemini")
+            if fail:
+                time.sleep(delay)
+                return self._fail("gemini")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = len(RECOMMENDATION_CHUNKS)
+            for number, text in enumerate(RECOMMENDATION_CHUNKS):
+                time.sleep(delay / pieces)
+                data = ("[" if number == 0 else ",") + json.dumps(_gemini_payload(text)) + ("]" if number == pieces - 1 else "")
+                encoded = data.encode("utf-8")
+                self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Latency and error options, shared with ``loadtest.py``."""
+    for provider in PROVIDERS:
+        flag = provider.replace("_", "-")
+        parser.add_argument(f"--{flag}-latency", default=DEFAULT_LATENCY[provider], type=str,
+                            help=f"{provider} latency (default {DEFAULT_LATENCY[provider]})")
+        parser.add_argument(f"--{flag}-error-rate", default=0.0, type=float, help=f"fraction of {provider} calls that fail")
+    parser.add_argument("--error-status", default=503, type=int, help="HTTP status of failed calls")
+    parser.add_argument("--seed", default=None, type=int)
+
+def state_from_args(args: argparse.Namespace) -> StubState:
+    return StubState(
+        {provider: getattr(args, f"{provider}_latency") for provider in PROVIDERS},
+        {provider: getattr(args, f"{provider}_error_rate") for provider in PROVIDERS},
+        args.error_status,
+        args.seed,
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8900, type=int)
+    add_arguments(parser)
+    args = parser.parse_args()
+    state = state_from_args(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    url = f"http://{args.host}:{server.server_port}"
+    print(f"GEMINI_BASE_URL={url}\nPERPLEXITY_BASE_URL={url}/perplexity\nSTATIC_MAPS_URL={url}/staticmap", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(state.counts))
+
+if __name__ == "__main__":
+    main()
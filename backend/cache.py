@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from flask import current_app, request
+import metrics
+
+class AICache:
+    """Two-tier cache for AI outputs: an in-process LRU in front of a SQLite file.
+
+    The SQLite file lives under ``instance_path`` so every gunicorn worker shares it.
+    Entries expire after ``ttl_seconds`` and the on-disk store is trimmed back to
+    ``max_bytes`` by evicting the least recently used rows.
+    """
+
+    def __init__(self, db_path: Path, ttl_seconds: float = 86400, max_bytes: int = 64 * 1024 * 1024, memory_entries: int = 256):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_bytes = int(max_bytes)
+        self.memory_entries = int(memory_entries)
+        # JSON text, not objects: every hit gets its own copy that callers may change.
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ai_cache_last_access ON ai_cache(last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _memory_get(self, key: str, now: float) -> Tuple[bool, Any]:
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return False, None
+            expires_at, encoded = entry
+            if expires_at <= now:
+                del self._memory[key]
+                return False, None
+            self._memory.move_to_end(key)
+        return True, json.loads(encoded)
+
+    def _memory_set(self, key: str, encoded: str, expires_at: float) -> None:
+        with self._memory_lock:
+            self._memory[key] = (expires_at, encoded)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        found, value = self._memory_get(key, now)
+        if found:
+            self.stats["memory_hits"] += 1
+            metrics.cache_lookup("ai", True)
+            return True, value
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                conn.execute("UPDATE ai_cache SET last_access = ? WHERE key = ?", (now, key))
+                value = json.loads(row[0])
+                self._memory_set(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                metrics.cache_lookup("ai", True)
+                return True, value
+            if row is not None:
+                conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+        self.stats["misses"] += 1
+        metrics.cache_lookup("ai", False)
+        return False, None
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        encoded = json.dumps(value, separators=(",", ":"))
+        self._memory_set(key, encoded, expires_at)
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), expires_at, now),
+            )
+            self.stats["writes"] += 1
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 32:
+                self.prune()
+        except sqlite3.Error:
+            pass
+
+    def prune(self) -> int:
+        """Drop expired rows, then the least recently used ones until under ``max_bytes``."""
+        self._writes_since_prune = 0
+        conn = self._connect()
+        removed = conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_cache").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM ai_cache ORDER BY last_access ASC"):
+                victims.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM ai_cache WHERE key = ?", victims)
+            removed += len(victims)
+        self.stats["evictions"] += removed
+        return removed
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], bypass: bool = False) -> Tuple[Any, bool]:
+        """Return ``(value, hit)``. With ``bypass`` the lookup is skipped but the fresh value is stored."""
+        if not bypass:
+            found, value = self.get(key)
+            if found:
+                return value, True
+        value = compute()
+        self.set(key, value)
+        return value, False
+
+def content_hash(data: Any) -> str:
+    if data is None:
+        return ""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    elif not isinstance(data, (bytes, bytearray)):
+        data = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def make_key(namespace: str, model: str, prompt_version: str, **inputs: Any) -> str:
+    """Build a cache key from the model, the prompt version and content hashes of the inputs."""
+    parts = {"ns": namespace, "model": model, "prompt": prompt_version}
+    parts.update({name: content_hash(value) for name, value in inputs.items()})
+    return content_hash(parts)
+
+_cache: Optional[AICache] = None
+_cache_lock = threading.Lock()
+
+def get_ai_cache() -> Optional[AICache]:
+    """Return the process-wide cache for the current app, or None when disabled."""
+    global _cache
+    config = current_app.config
+    if not config.get("AI_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AICache(
+                    Path(current_app.instance_path) / "ai_cache.sqlite3",
+                    ttl_seconds=config.get("AI_CACHE_TTL_SECONDS", 86400),
+                    max_bytes=config.get("AI_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+                    memory_entries=config.get("AI_CACHE_MEMORY_ENTRIES", 256),
+                )
+    return _cache
+
+def bypass_requested() -> bool:
+    header = current_app.config.get("AI_CACHE_BYPASS_HEADER", "X-Cache-Bypass")
+    return request.headers.get(header, "").strip().lower() in {"1", "true", "yes"}
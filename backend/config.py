@@ -40,4 +40,95 @@ def load_configuration():
         "SECRET_KEY": os.getenv("SECRET_KEY", "dev_secret_key"),
         "MAX_CONTENT_LENGTH": 10 * 1024 * 1024,
         "ALLOWED_EXTENSIONS": {"png", "jpg", "jpeg", "webp"},
+        # Shared per-worker executor used to fan out the Gemini and Perplexity calls: by default two
+        # threads (one per stage) for every request thread and job worker, so stages never queue
+        "AI_EXECUTOR_MAX_WORKERS": int(os.getenv("AI_EXECUTOR_MAX_WORKERS") or 2 * (
+            int(os.getenv("GUNICORN_THREADS", "32")) + int(os.getenv("JOB_WORKER_THREADS", "2"))
+        )),
+        "GREENERY_TIMEOUT_SECONDS": float(os.getenv("GREENERY_TIMEOUT_SECONDS", "120")),
+        "TREES_TIMEOUT_SECONDS": float(os.getenv("TREES_TIMEOUT_SECONDS", "60")),
+        # Two-tier (in-process LRU + SQLite under instance_path) cache for AI outputs
+        "AI_CACHE_ENABLED": os.getenv("AI_CACHE_ENABLED", "true").lower() not in {"0", "false", "no"},
+        "AI_CACHE_TTL_SECONDS": float(os.getenv("AI_CACHE_TTL_SECONDS", str(24 * 3600))),
+        "AI_CACHE_MAX_BYTES": int(os.getenv("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        "AI_CACHE_MEMORY_ENTRIES": int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "256")),
+        "AI_CACHE_BYPASS_HEADER": os.getenv("AI_CACHE_BYPASS_HEADER", "X-Cache-Bypass"),
+        # Content-addressed analysis image store and its background sweeper
+        "IMAGE_STORE_QUOTA_BYTES": int(os.getenv("IMAGE_STORE_QUOTA_BYTES", str(512 * 1024 * 1024))),
+        "IMAGE_STORE_MAX_AGE_SECONDS": float(os.getenv("IMAGE_STORE_MAX_AGE_SECONDS", str(7 * 24 * 3600))),
+        "IMAGE_STORE_ORPHAN_GRACE_SECONDS": float(os.getenv("IMAGE_STORE_ORPHAN_GRACE_SECONDS", "3600")),
+        "IMAGE_STORE_SWEEP_INTERVAL_SECONDS": float(os.getenv("IMAGE_STORE_SWEEP_INTERVAL_SECONDS", "300")),
+        # Upstream endpoints (overridable to point at local stub servers) and the pooled HTTP client
+        "PERPLEXITY_BASE_URL": os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai"),
+        "GEMINI_BASE_URL": os.getenv("GEMINI_BASE_URL", ""),
+        "STATIC_MAPS_URL": os.getenv("STATIC_MAPS_URL", "https://maps.googleapis.com/maps/api/staticmap"),
+        "HTTP_POOL_CONNECTIONS": int(os.getenv("HTTP_POOL_CONNECTIONS", "4")),
+        "HTTP_POOL_MAXSIZE": int(os.getenv("HTTP_POOL_MAXSIZE", "16")),
+        "HTTP_MAX_RETRIES": int(os.getenv("HTTP_MAX_RETRIES", "3")),
+        "HTTP_BACKOFF_FACTOR": float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5")),
+        "HTTP_BACKOFF_MAX": float(os.getenv("HTTP_BACKOFF_MAX", "8")),
+        "HTTP_RETRY_AFTER_MAX": float(os.getenv("HTTP_RETRY_AFTER_MAX", "30")),
+        # Directory holding delhi_wards.json, delhi_wards.geojson and the population CSV
+        "WARD_DATA_DIR": os.getenv("WARD_DATA_DIR"),
+        # Google's Static Maps URL limit; ward boundaries are simplified to fit inside it
+        "STATIC_MAP_URL_MAX_LENGTH": int(os.getenv("STATIC_MAP_URL_MAX_LENGTH", "16384")),
+        # Durable analysis job queue (SQLite under instance_path) and its in-process workers
+        "ASYNC_JOBS_ENABLED": os.getenv("ASYNC_JOBS_ENABLED", "true").lower() not in {"0", "false", "no"},
+        "JOB_WORKER_THREADS": int(os.getenv("JOB_WORKER_THREADS", "2")),
+        "JOB_LEASE_SECONDS": float(os.getenv("JOB_LEASE_SECONDS", "300")),
+        "JOB_MAX_ATTEMPTS": int(os.getenv("JOB_MAX_ATTEMPTS", "2")),
+        "JOB_RETENTION_SECONDS": float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600))),
+        "JOB_POLL_INTERVAL_SECONDS": float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "0.5")),
+        # Shared asyncio loop for upstream calls, with per-provider in-flight limits
+        "AIO_PIPELINE_ENABLED": os.getenv("AIO_PIPELINE_ENABLED", "true").lower() not in {"0", "false", "no"},
+        "AIO_GEMINI_CONCURRENCY": int(os.getenv("AIO_GEMINI_CONCURRENCY", "32")),
+        "AIO_PERPLEXITY_CONCURRENCY": int(os.getenv("AIO_PERPLEXITY_CONCURRENCY", "16")),
+        "AIO_STATIC_MAPS_CONCURRENCY": int(os.getenv("AIO_STATIC_MAPS_CONCURRENCY", "16")),
+        "AIO_HTTP_MAX_CONNECTIONS": int(os.getenv("AIO_HTTP_MAX_CONNECTIONS", "100")),
+        # Server-side sessions: the cookie carries only a signed id ("cookie" restores Flask's default)
+        "SESSION_BACKEND": os.getenv("SESSION_BACKEND", "sqlite"),
+        "SESSION_TTL_SECONDS": float(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+        "SESSION_PURGE_INTERVAL_SECONDS": float(os.getenv("SESSION_PURGE_INTERVAL_SECONDS", "3600")),
+        "SESSION_MMAP_BYTES": int(os.getenv("SESSION_MMAP_BYTES", str(64 * 1024 * 1024))),
+        # Uploaded and static-map images are downscaled and recompressed before they reach Gemini
+        "IMAGE_PREPROCESS_ENABLED": os.getenv("IMAGE_PREPROCESS_ENABLED", "true").lower() not in {"0", "false", "no"},
+        "IMAGE_MAX_EDGE": int(os.getenv("IMAGE_MAX_EDGE", "1024")),
+        "IMAGE_QUALITY": int(os.getenv("IMAGE_QUALITY", "85")),
+        "IMAGE_MAX_BYTES": int(os.getenv("IMAGE_MAX_BYTES", "400000")),
+        "IMAGE_OUTPUT_FORMAT": os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg"),
+        # Streamed construction recommendations
+        "RECOMMEND_STREAMING_ENABLED": os.getenv("RECOMMEND_STREAMING_ENABLED", "true").lower() not in {"0", "false", "no"},
+        # Fingerprinted, precompressed static assets
+        "STATIC_ASSETS_ENABLED": os.getenv("STATIC_ASSETS_ENABLED", "true").lower() not in {"0", "false", "no"},
+        # Prometheus /metrics and Server-Timing headers
+        "METRICS_ENABLED": os.getenv("METRICS_ENABLED", "true").lower() not in {"0", "false", "no"},
+        # Per-request latency budget, hedged static map fetches and per-provider circuit breakers
+        "REQUEST_BUDGET_SECONDS": float(os.getenv("REQUEST_BUDGET_SECONDS", "120")),
+        "BATCH_WARD_BUDGET_SECONDS": float(os.getenv("BATCH_WARD_BUDGET_SECONDS", "600")),
+        "STATIC_MAP_HEDGE_SECONDS": float(os.getenv("STATIC_MAP_HEDGE_SECONDS", "2")),
+        "BREAKER_FAILURE_THRESHOLD": int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+        "BREAKER_RESET_SECONDS": float(os.getenv("BREAKER_RESET_SECONDS", "30")),
+        # AI clients are built once per worker; gunicorn workers build them right after boot
+        "AI_CLIENT_WARMUP": os.getenv("AI_CLIENT_WARMUP", "true").lower() not in {"0", "false", "no"},
+        # Identical analyses in progress at the same time share one set of upstream calls
+        "SINGLEFLIGHT_ENABLED": os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() not in {"0", "false", "no"},
+        "SINGLEFLIGHT_LEASE_SECONDS": float(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "15")),
+        "SINGLEFLIGHT_POLL_INTERVAL_SECONDS": float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL_SECONDS", "0.1")),
+        # Upstream quotas shared by every worker (requests per minute, 0 = unlimited) and admission control;
+        # the older per-worker AIO_*_RPM variables are read as aliases
+        "GEMINI_RPM": float(os.getenv("GEMINI_RPM", os.getenv("AIO_GEMINI_RPM", "0"))),
+        "PERPLEXITY_RPM": float(os.getenv("PERPLEXITY_RPM", os.getenv("AIO_PERPLEXITY_RPM", "0"))),
+        "STATIC_MAPS_RPM": float(os.getenv("STATIC_MAPS_RPM", os.getenv("AIO_STATIC_MAPS_RPM", "0"))),
+        "RATE_LIMIT_BURST_SECONDS": float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10")),
+        "RATE_LIMIT_INTERACTIVE_RESERVE": float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "0.25")),
+        "ADMISSION_MAX_ACTIVE": int(os.getenv("ADMISSION_MAX_ACTIVE", "16")),
+        "ADMISSION_MAX_WAITING": int(os.getenv("ADMISSION_MAX_WAITING", "8")),
+        "ADMISSION_QUEUE_TIMEOUT_SECONDS": float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10")),
+        "ADMISSION_MAX_QUEUED_JOBS": int(os.getenv("ADMISSION_MAX_QUEUED_JOBS", "200")),
+        "ADMISSION_MAX_QUEUED_BACKGROUND_JOBS": int(os.getenv("ADMISSION_MAX_QUEUED_BACKGROUND_JOBS", "1000")),
+        "ADMISSION_RETRY_AFTER_SECONDS": int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5")),
+        # Local vegetation estimate: preview, Gemini score check and the fast mode that skips Gemini
+        "LOCAL_GREENERY_ENABLED": os.getenv("LOCAL_GREENERY_ENABLED", "true").lower() not in {"0", "false", "no"},
+        "GREENERY_FAST_MODE": os.getenv("GREENERY_FAST_MODE", "false").lower() in {"1", "true", "yes"},
+        "GREENERY_SCORE_TOLERANCE": float(os.getenv("GREENERY_SCORE_TOLERANCE", "25")),
     }
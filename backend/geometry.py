@@ -0,0 +1,160 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+from urllib.parse import quote_plus
+import numpy as np
+
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LNG = 111320.0
+STATIC_MAP_PATH_STYLE = "fillcolor:0x3300FF66|color:0x0044FF|weight:3|"
+
+def to_meters(points: np.ndarray) -> np.ndarray:
+    """Project ``[[lng, lat], ...]`` to a local equirectangular plane in meters."""
+    lat0 = np.radians(points[:, 1].mean())
+    return np.column_stack((
+        points[:, 0] * METERS_PER_DEGREE_LNG * np.cos(lat0),
+        points[:, 1] * METERS_PER_DEGREE_LAT,
+    ))
+
+def _segment_distances(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    ab = b - a
+    length_sq = float(ab @ ab)
+    if length_sq == 0.0:
+        return np.hypot(points[:, 0] - a[0], points[:, 1] - a[1])
+    t = np.clip(((points - a) @ ab) / length_sq, 0.0, 1.0)
+    projected = a + t[:, None] * ab
+    return np.hypot(points[:, 0] - projected[:, 0], points[:, 1] - projected[:, 1])
+
+def dp_importance(xy: np.ndarray) -> np.ndarray:
+    """Douglas–Peucker significance of every vertex, in the units of ``xy``.
+
+    A vertex survives simplification at tolerance ``t`` exactly when its importance
+    is greater than ``t``, so one pass answers every tolerance. Closed rings work
+    as-is: the repeated endpoint makes the first split the farthest vertex.
+    """
+    n = len(xy)
+    importance = np.zeros(n)
+    importance[0] = importance[-1] = np.inf
+    stack: List[Tuple[int, int, float]] = [(0, n - 1, np.inf)]
+    while stack:
+        start, end, parent = stack.pop()
+        if end - start < 2:
+            continue
+        distances = _segment_distances(xy[start + 1:end], xy[start], xy[end])
+        offset = int(np.argmax(distances))
+        split = start + 1 + offset
+        significance = min(float(distances[offset]), parent)
+        importance[split] = significance
+        stack.append((start, split, significance))
+        stack.append((split, end, significance))
+    return importance
+
+def _keep_mask(importance: np.ndarray, tolerance: float, min_interior: int = 2) -> np.ndarray:
+    mask = importance > tolerance
+    interior = importance[1:-1]
+    if len(interior) and np.count_nonzero(mask[1:-1]) < min_interior:
+        top = np.argsort(interior)[::-1][:min_interior] + 1
+        mask[top] = True
+    return mask
+
+def simplify_ring(points: Sequence[Sequence[float]], tolerance_m: float) -> List[List[float]]:
+    """Douglas–Peucker simplification of one ``[[lng, lat], ...]`` ring to ``tolerance_m`` meters."""
+    coords = np.asarray(points, dtype=float)[:, :2]
+    if len(coords) <= 4:
+        return coords.tolist()
+    return coords[_keep_mask(dp_importance(to_meters(coords)), tolerance_m)].tolist()
+
+def outer_rings(geometry: Dict[str, Any]) -> List[np.ndarray]:
+    """Outer ring of every polygon in a Polygon, MultiPolygon or Feature."""
+    geometry = geometry.get("geometry", geometry) if geometry else {}
+    gtype = (geometry or {}).get("type")
+    coordinates = (geometry or {}).get("coordinates") or []
+    if gtype == "Polygon":
+        polygons = [coordinates]
+    elif gtype == "MultiPolygon":
+        polygons = coordinates
+    else:
+        return []
+    rings = []
+    for polygon in polygons:
+        if polygon and len(polygon[0]) >= 3:
+            ring = np.asarray(polygon[0], dtype=float)[:, :2]
+            if not np.array_equal(ring[0], ring[-1]):
+                ring = np.vstack((ring, ring[:1]))
+            rings.append(ring)
+    return rings
+
+def encode_polyline(lnglat: np.ndarray) -> str:
+    """Google encoded polyline for ``[[lng, lat], ...]`` at 1e-5 degree precision."""
+    scaled = np.round(lnglat[:, ::-1] * 1e5).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chars = []
+    for value in zigzag.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+def _encoded_paths(rings: List[np.ndarray], importances: List[np.ndarray], tolerance: float) -> List[str]:
+    return [
+        STATIC_MAP_PATH_STYLE + "enc:" + encode_polyline(ring[_keep_mask(importance, tolerance)])
+        for ring, importance in zip(rings, importances)
+    ]
+
+def _url_length(paths: List[str]) -> int:
+    return sum(len("&path=") + len(quote_plus(path)) for path in paths)
+
+def fit_static_map_paths(geometry: Dict[str, Any], max_chars: int) -> Tuple[List[str], float]:
+    """Simplify every polygon with the smallest shared tolerance whose paths fit in ``max_chars``.
+
+    Returns the Static Maps ``path`` values (encoded polylines, one per polygon) and
+    the tolerance in meters that was used. The search only visits tolerances at
+    which the simplified shape actually changes.
+    """
+    rings = outer_rings(geometry)
+    if not rings:
+        return [], 0.0
+    importances = [dp_importance(to_meters(ring)) for ring in rings]
+    paths = _encoded_paths(rings, importances, 0.0)
+    if _url_length(paths) <= max_chars:
+        return paths, 0.0
+    candidates = np.unique(np.concatenate([imp[np.isfinite(imp)] for imp in importances]))
+    lo, hi = 0, len(candidates) - 1
+    best = _encoded_paths(rings, importances, float(candidates[hi]))
+    best_tolerance = float(candidates[hi])
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        trial = _encoded_paths(rings, importances, float(candidates[mid]))
+        if _url_length(trial) <= max_chars:
+            best, best_tolerance = trial, float(candidates[mid])
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    return best, best_tolerance
+
+_path_cache: "OrderedDict[Tuple[str, str, int], Tuple[List[str], float]]" = OrderedDict()
+_path_cache_lock = threading.Lock()
+_PATH_CACHE_SIZE = 1024
+
+def geometry_hash(geometry: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(geometry, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def cached_static_map_paths(geojson: Dict[str, Any], max_chars: int) -> Tuple[List[str], float]:
+    """``fit_static_map_paths`` memoized per ward id and geometry hash."""
+    geometry = geojson.get("geometry", geojson)
+    ward_id = str((geojson.get("properties") or {}).get("Ward_No") or "")
+    key = (ward_id, geometry_hash(geometry), int(max_chars))
+    with _path_cache_lock:
+        if key in _path_cache:
+            _path_cache.move_to_end(key)
+            return _path_cache[key]
+    result = fit_static_map_paths(geometry, max_chars)
+    with _path_cache_lock:
+        _path_cache[key] = result
+        while len(_path_cache) > _PATH_CACHE_SIZE:
+            _path_cache.popitem(last=False)
+    return result
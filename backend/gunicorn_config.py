@@ -1,14 +1,28 @@
 # Gunicorn configuration file
 
 import multiprocessing
+import os
+import shutil
+
+# Prometheus multiprocess mode: each worker writes its samples to files in this
+# directory and /metrics adds them up (see metrics.py). Set here, before any
+# worker imports prometheus_client.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "prometheus"),
+)
 
 # Server socket
 bind = "0.0.0.0:5001"
 backlog = 2048
 
 # Worker processes
+# gthread workers serve each request on a thread; upstream AI and map calls are
+# multiplexed on one asyncio loop per worker (see aio.py), so request threads
+# mostly wait and a worker can hold many analyses in flight.
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
 worker_connections = 1000
 timeout = 300  # Increased to 5 minutes for AI analysis requests
 keepalive = 5
@@ -34,3 +48,32 @@ tmp_upload_dir = None
 # keyfile = None
 # certfile = None
 
+# Server hooks
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to this one's.
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+def post_worker_init(worker):
+    # The app is loaded in this worker now. Import the Gemini SDK and build the AI and
+    # HTTP clients in the background, so the first analysis does not pay for it and the
+    # worker starts accepting requests straight away.
+    app = worker.wsgi
+    if not app.config.get("AI_CLIENT_WARMUP", True):
+        return
+    import threading
+    import ai_clients
+
+    def warm():
+        try:
+            result = ai_clients.warm_up(app.config)
+            worker.log.info("AI clients warmed up in %.0f ms (SDK import %.0f ms)", result["warm_up_ms"], result["import_ms"])
+        except Exception:
+            worker.log.exception("AI client warm-up failed; clients will be built on first use")
+
+    threading.Thread(target=warm, name="ai-client-warmup", daemon=True).start()
@@ -0,0 +1,293 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+import resilience
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    "pool_connections": 4,
+    "pool_maxsize": 16,
+    "max_retries": 3,
+    "backoff_factor": 0.5,
+    "backoff_max": 8.0,
+    "retry_after_max": 30.0,
+    "async_max_connections": 100,
+    "hosts": [],
+}
+
+_settings: Dict[str, Any] = dict(DEFAULT_SETTINGS)
+_stats_lock = threading.Lock()
+_retry_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+def _record(host: str, key: str) -> None:
+    with _stats_lock:
+        _retry_stats[host][key] += 1
+
+class _TrackedRetry(Retry):
+    """urllib3 Retry with full jitter, a cap on Retry-After and per-host counters.
+
+    Like ``AsyncHttpClient``, a retry whose wait would not fit in the current
+    ``resilience`` budget is not made: the last response (or error) is returned.
+    """
+
+    _delay: Optional[float] = None
+
+    def get_backoff_time(self) -> float:
+        base = min(super().get_backoff_time(), float(_settings["backoff_max"]))
+        return random.uniform(0, base) if base > 0 else 0
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, float(_settings["retry_after_max"]))
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        host = getattr(_pool, "host", None) or "unknown"
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        # Settle the (jittered) wait now, so the budget check and the sleep agree.
+        retry_after = new_retry.get_retry_after(response) if self.respect_retry_after_header and response else None
+        new_retry._delay = new_retry.get_backoff_time() if retry_after is None else retry_after
+        if not resilience.fits(new_retry._delay):
+            cause = ResponseError.SPECIFIC_ERROR.format(status_code=response.status) if response is not None else ResponseError.GENERIC_ERROR
+            reason = error or ResponseError(cause)
+            raise MaxRetryError(_pool, url, reason) from reason
+        if response is not None:
+            _record(host, f"retry_status_{response.status}")
+        elif error is not None:
+            _record(host, f"retry_{type(error).__name__}")
+        return new_retry
+
+    def sleep(self, response=None) -> None:
+        if self._delay is None:
+            super().sleep(response)
+        elif self._delay > 0:
+            time.sleep(self._delay)
+
+def _build_retry(idempotent_only: bool) -> Retry:
+    # Non-idempotent calls (Perplexity POST) only retry when the upstream refused
+    # the request outright: connection failures and 429/503 responses.
+    status_forcelist = (429, 500, 502, 503, 504) if idempotent_only else (429, 503)
+    allowed_methods = Retry.DEFAULT_ALLOWED_METHODS if idempotent_only else frozenset({"POST"})
+    return _TrackedRetry(
+        total=int(_settings["max_retries"]),
+        connect=int(_settings["max_retries"]),
+        read=int(_settings["max_retries"]) if idempotent_only else 0,
+        status=int(_settings["max_retries"]),
+        backoff_factor=float(_settings["backoff_factor"]),
+        status_forcelist=status_forcelist,
+        allowed_methods=allowed_methods,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+class HttpClient:
+    """Per-process keep-alive session with one connection pool per upstream host."""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.session = requests.Session()
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._request_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        default_adapter = self._adapter(settings, idempotent_only=True)
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+        self._adapters["default"] = default_adapter
+        for base_url, idempotent_only in settings.get("hosts", []):
+            parts = urlsplit(base_url)
+            prefix = f"{parts.scheme}://{parts.netloc}"
+            adapter = self._adapter(settings, idempotent_only=idempotent_only)
+            self.session.mount(prefix, adapter)
+            self._adapters[prefix] = adapter
+
+    @staticmethod
+    def _adapter(settings: Dict[str, Any], idempotent_only: bool) -> HTTPAdapter:
+        return HTTPAdapter(
+            pool_connections=int(settings["pool_connections"]),
+            pool_maxsize=int(settings["pool_maxsize"]),
+            max_retries=_build_retry(idempotent_only),
+            pool_block=False,
+        )
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        host = urlsplit(url).hostname or "unknown"
+        with _stats_lock:
+            self._request_stats[host]["requests"] += 1
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException as exc:
+            with _stats_lock:
+                self._request_stats[host][f"error_{type(exc).__name__}"] += 1
+            raise
+        with _stats_lock:
+            self._request_stats[host][f"status_{response.status_code // 100}xx"] += 1
+        return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        pools = {}
+        for prefix, adapter in self._adapters.items():
+            pool_container = adapter.poolmanager.pools
+            for key in list(pool_container.keys()):
+                pool = pool_container.get(key)
+                if pool is None:
+                    continue
+                pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    "adapter": prefix,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle_connections": pool.pool.qsize() if pool.pool is not None else 0,
+                    "maxsize": adapter._pool_maxsize,
+                }
+        with _stats_lock:
+            return {
+                "pid": os.getpid(),
+                "requests": {host: dict(counts) for host, counts in self._request_stats.items()},
+                "retries": {host: dict(counts) for host, counts in _retry_stats.items()},
+                "pools": pools,
+            }
+
+_client: Optional[HttpClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+def configure(config: Dict[str, Any]) -> None:
+    """Record pool and retry settings from the app config; the clients are built lazily per process."""
+    global _client, _async_client
+    _settings.update({
+        "pool_connections": config.get("HTTP_POOL_CONNECTIONS", DEFAULT_SETTINGS["pool_connections"]),
+        "pool_maxsize": config.get("HTTP_POOL_MAXSIZE", DEFAULT_SETTINGS["pool_maxsize"]),
+        "max_retries": config.get("HTTP_MAX_RETRIES", DEFAULT_SETTINGS["max_retries"]),
+        "backoff_factor": config.get("HTTP_BACKOFF_FACTOR", DEFAULT_SETTINGS["backoff_factor"]),
+        "backoff_max": config.get("HTTP_BACKOFF_MAX", DEFAULT_SETTINGS["backoff_max"]),
+        "retry_after_max": config.get("HTTP_RETRY_AFTER_MAX", DEFAULT_SETTINGS["retry_after_max"]),
+        "async_max_connections": config.get("AIO_HTTP_MAX_CONNECTIONS", DEFAULT_SETTINGS["async_max_connections"]),
+        "hosts": [
+            (config.get("STATIC_MAPS_URL", "https://maps.googleapis.com/maps/api/staticmap"), True),
+            (config.get("PERPLEXITY_BASE_URL", "https://api.perplexity.ai"), False),
+        ],
+    })
+    _client = None
+    _async_client = None
+
+def get_http_client() -> HttpClient:
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = HttpClient(_settings)
+                _client_pid = pid
+    return _client
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), float(_settings["retry_after_max"]))
+
+class AsyncHttpClient:
+    """asyncio counterpart of ``HttpClient`` for the shared event loop in ``aio``.
+
+    Uses the same retry policy: idempotent requests retry connection and read
+    errors plus 429/5xx, POSTs only connection errors and 429/503, with full-jitter
+    backoff and a capped Retry-After. Counters land in the same per-host stats.
+    Under a ``resilience`` budget each attempt's timeout is cut to what is left,
+    and a retry that would not fit is not made.
+    """
+
+    def __init__(self, settings: Dict[str, Any]):
+        max_connections = int(settings["async_max_connections"])
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_retries = int(settings["max_retries"])
+        self.client = httpx.AsyncClient(limits=limits, transport=httpx.AsyncHTTPTransport(limits=limits, retries=self.max_retries))
+        self._request_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        base = min(float(_settings["backoff_factor"]) * (2 ** attempt), float(_settings["backoff_max"]))
+        return random.uniform(0, base) if base > 0 else 0
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = urlsplit(url).hostname or "unknown"
+        idempotent = method.upper() in Retry.DEFAULT_ALLOWED_METHODS
+        status_forcelist = (429, 500, 502, 503, 504) if idempotent else (429, 503)
+        timeout = kwargs.pop("timeout", None)
+        for attempt in range(self.max_retries + 1):
+            if timeout is not None:
+                kwargs["timeout"] = resilience.timeout(timeout)
+            with _stats_lock:
+                self._request_stats[host]["requests"] += 1
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as exc:
+                with _stats_lock:
+                    self._request_stats[host][f"error_{type(exc).__name__}"] += 1
+                # Connect errors were already retried by the transport; reads are only safe to repeat when idempotent.
+                if not idempotent or isinstance(exc, httpx.ConnectError) or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                if not resilience.fits(delay):
+                    raise
+                _record(host, f"retry_{type(exc).__name__}")
+                await asyncio.sleep(delay)
+                continue
+            with _stats_lock:
+                self._request_stats[host][f"status_{response.status_code // 100}xx"] += 1
+            if response.status_code not in status_forcelist or attempt == self.max_retries:
+                return response
+            delay = _retry_after_seconds(response)
+            delay = self._backoff(attempt) if delay is None else delay
+            if not resilience.fits(delay):
+                return response
+            _record(host, f"retry_status_{response.status_code}")
+            await response.aclose()
+            await asyncio.sleep(delay)
+        return response
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with _stats_lock:
+            return {"requests": {host: dict(counts) for host, counts in self._request_stats.items()}}
+
+_async_client: Optional[AsyncHttpClient] = None
+_async_client_pid: Optional[int] = None
+
+def get_async_http_client() -> AsyncHttpClient:
+    """Return the async client; only call this from coroutines on the ``aio`` loop."""
+    global _async_client, _async_client_pid
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        _async_client = AsyncHttpClient(_settings)
+        _async_client_pid = pid
+    return _async_client
+
+def async_stats() -> Dict[str, Any]:
+    client = _async_client if _async_client_pid == os.getpid() else None
+    return client.stats() if client is not None else {"requests": {}}
@@ -0,0 +1,58 @@
+import io
+from typing import Any, BinaryIO, Dict, Tuple
+from PIL import Image, ImageOps
+
+OUTPUT_MIME = {"jpeg": "image/jpeg", "webp": "image/webp"}
+MIN_QUALITY = 40
+
+class ImagePrepError(ValueError):
+    """The image could not be decoded."""
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    # No exif/icc arguments: re-encoding drops all metadata from the original.
+    image.save(buffer, format=fmt.upper(), quality=quality, optimize=fmt == "jpeg", method=4 if fmt == "webp" else 0)
+    return buffer.getvalue()
+
+def preprocess(source: BinaryIO, original_size: int, max_edge: int = 1024, quality: int = 85, max_bytes: int = 400_000, fmt: str = "jpeg") -> Tuple[bytes, str, Dict[str, Any]]:
+    """Decode ``source``, fit it within ``max_edge`` pixels and re-encode it under ``max_bytes``.
+
+    Quality steps down from ``quality`` to ``MIN_QUALITY`` before the image is shrunk
+    further. Returns ``(data, mime_type, stats)``; ``stats`` records the original and
+    final dimensions and sizes, including ``bytes_saved``.
+    """
+    fmt = fmt.lower() if fmt.lower() in OUTPUT_MIME else "jpeg"
+    try:
+        image = Image.open(source)
+        original_dims = image.size
+        # JPEG can decode straight at a reduced scale, which avoids a full-size bitmap.
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError, ValueError) as exc:
+        raise ImagePrepError("Could not read the image; upload a valid PNG, JPG, or WEBP file.") from exc
+
+    current_quality = int(quality)
+    data = _encode(image, fmt, current_quality)
+    while max_bytes and len(data) > max_bytes:
+        if current_quality > MIN_QUALITY:
+            current_quality = max(MIN_QUALITY, current_quality - 10)
+        else:
+            width, height = image.size
+            if max(width, height) <= 256:
+                break
+            image = image.resize((max(1, int(width * 0.8)), max(1, int(height * 0.8))), Image.LANCZOS)
+        data = _encode(image, fmt, current_quality)
+
+    stats = {
+        "original_bytes": int(original_size),
+        "original_dimensions": list(original_dims),
+        "bytes": len(data),
+        "dimensions": list(image.size),
+        "quality": current_quality,
+        "format": fmt,
+        "bytes_saved": int(original_size) - len(data),
+    }
+    return data, OUTPUT_MIME[fmt], stats
@@ -0,0 +1,231 @@
+import hashlib
+import io
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+from flask import current_app
+
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+_TOKEN_RE = re.compile(r"^([0-9a-f]{64})\.(png|jpg|webp)$")
+_LEGACY_TOKEN_RE = re.compile(r"^[0-9a-f]{32}\.(png|jpg|webp)$")
+
+class ImageStore:
+    """Content-addressed store for analysis images.
+
+    Files live at ``<root>/<aa>/<bb>/<sha256>.<ext>`` so identical bytes are written
+    once. A SQLite index next to the files tracks how many sessions reference each
+    image, when it was last used, and aliases such as static-map request keys that
+    resolve to a stored digest.
+    """
+
+    def __init__(self, root: Path, quota_bytes: int = 512 * 1024 * 1024, max_age_seconds: float = 7 * 86400, orphan_grace_seconds: float = 3600):
+        self.root = Path(root)
+        self.quota_bytes = int(quota_bytes)
+        self.max_age_seconds = float(max_age_seconds)
+        self.orphan_grace_seconds = float(orphan_grace_seconds)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL,"
+                " refcount INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS images_last_access ON images(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, digest TEXT NOT NULL, created_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sweeps (id INTEGER PRIMARY KEY CHECK (id = 1), last_run REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.root / "index.sqlite3"), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def path_for(self, token: str) -> Optional[Path]:
+        """Resolve a token to a file path, or None if the token is malformed."""
+        match = _TOKEN_RE.match(token or "")
+        if match:
+            digest = match.group(1)
+            return self.root / digest[:2] / digest[2:4] / token
+        if _LEGACY_TOKEN_RE.match(token or ""):
+            return self.root / token
+        return None
+
+    def put(self, image_bytes: bytes, mime_type: str, alias: Optional[str] = None) -> str:
+        """Store ``image_bytes`` (deduplicated by SHA-256) and return its token."""
+        return self.put_stream(io.BytesIO(image_bytes), mime_type, alias=alias)
+
+    def put_stream(self, stream: BinaryIO, mime_type: str, alias: Optional[str] = None, chunk_size: int = 256 * 1024) -> str:
+        """Copy ``stream`` to a temp file while hashing it, then publish it under its digest.
+
+        Only one chunk is held in memory at a time, whatever the size of the image.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                for chunk in iter(lambda: stream.read(chunk_size), b""):
+                    hasher.update(chunk)
+                    handle.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            token = f"{digest}.{EXTENSIONS.get(mime_type, 'png')}"
+            path = self.path_for(token)
+            if path.exists():
+                Path(tmp_name).unlink()
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO images (digest, ext, size, refcount, created_at, last_access) VALUES (?, ?, ?, 0, ?, ?)"
+            " ON CONFLICT(digest) DO UPDATE SET last_access = excluded.last_access",
+            (digest, path.suffix.lstrip("."), size, now, now),
+        )
+        if alias:
+            conn.execute("INSERT OR REPLACE INTO aliases (alias, digest, created_at) VALUES (?, ?, ?)", (alias, digest, now))
+        return token
+
+    def get_by_alias(self, alias: str) -> Optional[bytes]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT images.digest, images.ext FROM aliases JOIN images ON images.digest = aliases.digest WHERE aliases.alias = ?",
+            (alias,),
+        ).fetchone()
+        if row is None:
+            return None
+        path = self.path_for(f"{row[0]}.{row[1]}")
+        try:
+            data = path.read_bytes()
+        except OSError:
+            conn.execute("DELETE FROM aliases WHERE alias = ?", (alias,))
+            return None
+        conn.execute("UPDATE images SET last_access = ? WHERE digest = ?", (time.time(), row[0]))
+        return data
+
+    def _adjust(self, token: Optional[str], delta: int) -> None:
+        match = _TOKEN_RE.match(token or "")
+        if not match:
+            return
+        self._connect().execute(
+            "UPDATE images SET refcount = MAX(0, refcount + ?), last_access = ? WHERE digest = ?",
+            (delta, time.time(), match.group(1)),
+        )
+
+    def acquire(self, token: Optional[str]) -> None:
+        self._adjust(token, 1)
+
+    def release(self, token: Optional[str]) -> None:
+        if token and _LEGACY_TOKEN_RE.match(token):
+            self.root.joinpath(token).unlink(missing_ok=True)
+            return
+        self._adjust(token, -1)
+
+    def _remove(self, conn: sqlite3.Connection, digest: str, ext: str) -> None:
+        self.path_for(f"{digest}.{ext}").unlink(missing_ok=True)
+        conn.execute("DELETE FROM aliases WHERE digest = ?", (digest,))
+        conn.execute("DELETE FROM images WHERE digest = ?", (digest,))
+
+    def sweep(self, min_interval: float = 0.0) -> Dict[str, int]:
+        """Garbage-collect the store.
+
+        Removes unreferenced images past the orphan grace period, references that
+        have been idle longer than ``max_age_seconds`` (abandoned sessions), legacy
+        UUID-named files, and finally the least recently used images until the store
+        fits in ``quota_bytes``. Skipped if another worker swept within ``min_interval``.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT last_run FROM sweeps WHERE id = 1").fetchone()
+            if row is not None and now - row[0] < min_interval:
+                conn.execute("COMMIT")
+                return {"skipped": 1}
+            conn.execute("INSERT OR REPLACE INTO sweeps (id, last_run) VALUES (1, ?)", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        removed = 0
+        stale = conn.execute(
+            "SELECT digest, ext FROM images WHERE (refcount = 0 AND last_access < ?) OR last_access < ?",
+            (now - self.orphan_grace_seconds, now - self.max_age_seconds),
+        ).fetchall()
+        for digest, ext in stale:
+            self._remove(conn, digest, ext)
+            removed += 1
+
+        for legacy in self.root.glob("*.*"):
+            if _LEGACY_TOKEN_RE.match(legacy.name) and legacy.stat().st_mtime < now - self.max_age_seconds:
+                legacy.unlink(missing_ok=True)
+                removed += 1
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+        evicted = 0
+        if total > self.quota_bytes:
+            for digest, ext, size in conn.execute("SELECT digest, ext, size FROM images ORDER BY refcount > 0, last_access ASC").fetchall():
+                self._remove(conn, digest, ext)
+                evicted += 1
+                total -= size
+                if total <= self.quota_bytes:
+                    break
+        return {"removed": removed, "evicted": evicted, "bytes": total}
+
+_store: Optional[ImageStore] = None
+_store_lock = threading.Lock()
+
+def _build_store(app) -> ImageStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = app.config
+                _store = ImageStore(
+                    Path(app.instance_path) / "analysis_images",
+                    quota_bytes=config.get("IMAGE_STORE_QUOTA_BYTES", 512 * 1024 * 1024),
+                    max_age_seconds=config.get("IMAGE_STORE_MAX_AGE_SECONDS", 7 * 86400),
+                    orphan_grace_seconds=config.get("IMAGE_STORE_ORPHAN_GRACE_SECONDS", 3600),
+                )
+    return _store
+
+def get_image_store() -> ImageStore:
+    return _build_store(current_app)
+
+_sweeper_pid: Optional[int] = None
+
+def start_sweeper(app) -> None:
+    """Start the background GC thread for this process (once per worker)."""
+    global _sweeper_pid
+    interval = float(app.config.get("IMAGE_STORE_SWEEP_INTERVAL_SECONDS", 300))
+    if interval <= 0 or _sweeper_pid == os.getpid():
+        return
+    _sweeper_pid = os.getpid()
+    store = _build_store(app)
+
+    def run() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                result = store.sweep(min_interval=interval / 2)
+                if not result.get("skipped"):
+                    app.logger.info("Image store sweep finished", extra={"sweep": result})
+            except Exception as exc:
+                app.logger.warning("Image store sweep failed: %s", exc)
+
+    threading.Thread(target=run, name="image-store-sweeper", daemon=True).start()
@@ -0,0 +1,237 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from flask import current_app
+import metrics
+import ratelimit
+
+# Claim order: interactive jobs (a user is waiting) before background ones.
+PRIORITY_RANKS = {ratelimit.INTERACTIVE: 0, ratelimit.BACKGROUND: 1}
+
+class JobQueue:
+    """Durable analysis job queue backed by SQLite under ``instance_path``.
+
+    Jobs are claimed with a lease, interactive before background; if the process
+    running a job dies, the lease expires and another worker picks the job up
+    again (up to ``max_attempts``).
+    """
+
+    def __init__(self, db_path: Path, lease_seconds: float = 300, max_attempts: int = 2, retention_seconds: float = 86400):
+        self.db_path = Path(db_path)
+        self.lease_seconds = float(lease_seconds)
+        self.max_attempts = int(max_attempts)
+        self.retention_seconds = float(retention_seconds)
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT NOT NULL,"
+            " progress INTEGER NOT NULL DEFAULT 0, payload TEXT NOT NULL, result TEXT, error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, definition in (("priority", "INTEGER NOT NULL DEFAULT 0"), ("preview", "TEXT")):
+            if name not in columns:
+                try:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, payload: Dict[str, Any], kind: str = "analysis", priority: str = ratelimit.INTERACTIVE) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, status, stage, progress, payload, priority, created_at, updated_at)"
+            " VALUES (?, ?, 'queued', 'queued', 0, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), PRIORITY_RANKS[priority], now, now),
+        )
+        return job_id
+
+    def depth(self, priority: Optional[str] = None) -> int:
+        """Jobs waiting to be claimed, optionally only those of one priority."""
+        if priority is None:
+            return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority = ?", (PRIORITY_RANKS[priority],),
+        ).fetchone()[0]
+
+    def claim(self) -> Optional[Tuple[str, str, Dict[str, Any], str]]:
+        """Lease the next runnable job, returning ``(id, kind, payload, priority)``."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts, priority FROM jobs"
+                " WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY priority, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job_id, kind, payload, attempts, rank = row
+            if attempts >= self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    ("Analysis worker stopped before finishing this job.", now, job_id),
+                )
+                conn.execute("COMMIT")
+                return self.claim()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, now, job_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        priority = ratelimit.BACKGROUND if rank else ratelimit.INTERACTIVE
+        return job_id, kind, json.loads(payload), priority
+
+    def update(self, job_id: str, stage: str, progress: int, preview: Optional[Dict[str, Any]] = None) -> None:
+        """Record progress; ``preview`` (early partial results) is kept until replaced."""
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET stage = ?, progress = MAX(progress, ?), preview = COALESCE(?, preview), lease_until = ?, updated_at = ?"
+            " WHERE id = ? AND status = 'running'",
+            (stage, int(progress), json.dumps(preview) if preview else None, now + self.lease_seconds, now, job_id),
+        )
+
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', stage = 'done', progress = 100, result = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (error, time.time(), job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT id, kind, status, stage, progress, result, error, created_at, updated_at, preview FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "status", "stage", "progress", "result", "error", "created_at", "updated_at", "preview")
+        job = dict(zip(keys, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["preview"] = json.loads(job["preview"]) if job["preview"] else None
+        return job
+
+    def purge(self) -> int:
+        return self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - self.retention_seconds,),
+        ).rowcount
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+_handlers: Dict[str, Callable[[Dict[str, Any], Callable[[str, int], None]], Dict[str, Any]]] = {}
+
+def register_handler(kind: str, handler: Callable[[Dict[str, Any], Callable[[str, int], None]], Dict[str, Any]]) -> None:
+    """Register ``handler(payload, report_progress) -> result`` for jobs of ``kind``."""
+    _handlers[kind] = handler
+
+def _build_queue(app) -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(
+                    Path(app.instance_path) / "jobs.sqlite3",
+                    lease_seconds=app.config.get("JOB_LEASE_SECONDS", 300),
+                    max_attempts=app.config.get("JOB_MAX_ATTEMPTS", 2),
+                    retention_seconds=app.config.get("JOB_RETENTION_SECONDS", 86400),
+                )
+    return _queue
+
+def get_job_queue() -> JobQueue:
+    return _build_queue(current_app)
+
+def run_one(app, queue: JobQueue) -> bool:
+    """Claim and run a single job; returns False when the queue was empty."""
+    claimed = queue.claim()
+    if claimed is None:
+        return False
+    job_id, kind, payload, priority = claimed
+    handler = _handlers.get(kind)
+    if handler is None:
+        queue.fail(job_id, f"No handler registered for job kind {kind!r}")
+        return True
+    with app.app_context(), ratelimit.priority(priority):
+        try:
+            with metrics.JOBS_RUNNING.track_inprogress():
+                result = handler(payload, lambda stage, progress, preview=None: queue.update(job_id, stage, progress, preview))
+        except Exception as exc:
+            app.logger.warning("Job %s failed: %s", job_id, exc, exc_info=True)
+            queue.fail(job_id, str(exc))
+        else:
+            queue.finish(job_id, result)
+    return True
+
+def _worker_loop(app, queue: JobQueue, poll_interval: float) -> None:
+    idle_rounds = 0
+    while True:
+        try:
+            if run_one(app, queue):
+                idle_rounds = 0
+                continue
+            idle_rounds += 1
+            if idle_rounds % 600 == 0:
+                queue.purge()
+        except Exception as exc:
+            app.logger.warning("Job worker error: %s", exc)
+        time.sleep(poll_interval)
+
+_workers_pid: Optional[int] = None
+
+def start_workers(app, threads: Optional[int] = None) -> None:
+    """Start this process's job worker threads (once per process)."""
+    global _workers_pid
+    count = int(app.config.get("JOB_WORKER_THREADS", 2) if threads is None else threads)
+    if count <= 0 or _workers_pid == os.getpid():
+        return
+    _workers_pid = os.getpid()
+    queue = _build_queue(app)
+    poll_interval = float(app.config.get("JOB_POLL_INTERVAL_SECONDS", 0.5))
+    for number in range(count):
+        threading.Thread(target=_worker_loop, args=(app, queue, poll_interval), name=f"job-worker-{number}", daemon=True).start()
+
+if __name__ == "__main__":
+    # Dedicated worker process: `python jobs.py --threads 4`. Pair it with
+    # JOB_WORKER_THREADS=0 on the web workers so they only enqueue.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run analysis job workers.")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    os.environ["JOB_WORKER_THREADS"] = "0"
+
+    import jobs as jobs_module  # the module instance the app registered its handlers on
+    from app import app as worker_app
+
+    jobs_module.start_workers(worker_app, threads=args.threads)
+    worker_app.logger.info("Job workers running", extra={"threads": args.threads})
+    while True:
+        time.sleep(3600)
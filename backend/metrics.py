@@ -0,0 +1,178 @@
+"""Prometheus metrics and ``Server-Timing`` headers.
+
+Pipeline stages, upstream API calls (Gemini, Perplexity, Static Maps), cache
+lookups and HTTP responses are recorded here and exposed at ``/metrics``. Under
+gunicorn, ``gunicorn_config.py`` sets ``PROMETHEUS_MULTIPROC_DIR`` before any
+worker starts; each worker then writes its samples to files in that directory
+and ``/metrics`` sums them across workers. Without it (``python app.py``) the
+numbers cover this process only.
+
+Stages timed during a request are also sent back in a ``Server-Timing`` header,
+so browser devtools show where the time went.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from flask import g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+STAGE_SECONDS = Histogram(
+    "urbaninfra_stage_seconds", "Wall time of one analysis or recommendation stage.", ["stage"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_SECONDS = Histogram(
+    "urbaninfra_upstream_request_seconds", "Latency of one upstream API call.", ["provider", "operation"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "urbaninfra_upstream_errors_total", "Upstream API calls that failed, by HTTP status or exception type.", ["provider", "operation", "error"],
+)
+UPSTREAM_BYTES = Counter(
+    "urbaninfra_upstream_bytes_total", "Bytes sent to and received from upstream APIs.", ["provider", "direction"],
+)
+CACHE_REQUESTS = Counter(
+    "urbaninfra_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"],
+)
+HTTP_SECONDS = Histogram(
+    "urbaninfra_http_request_seconds", "Time spent in the view for one request (streamed bodies excluded).",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_RESPONSE_BYTES = Counter(
+    "urbaninfra_http_response_bytes_total", "Response body bytes, for responses with a known length.", ["endpoint"],
+)
+# Busy request threads and job workers, summed over live workers: with the
+# thread and worker counts these give saturation.
+HTTP_IN_FLIGHT = Gauge(
+    "urbaninfra_http_requests_in_flight", "Requests being handled right now.", multiprocess_mode="livesum",
+)
+JOBS_RUNNING = Gauge(
+    "urbaninfra_jobs_running", "Analysis jobs being run right now.", multiprocess_mode="livesum",
+)
+BREAKER_OPEN = Gauge(
+    "urbaninfra_circuit_breaker_open", "1 while a provider's circuit breaker is open in any live worker.", ["provider"],
+    multiprocess_mode="livemax",
+)
+BREAKER_REJECTIONS = Counter(
+    "urbaninfra_circuit_breaker_rejections_total", "Upstream calls refused because the provider's breaker was open.", ["provider"],
+)
+HEDGED_REQUESTS = Counter(
+    "urbaninfra_hedged_requests_total", "Hedged upstream calls, by which copy answered first.", ["provider", "winner"],
+)
+COALESCED_ANALYSES = Counter(
+    "urbaninfra_coalesced_analyses_total", "Analyses answered by an identical one already in progress, in this worker or another.", ["scope"],
+)
+UPSTREAM_CALLS_SAVED = Counter(
+    "urbaninfra_upstream_calls_saved_total", "Upstream calls not made because the analysis was coalesced.", ["provider"],
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "urbaninfra_rate_limit_wait_seconds", "Time an upstream call waited for its provider's shared quota.", ["provider", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "urbaninfra_admission_wait_seconds", "Time admitted work waited in this worker's admission queue.", ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTIONS = Counter(
+    "urbaninfra_admission_rejections_total", "Requests turned away with 429 because a queue was full.", ["queue"],
+)
+GREENERY_SCORE_CHECKS = Counter(
+    "urbaninfra_greenery_score_checks_total", "Gemini greenery scores compared with the local estimate.", ["outcome"],
+)
+
+def observe_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+def observe_stages(timings_ms: Dict[str, Optional[float]], prefix: str = "") -> None:
+    """Record a pipeline ``stage_timings`` dict (milliseconds) in the stage histogram."""
+    for name, ms in timings_ms.items():
+        if ms is not None:
+            observe_stage(prefix + name, ms / 1000)
+
+def add_server_timing(timings_ms: Dict[str, Optional[float]], prefix: str = "") -> None:
+    """Add ``{name: milliseconds}`` to this response's ``Server-Timing`` header; a no-op outside a request."""
+    if not has_request_context():
+        return
+    entries = g.setdefault("server_timing", {})
+    for name, ms in timings_ms.items():
+        if ms is not None:
+            entries[prefix + name] = float(ms)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as stage ``name``, in the histogram and in the request's ``Server-Timing``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe_stage(name, elapsed)
+        add_server_timing({name: elapsed * 1000})
+
+def _error_label(exc: BaseException) -> str:
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return f"http_{status}" if status else type(exc).__name__
+
+@contextmanager
+def upstream_call(provider: str, operation: str) -> Iterator[None]:
+    """Time one upstream call and count it as an error if the block raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except GeneratorExit:
+        # A streaming consumer went away; that is not the upstream's fault.
+        raise
+    except BaseException as exc:
+        UPSTREAM_ERRORS.labels(provider, operation, _error_label(exc)).inc()
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(provider, operation).observe(time.perf_counter() - started)
+
+def count_bytes(provider: str, sent: int = 0, received: int = 0) -> None:
+    if sent:
+        UPSTREAM_BYTES.labels(provider, "sent").inc(sent)
+    if received:
+        UPSTREAM_BYTES.labels(provider, "received").inc(received)
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def init_app(app) -> None:
+    """Time every request and attach its ``Server-Timing`` header (with ``METRICS_ENABLED``)."""
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_in_flight = True
+        HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_response(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "unmatched"
+        HTTP_SECONDS.labels(endpoint, request.method, str(response.status_code)).observe(elapsed)
+        if response.content_length:
+            HTTP_RESPONSE_BYTES.labels(endpoint).inc(response.content_length)
+        entries = [f"{name};dur={ms:.1f}" for name, ms in (g.get("server_timing") or {}).items()]
+        entries.append(f"app;dur={elapsed * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+        return response
+
+    @app.teardown_request
+    def end_request(exc):
+        # Runs for failed requests too; a streamed body (SSE) is not counted once its headers are sent.
+        if g.pop("metrics_in_flight", False):
+            HTTP_IN_FLIGHT.dec()
+
+def render() -> Tuple[bytes, str]:
+    """The Prometheus text exposition: every worker's samples when multiprocess mode is on."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
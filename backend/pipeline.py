@@ -0,0 +1,460 @@
+import asyncio
+import base64
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import requests
+from flask import current_app
+import admission, ai_services, aio, metrics, resilience, singleflight, utils, vegetation
+from cache import AICache, content_hash, get_ai_cache, make_key
+
+# ``report(stage, progress, preview=None)``; ``preview`` carries early results such as the local greenery estimate.
+ProgressCallback = Callable[..., None]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+def get_executor(max_workers: int = 4) -> ThreadPoolExecutor:
+    """Return the bounded executor shared by every request in this worker process.
+
+    Created lazily so each gunicorn worker builds its own pool after fork.
+    """
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="ai-stage")
+                _executor_pid = pid
+    return _executor
+
+def _stage_clock() -> Dict[str, Any]:
+    # When a stage started running on an executor thread (``at``), and an event set at that moment.
+    return {"at": None, "started": threading.Event()}
+
+def _timed(timings: Dict[str, float], name: str, clock: Dict[str, Any], fn: Callable[..., Any], *args: Any) -> Any:
+    started = time.perf_counter()
+    clock["at"] = started
+    clock["started"].set()
+    try:
+        return fn(*args)
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+def _stage_result(future: Any, clock: Dict[str, Any], timeout: float) -> Any:
+    """``future``'s result, allowing the stage ``timeout`` seconds from when it started running.
+
+    Time spent queued for an executor thread only counts against the request's
+    latency budget. Raises ``FutureTimeout`` (after cancelling a stage that never started).
+    """
+    if not clock["started"].wait(resilience.remaining()):
+        future.cancel()
+        raise FutureTimeout()
+    return future.result(timeout=_remaining(clock["at"] + timeout))
+
+def _remaining(deadline: float) -> float:
+    return max(0.0, deadline - time.perf_counter())
+
+def _stage_timeout(configured: float) -> float:
+    # A stage never waits past the request's latency budget.
+    left = resilience.remaining()
+    return configured if left is None else max(0.0, min(configured, left))
+
+def tree_placeholder(exc: BaseException) -> List[str]:
+    if isinstance(exc, requests.HTTPError):
+        return [f"Unable to fetch tree suggestions ({exc})"]
+    return [f"Tree suggestion service failed: {exc}"]
+
+def _cached(ai_cache: Optional[AICache], key: str, bypass: bool, fn: Callable[..., Any], *args: Any) -> Any:
+    if ai_cache is None:
+        return fn(*args)
+    value, _ = ai_cache.get_or_compute(key, lambda: fn(*args), bypass=bypass)
+    return value
+
+def greenery_cache_key(image_part: Optional[Dict[str, str]], metadata_for_ai: Dict[str, Any]) -> str:
+    return make_key(
+        "greenery", ai_services.GEMINI_MODEL, ai_services.GREENERY_PROMPT_VERSION,
+        image=(image_part or {}).get("data"), metadata=metadata_for_ai,
+    )
+
+def trees_cache_key(metadata_for_ai: Dict[str, Any]) -> str:
+    return make_key("trees", ai_services.PERPLEXITY_MODEL, ai_services.TREES_PROMPT_VERSION, metadata=metadata_for_ai)
+
+def analysis_key(metadata: Dict[str, Any], image_part: Optional[Dict[str, str]], fast: bool = False) -> str:
+    """Identity of one whole analysis: what it sends upstream and every model and prompt version.
+
+    That is the uploaded image or, without one, the ward's static map request (its
+    image store alias covers the centre, zoom and boundary path), plus the
+    ``utils.build_ai_metadata`` the prompts are built from.
+    """
+    static_map = None
+    if image_part is None:
+        try:
+            _, _, static_map = utils._static_map_request(metadata)
+        except (RuntimeError, ValueError):
+            # No map can be requested; every such analysis of the ward reports the same image error.
+            pass
+    return make_key(
+        "analysis",
+        f"{'local' if fast else ai_services.GEMINI_MODEL}+{ai_services.PERPLEXITY_MODEL}",
+        f"{ai_services.GREENERY_PROMPT_VERSION}+{ai_services.TREES_PROMPT_VERSION}",
+        metadata=utils.build_ai_metadata(metadata), image=(image_part or {}).get("data"), static_map=static_map,
+    )
+
+# The parts of ``input_fingerprint``, in order.
+INPUT_PARTS = ("static_map", "metadata", "prompts")
+
+def input_fingerprint(static_map: Optional[bytes], metadata_for_ai: Dict[str, Any], fast: bool = False) -> str:
+    """What a ward's analysis depends on, as ``<static map>.<metadata>.<prompts>`` digests.
+
+    ``static_map`` is the image from ``utils.fetch_static_map_image`` (None when it
+    could not be fetched) and ``metadata_for_ai`` the ``utils.build_ai_metadata``
+    output. Analyses with equal fingerprints send the same requests upstream.
+    """
+    prompts = f"{'local' if fast else ai_services.GEMINI_MODEL}:{ai_services.prompt_fingerprint()}"
+    return ".".join(
+        content_hash(part)[:16] if part is not None else "none"
+        for part in (static_map, metadata_for_ai, prompts)
+    )
+
+def changed_inputs(previous: Optional[str], current: str) -> List[str]:
+    """The ``INPUT_PARTS`` that differ between two fingerprints; all of them when ``previous`` is missing or malformed."""
+    old, new = str(previous or "").split("."), current.split(".")
+    if len(old) != len(INPUT_PARTS):
+        return list(INPUT_PARTS)
+    return [part for part, before, after in zip(INPUT_PARTS, old, new) if before != after]
+
+def score_locally(metadata: Dict[str, Any], image_part: Optional[Dict[str, str]], from_static_map: bool, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The ``vegetation`` estimate for the analysis image, or None when disabled or the image cannot be scored.
+
+    A static map is scored inside the ward only, an uploaded image as a whole.
+    """
+    if image_part is None or not config.get("LOCAL_GREENERY_ENABLED", True):
+        return None
+    try:
+        image_bytes = base64.b64decode(image_part["data"])
+        if from_static_map:
+            return vegetation.score_image(image_bytes, metadata.get("ward_geojson"), utils.static_map_view(metadata))
+        return vegetation.score_image(image_bytes)
+    except Exception as exc:
+        current_app.logger.warning("Local greenery estimate failed: %s", exc)
+        return None
+
+def _local_preview(local: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if local is None:
+        return None
+    return {"preliminary_greenery": {key: local[key] for key in ("greenery_score", "vegetation_ratio", "masked")}}
+
+def _checked_greenery(greenery: Dict[str, Any], local: Optional[Dict[str, Any]], fast: bool, config: Dict[str, Any]) -> Dict[str, Any]:
+    if not fast:
+        greenery = vegetation.check_model_score(greenery, local, float(config.get("GREENERY_SCORE_TOLERANCE", 25)))
+    if local is not None:
+        greenery = {**greenery, "local_estimate": local}
+    return greenery
+
+# The stages before and after the upstream fan-out, shared by the asyncio and thread pool paths.
+
+def _image_fields(image_token: Optional[str], image_mime: Optional[str], image_stats: Optional[Dict[str, Any]], image_error: Optional[str] = None) -> Dict[str, Any]:
+    return {"image_token": image_token, "image_mime": image_mime, "image_error": image_error, "image_stats": image_stats}
+
+def _encode_static_map(static_image: bytes) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    image_part, image_token, image_mime, image_stats = utils.encode_image_bytes(static_image, "image/png")
+    return image_part, _image_fields(image_token, image_mime, image_stats)
+
+def _static_map_failed(exc: Exception) -> Dict[str, Any]:
+    current_app.logger.warning("Static map generation failed: %s", exc, exc_info=True)
+    return _image_fields(None, None, None, "Satellite preview unavailable; proceeding with metadata-only analysis.")
+
+def _prepare_stages(
+    metadata: Dict[str, Any], image_part: Optional[Dict[str, str]], from_static_map: bool, config: Dict[str, Any],
+    fast: bool, report: ProgressCallback,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Score the image locally (reported as a preview) and build the AI metadata.
+
+    Returns ``(metadata_for_ai, local, local_greenery)``; ``local_greenery`` is the
+    greenery result that replaces Gemini's in fast mode, None otherwise.
+    """
+    local = score_locally(metadata, image_part, from_static_map, config)
+    metadata_for_ai = utils.build_ai_metadata(metadata)
+    report("greenery", 30, _local_preview(local))
+    local_greenery = vegetation.as_greenery(local, metadata_for_ai) if fast and local is not None else None
+    return metadata_for_ai, local, local_greenery
+
+def _analysis_result(
+    metadata: Dict[str, Any], image: Dict[str, Any], greenery: Dict[str, Any], trees: List[str], stage_timings: Dict[str, float],
+    local: Optional[Dict[str, Any]], local_greenery: Optional[Dict[str, Any]], static_map_ms: Optional[float], config: Dict[str, Any],
+) -> Dict[str, Any]:
+    greenery = _checked_greenery(greenery, local, local_greenery is not None, config)
+    if static_map_ms is not None:
+        stage_timings["static_map"] = static_map_ms
+    if local is not None:
+        stage_timings["local_greenery"] = local["ms"]
+    return {"metadata": utils.sanitize_metadata(metadata), "greenery": greenery, "trees": trees, **image, "stage_timings": stage_timings}
+
+def run_greenery_and_trees(
+    image_part: Optional[Dict[str, str]], metadata_for_ai: Dict[str, Any], config: Dict[str, Any],
+    ai_cache: Optional[AICache] = None, bypass_cache: bool = False, report_progress: Optional[ProgressCallback] = None,
+    local_greenery: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], List[str], Dict[str, float]]:
+    """Fan out the Gemini greenery call and the Perplexity tree call in parallel.
+
+    Returns ``(greenery, trees, timings)`` where timings holds the wall time of each
+    branch in milliseconds. A greenery failure or timeout is raised; a tree failure
+    degrades to a placeholder list as before. Successful results go through
+    ``ai_cache`` when one is given. With ``local_greenery`` (fast mode) that is the
+    greenery result and Gemini is not called.
+    """
+    executor = get_executor(config.get("AI_EXECUTOR_MAX_WORKERS", 64))
+    greenery_timeout = _stage_timeout(float(config.get("GREENERY_TIMEOUT_SECONDS", 120)))
+    trees_timeout = _stage_timeout(float(config.get("TREES_TIMEOUT_SECONDS", 60)))
+    timings: Dict[str, float] = {}
+    greenery_clock, trees_clock = _stage_clock(), _stage_clock()
+
+    # Each branch runs in a copy of this context so it keeps the latency budget.
+    started = time.perf_counter()
+    if local_greenery is not None:
+        greenery_future = executor.submit(_timed, timings, "greenery", greenery_clock, lambda: local_greenery)
+    else:
+        greenery_future = executor.submit(
+            contextvars.copy_context().run, _timed, timings, "greenery", greenery_clock, _cached, ai_cache, greenery_cache_key(image_part, metadata_for_ai), bypass_cache,
+            ai_services.call_gemini_for_greenery, image_part, metadata_for_ai, config["GEMINI_API_KEY"],
+        )
+    trees_future = executor.submit(
+        contextvars.copy_context().run, _timed, timings, "trees", trees_clock, _cached, ai_cache, trees_cache_key(metadata_for_ai), bypass_cache,
+        ai_services.suggest_trees_via_perplexity, metadata_for_ai, config["PERPLEXITY_API_KEY"],
+        config.get("PERPLEXITY_BASE_URL", ai_services.PERPLEXITY_BASE_URL),
+    )
+
+    try:
+        greenery = _stage_result(greenery_future, greenery_clock, greenery_timeout)
+    except FutureTimeout:
+        greenery_future.cancel()
+        timings.setdefault("greenery", round(greenery_timeout * 1000, 1))
+        raise TimeoutError(f"Gemini greenery analysis timed out after {greenery_timeout:g}s")
+    if report_progress:
+        report_progress("trees" if not trees_future.done() else "finalizing", 80)
+
+    try:
+        trees = _stage_result(trees_future, trees_clock, trees_timeout)
+    except FutureTimeout:
+        trees_future.cancel()
+        timings.setdefault("trees", round(trees_timeout * 1000, 1))
+        trees = [f"Tree suggestion service timed out after {trees_timeout:g}s"]
+    except Exception as exc:
+        trees = tree_placeholder(exc)
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    return greenery, trees, timings
+
+async def _timed_async(timings: Dict[str, float], name: str, coro: Awaitable[Any]) -> Any:
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+async def _cached_async(ai_cache: Optional[AICache], key: str, bypass: bool, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+    # SQLite lookups and writes go through worker threads so they never block the loop.
+    if ai_cache is not None and not bypass:
+        found, value = await asyncio.to_thread(ai_cache.get, key)
+        if found:
+            return value
+    value = await fn(*args)
+    if ai_cache is not None:
+        await asyncio.to_thread(ai_cache.set, key, value)
+    return value
+
+async def _ready(value: Any) -> Any:
+    return value
+
+async def run_greenery_and_trees_async(
+    image_part: Optional[Dict[str, str]], metadata_for_ai: Dict[str, Any], config: Dict[str, Any],
+    ai_cache: Optional[AICache] = None, bypass_cache: bool = False, report_progress: Optional[ProgressCallback] = None,
+    local_greenery: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], List[str], Dict[str, float]]:
+    """``run_greenery_and_trees`` on the ``aio`` loop: both calls are tasks, not threads.
+
+    Same timeouts and degradation rules; a branch that times out is cancelled so it
+    releases its provider slot, and the tree call is cancelled if greenery fails.
+    """
+    greenery_timeout = _stage_timeout(float(config.get("GREENERY_TIMEOUT_SECONDS", 120)))
+    trees_timeout = _stage_timeout(float(config.get("TREES_TIMEOUT_SECONDS", 60)))
+    timings: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    greenery_task = asyncio.ensure_future(_timed_async(timings, "greenery", _ready(local_greenery) if local_greenery is not None else _cached_async(
+        ai_cache, greenery_cache_key(image_part, metadata_for_ai), bypass_cache,
+        ai_services.call_gemini_for_greenery_async, image_part, metadata_for_ai, config["GEMINI_API_KEY"],
+    )))
+    trees_task = asyncio.ensure_future(_timed_async(timings, "trees", _cached_async(
+        ai_cache, trees_cache_key(metadata_for_ai), bypass_cache,
+        ai_services.suggest_trees_via_perplexity_async, metadata_for_ai, config["PERPLEXITY_API_KEY"],
+        config.get("PERPLEXITY_BASE_URL", ai_services.PERPLEXITY_BASE_URL),
+    )))
+
+    try:
+        greenery = await asyncio.wait_for(greenery_task, _remaining(started + greenery_timeout))
+    except asyncio.TimeoutError:
+        trees_task.cancel()
+        # The cancelled call cannot report its own timeout to the breaker.
+        resilience.get_breaker("gemini").record_failure()
+        timings.setdefault("greenery", round(greenery_timeout * 1000, 1))
+        raise TimeoutError(f"Gemini greenery analysis timed out after {greenery_timeout:g}s")
+    except BaseException:
+        trees_task.cancel()
+        raise
+    if report_progress:
+        await asyncio.to_thread(report_progress, "trees" if not trees_task.done() else "finalizing", 80)
+
+    try:
+        trees = await asyncio.wait_for(trees_task, _remaining(started + trees_timeout))
+    except asyncio.TimeoutError:
+        resilience.get_breaker("perplexity").record_failure()
+        timings.setdefault("trees", round(trees_timeout * 1000, 1))
+        trees = [f"Tree suggestion service timed out after {trees_timeout:g}s"]
+    except Exception as exc:
+        trees = tree_placeholder(exc)
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    return greenery, trees, timings
+
+async def analyze_ward_async(
+    metadata: Dict[str, Any], image_part: Optional[Dict[str, str]], image_token: Optional[str], image_mime: Optional[str],
+    config: Dict[str, Any], ai_cache: Optional[AICache] = None, bypass_cache: bool = False,
+    report_progress: Optional[ProgressCallback] = None, image_stats: Optional[Dict[str, Any]] = None, fast: bool = False,
+) -> Dict[str, Any]:
+    """Coroutine form of ``analyze_ward``; run it on the ``aio`` loop inside an app context."""
+    report = report_progress or (lambda *args: None)
+    image = _image_fields(image_token, image_mime, image_stats)
+    static_map_ms = None
+    if image_part is None:
+        await asyncio.to_thread(report, "static_map", 10)
+        started = time.perf_counter()
+        try:
+            static_image = await utils.fetch_static_map_image_async(metadata)
+            image_part, image = await asyncio.to_thread(_encode_static_map, static_image)
+        except Exception as exc:
+            image = _static_map_failed(exc)
+        static_map_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    metadata_for_ai, local, local_greenery = await asyncio.to_thread(
+        _prepare_stages, metadata, image_part, static_map_ms is not None, config, fast, report,
+    )
+    greenery, trees, stage_timings = await run_greenery_and_trees_async(
+        image_part, metadata_for_ai, config, ai_cache=ai_cache, bypass_cache=bypass_cache, report_progress=report,
+        local_greenery=local_greenery,
+    )
+    return _analysis_result(metadata, image, greenery, trees, stage_timings, local, local_greenery, static_map_ms, config)
+
+async def in_app_context(app, coro: Awaitable[Any]) -> Any:
+    """Await ``coro`` with ``app``'s context pushed in the current task."""
+    with app.app_context():
+        return await coro
+
+def analyze_ward(
+    metadata: Dict[str, Any], image_part: Optional[Dict[str, str]], image_token: Optional[str], image_mime: Optional[str],
+    config: Dict[str, Any], ai_cache: Optional[AICache] = None, bypass_cache: bool = False,
+    report_progress: Optional[ProgressCallback] = None, image_stats: Optional[Dict[str, Any]] = None, fast: bool = False,
+) -> Dict[str, Any]:
+    """Run every /analyze stage for one ward: static map (when no image was uploaded), then greenery and trees.
+
+    Needs an app context. Returns the record stored in the session as ``analysis``
+    plus ``stage_timings``; raises if the greenery analysis fails. Every upstream
+    call shares one ``REQUEST_BUDGET_SECONDS`` latency budget (see ``resilience``). With
+    ``AIO_PIPELINE_ENABLED`` the stages run as tasks on the shared ``aio`` loop and
+    this thread only waits for the result. An identical analysis already running in
+    any worker is waited for instead of repeated (see ``singleflight``); cache
+    bypasses always run their own.
+
+    The image is also scored locally (``vegetation``) in a few milliseconds: the
+    estimate is reported as a preview, checks the scale of Gemini's score and, with
+    ``fast`` (or ``GREENERY_FAST_MODE``), replaces the Gemini call altogether.
+    """
+    fast = bool(fast or config.get("GREENERY_FAST_MODE", False))
+
+    def compute() -> Dict[str, Any]:
+        if config.get("AIO_PIPELINE_ENABLED", True):
+            return aio.run(resilience.bind(in_app_context(current_app._get_current_object(), analyze_ward_async(
+                metadata, image_part, image_token, image_mime, config,
+                ai_cache=ai_cache, bypass_cache=bypass_cache, report_progress=report_progress, image_stats=image_stats, fast=fast,
+            ))))
+        return _analyze_ward_threaded(
+            metadata, image_part, image_token, image_mime, config,
+            ai_cache=ai_cache, bypass_cache=bypass_cache, report_progress=report_progress, image_stats=image_stats, fast=fast,
+        )
+
+    flights = None if bypass_cache else singleflight.get_singleflight()
+    with resilience.budget(config.get("REQUEST_BUDGET_SECONDS")):
+        if flights is None:
+            result = compute()
+        else:
+            started = time.perf_counter()
+            on_wait = (lambda: report_progress("greenery", 30)) if report_progress else None
+            result, role = flights.run(analysis_key(metadata, image_part, fast), compute, on_wait=on_wait)
+            if role != "leader":
+                # The leader's stage timings describe its work, not this request's wait.
+                waited_ms = round((time.perf_counter() - started) * 1000, 1)
+                result["stage_timings"] = {"coalesced": waited_ms, "total": waited_ms}
+                providers = ("perplexity",) if fast else ("gemini", "perplexity")
+                singleflight.record_saved_calls(role, providers if image_part else ("static_maps",) + providers)
+    metrics.observe_stages(result["stage_timings"], prefix="analysis_")
+    return result
+
+def _analyze_ward_threaded(
+    metadata: Dict[str, Any], image_part: Optional[Dict[str, str]], image_token: Optional[str], image_mime: Optional[str],
+    config: Dict[str, Any], ai_cache: Optional[AICache] = None, bypass_cache: bool = False,
+    report_progress: Optional[ProgressCallback] = None, image_stats: Optional[Dict[str, Any]] = None, fast: bool = False,
+) -> Dict[str, Any]:
+    """``analyze_ward`` on the bounded thread pool (``AIO_PIPELINE_ENABLED=false``)."""
+    report = report_progress or (lambda *args: None)
+    image = _image_fields(image_token, image_mime, image_stats)
+    static_map_ms = None
+    if image_part is None:
+        report("static_map", 10)
+        started = time.perf_counter()
+        try:
+            image_part, image = _encode_static_map(utils.fetch_static_map_image(metadata))
+        except Exception as exc:
+            image = _static_map_failed(exc)
+        static_map_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    metadata_for_ai, local, local_greenery = _prepare_stages(metadata, image_part, static_map_ms is not None, config, fast, report)
+    greenery, trees, stage_timings = run_greenery_and_trees(
+        image_part, metadata_for_ai, config, ai_cache=ai_cache, bypass_cache=bypass_cache, report_progress=report,
+        local_greenery=local_greenery,
+    )
+    return _analysis_result(metadata, image, greenery, trees, stage_timings, local, local_greenery, static_map_ms, config)
+
+def run_analysis_job(payload: Dict[str, Any], report_progress: ProgressCallback) -> Dict[str, Any]:
+    """Job handler for queued /analyze requests (see ``jobs.register_handler``).
+
+    Jobs share the worker's admission slots with synchronous requests and wait
+    their turn rather than being turned away. The uploaded image's reference,
+    taken when the job was queued, is released once the job finishes or fails;
+    a missing upload fails the job rather than analyzing without it.
+    """
+    image_token = payload.get("image_token")
+    image_mime = payload.get("image_mime")
+    try:
+        image_part = utils.load_image_part(image_token, image_mime) if image_token else None
+        if image_token and image_part is None:
+            raise ValueError("The uploaded image is no longer available; upload it again.")
+        with admission.admit(timeout=None):
+            return analyze_ward(
+                payload.get("metadata") or {},
+                image_part,
+                image_token,
+                image_mime,
+                current_app.config,
+                ai_cache=get_ai_cache(),
+                bypass_cache=bool(payload.get("bypass_cache")),
+                report_progress=report_progress,
+                image_stats=payload.get("image_stats"),
+                fast=bool(payload.get("fast")),
+            )
+    finally:
+        utils.release_analysis_image(image_token)
@@ -0,0 +1,175 @@
+"""Upstream request quotas shared by every worker process.
+
+Each provider with a ``<PROVIDER>_RPM`` quota gets a token bucket in
+``instance/ratelimit.sqlite3``: it refills at the quota's rate, holds up to
+``RATE_LIMIT_BURST_SECONDS`` worth of tokens, and every call to the provider
+takes one in a short ``BEGIN IMMEDIATE`` transaction, so all gunicorn workers
+draw from the same bucket. A caller that finds it empty sleeps until a token is
+due, or gives up with ``DeadlineExceeded`` if that is past its latency budget;
+the upstream never sees the request that would have been answered with 429.
+
+Work runs at a priority (``interactive`` by default, ``background`` for bulk
+jobs). Background callers leave ``RATE_LIMIT_INTERACTIVE_RESERVE`` of each
+bucket untouched, so a burst of bulk work cannot starve users.
+"""
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+import metrics
+import resilience
+
+PROVIDERS = ("gemini", "perplexity", "static_maps")
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_settings: Dict[str, Any] = {"rates": {}, "burst_seconds": 10.0, "reserve": 0.25, "db_path": None}
+_priority: "contextvars.ContextVar[str]" = contextvars.ContextVar("work_priority", default=INTERACTIVE)
+resilience.propagate(_priority)
+
+def configure(config: Dict[str, Any], instance_path: str) -> None:
+    _settings.update({
+        "rates": {provider: float(config.get(f"{provider.upper()}_RPM", 0) or 0) / 60 for provider in PROVIDERS},
+        "burst_seconds": float(config.get("RATE_LIMIT_BURST_SECONDS", 10)),
+        "reserve": float(config.get("RATE_LIMIT_INTERACTIVE_RESERVE", 0.25)),
+        "db_path": Path(instance_path) / "ratelimit.sqlite3",
+    })
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Run the block (and the upstream calls it makes) at ``name`` priority."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> str:
+    return _priority.get()
+
+class TokenBuckets:
+    """One refilling token bucket per provider, in a SQLite file shared by all processes."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (provider TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, provider: str, rate: float, capacity: float, keep: float = 0.0) -> float:
+        """Take a token if more than ``keep`` would remain; else return the seconds until one will."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE provider = ?", (provider,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1 + keep:
+                tokens -= 1
+            else:
+                wait = (1 + keep - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (provider, tokens, updated_at) VALUES (?, ?, ?)", (provider, tokens, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def levels(self, rates: Dict[str, float], burst_seconds: float) -> Dict[str, float]:
+        """Tokens in each bucket right now, refill included."""
+        now = time.time()
+        levels = {}
+        for provider, tokens, updated_at in self._connect().execute("SELECT provider, tokens, updated_at FROM buckets"):
+            rate = rates.get(provider) or 0
+            if rate > 0:
+                levels[provider] = round(min(max(1.0, rate * burst_seconds), tokens + max(0.0, now - updated_at) * rate), 2)
+        return levels
+
+_buckets: Optional[TokenBuckets] = None
+_buckets_pid: Optional[int] = None
+_buckets_lock = threading.Lock()
+
+def get_buckets() -> Optional[TokenBuckets]:
+    """This process's handle on the shared buckets, or None before ``configure``."""
+    global _buckets, _buckets_pid
+    if _settings["db_path"] is None:
+        return None
+    if _buckets is None or _buckets_pid != os.getpid():
+        with _buckets_lock:
+            if _buckets is None or _buckets_pid != os.getpid():
+                _buckets, _buckets_pid = TokenBuckets(_settings["db_path"]), os.getpid()
+    return _buckets
+
+def _next_wait(provider: str) -> float:
+    """Take a token for ``provider`` (0.0) or return how long to sleep before asking again."""
+    rate = _settings["rates"].get(provider) or 0
+    buckets = get_buckets()
+    if rate <= 0 or buckets is None:
+        return 0.0
+    # Don't spend a token, or sleep for one, on a call the breaker would reject anyway.
+    resilience.check(provider)
+    capacity = max(1.0, rate * _settings["burst_seconds"])
+    # A bucket too small to hold a token on top of the reserve would never serve background work at all.
+    keep = max(0.0, min(capacity * _settings["reserve"], capacity - 1)) if current_priority() == BACKGROUND else 0.0
+    try:
+        wait = buckets.take(provider, rate, capacity, keep)
+    except sqlite3.Error:
+        # An unreadable bucket must not stop traffic; the provider's own 429s still apply.
+        return 0.0
+    left = resilience.remaining()
+    if wait > 0 and left is not None and wait >= left:
+        raise resilience.DeadlineExceeded(f"{provider} quota: next request slot in {wait:.1f}s is past the latency budget")
+    return wait
+
+def wait(provider: str) -> None:
+    """Block until this process may send one request to ``provider`` under the shared quota."""
+    if not _settings["rates"].get(provider):
+        return
+    started = time.perf_counter()
+    while True:
+        delay = _next_wait(provider)
+        if not delay:
+            break
+        time.sleep(delay)
+    metrics.RATE_LIMIT_WAIT_SECONDS.labels(provider, current_priority()).observe(time.perf_counter() - started)
+
+async def wait_async(provider: str) -> None:
+    """``wait`` for coroutines on the ``aio`` loop; the SQLite transaction runs on a worker thread."""
+    if not _settings["rates"].get(provider):
+        return
+    started = time.perf_counter()
+    while True:
+        delay = await asyncio.to_thread(_next_wait, provider)
+        if not delay:
+            break
+        await asyncio.sleep(delay)
+    metrics.RATE_LIMIT_WAIT_SECONDS.labels(provider, current_priority()).observe(time.perf_counter() - started)
+
+def stats() -> Dict[str, Any]:
+    buckets = get_buckets() if any(_settings["rates"].values()) else None
+    try:
+        levels = buckets.levels(_settings["rates"], _settings["burst_seconds"]) if buckets is not None else {}
+    except sqlite3.Error:
+        levels = {}
+    return {
+        "requests_per_minute": {provider: round(rate * 60, 1) for provider, rate in _settings["rates"].items() if rate > 0},
+        "tokens": levels,
+    }
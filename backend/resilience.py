@@ -0,0 +1,260 @@
+"""Latency budgets, hedged requests and circuit breakers for upstream calls.
+
+A budget (``REQUEST_BUDGET_SECONDS``) is set when an analysis or recommendation
+starts and travels with the work in a context variable: asyncio tasks and
+``asyncio.to_thread`` inherit it, ``bind`` carries it onto the ``aio`` loop, and
+every upstream call asks ``timeout(cap)`` for the time it may take.
+
+Each provider has a ``CircuitBreaker`` per worker process. After
+``BREAKER_FAILURE_THRESHOLD`` consecutive failures it opens and calls fail at
+once with ``CircuitOpenError`` for ``BREAKER_RESET_SECONDS``; then one trial call
+is let through, and its outcome closes or reopens the breaker. Callers turn the
+error into their degraded modes (metadata-only greenery, placeholder trees).
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+import metrics
+
+T = TypeVar("T")
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    "failure_threshold": 5,
+    "reset_seconds": 30.0,
+}
+
+_settings: Dict[str, Any] = dict(DEFAULT_SETTINGS)
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("upstream_deadline", default=None)
+# Context variables that ``bind`` carries onto the aio loop along with the deadline.
+_propagated: List[contextvars.ContextVar] = [_deadline]
+
+class DeadlineExceeded(TimeoutError):
+    """The request's latency budget ran out before an upstream call could start."""
+
+class CircuitOpenError(RuntimeError):
+    """The provider's breaker is open; the call was not attempted."""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} is temporarily unavailable (circuit open, next attempt in {retry_in:.0f}s)")
+        self.provider = provider
+        self.retry_in = retry_in
+
+def configure(config: Dict[str, Any]) -> None:
+    _settings.update({
+        "failure_threshold": int(config.get("BREAKER_FAILURE_THRESHOLD", DEFAULT_SETTINGS["failure_threshold"])),
+        "reset_seconds": float(config.get("BREAKER_RESET_SECONDS", DEFAULT_SETTINGS["reset_seconds"])),
+    })
+
+@contextmanager
+def budget(seconds: Optional[float]) -> Iterator[None]:
+    """Limit everything inside the block to ``seconds``; a tighter enclosing budget still wins."""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + float(seconds)
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def timeout(cap: float) -> float:
+    """The timeout for an upstream call: ``cap`` or what is left of the budget, whichever is less."""
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("Request latency budget exhausted")
+    return min(cap, left)
+
+def fits(seconds: float) -> bool:
+    """Whether waiting ``seconds`` (e.g. a retry backoff) still leaves part of the budget."""
+    left = remaining()
+    return left is None or seconds < left
+
+def propagate(var: contextvars.ContextVar) -> None:
+    """Have ``bind`` carry ``var`` too (e.g. the rate limiter's work priority)."""
+    _propagated.append(var)
+
+async def _bound(values: List[Tuple[contextvars.ContextVar, Any]], coro: Awaitable[T]) -> T:
+    tokens = [(var, var.set(value)) for var, value in values]
+    try:
+        return await coro
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def bind(coro: Awaitable[T]) -> Awaitable[T]:
+    """Wrap ``coro`` so it runs under the caller's budget (and priority) on another thread (``aio.run``)."""
+    return _bound([(var, var.get()) for var in _propagated], coro)
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        # google.api_core errors carry the HTTP status as ``code``.
+        status = getattr(exc, "code", None)
+    return status if isinstance(status, int) else None
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """Outages, timeouts, throttling and 5xx count against a provider; our own bad requests,
+    unusable content and cancellations (a hedge that lost, a caller that gave up) do not."""
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit, KeyboardInterrupt, CircuitOpenError, DeadlineExceeded)):
+        return False
+    status = _status_code(exc)
+    if status is not None and 400 <= status < 500 and status not in (408, 429):
+        return False
+    return not isinstance(exc, ValueError)
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed, open for ``reset_seconds``, then half-open for one trial call."""
+
+    def __init__(self, provider: str, failure_threshold: int, reset_seconds: float):
+        self.provider = provider
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.BREAKER_OPEN.labels(self.provider).set(1 if state == "open" else 0)
+
+    def before_call(self) -> bool:
+        """Raise ``CircuitOpenError`` if the call may not go ahead; return True for the half-open trial."""
+        with self._lock:
+            if self.state == "open":
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_seconds:
+                    self._reject(self.reset_seconds - waited)
+                self._set_state("half_open")
+            if self.state == "half_open":
+                if self.trial_in_flight:
+                    self._reject(self.reset_seconds)
+                self.trial_in_flight = True
+                self.stats["calls"] += 1
+                return True
+            self.stats["calls"] += 1
+            return False
+
+    def check(self) -> None:
+        """Raise ``CircuitOpenError`` while open, without claiming the half-open trial or counting a call."""
+        with self._lock:
+            if self.state == "open":
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_seconds:
+                    self._reject(self.reset_seconds - waited)
+
+    def _reject(self, retry_in: float) -> None:
+        self.stats["rejected"] += 1
+        metrics.BREAKER_REJECTIONS.labels(self.provider).inc()
+        raise CircuitOpenError(self.provider, retry_in)
+
+    def record(self, trial: bool, exc: Optional[BaseException]) -> None:
+        with self._lock:
+            if trial:
+                self.trial_in_flight = False
+            if exc is not None and is_provider_failure(exc):
+                self.stats["failures"] += 1
+                self.failures += 1
+                if trial or self.failures >= self.failure_threshold:
+                    self._set_state("open")
+                    self.opened_at = time.monotonic()
+                    self.stats["opened"] += 1
+            elif exc is None:
+                self.failures = 0
+                if self.state != "closed":
+                    self._set_state("closed")
+            # A neutral outcome (cancelled, our own bad request) proves nothing either way.
+
+    def record_failure(self) -> None:
+        """Count a failure observed by the caller, e.g. a stage timeout that cancelled the call."""
+        self.record(False, TimeoutError(f"{self.provider} call timed out"))
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        trial = self.before_call()
+        try:
+            yield
+        except BaseException as exc:
+            self.record(trial, exc)
+            raise
+        self.record(trial, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)) if self.state == "open" else None
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+                **self.stats,
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_pid: Optional[int] = None
+_breakers_lock = threading.Lock()
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """This worker process's breaker for ``provider``."""
+    global _breakers_pid
+    pid = os.getpid()
+    with _breakers_lock:
+        if _breakers_pid != pid:
+            _breakers.clear()
+            _breakers_pid = pid
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider, _settings["failure_threshold"], _settings["reset_seconds"])
+        return breaker
+
+def guard(provider: str):
+    """``with resilience.guard("gemini"): ...`` runs the block through the provider's breaker."""
+    return get_breaker(provider).guard()
+
+def check(provider: str) -> None:
+    """Fail fast if ``provider``'s breaker is open, e.g. before waiting for a quota token."""
+    get_breaker(provider).check()
+
+def breaker_states() -> Dict[str, Any]:
+    with _breakers_lock:
+        breakers = dict(_breakers) if _breakers_pid == os.getpid() else {}
+    return {"pid": os.getpid(), "breakers": {provider: breaker.snapshot() for provider, breaker in sorted(breakers.items())}}
+
+async def hedge(attempt: Callable[[], Awaitable[T]], delay: float, provider: str) -> T:
+    """Await ``attempt()``; if it is still running after ``delay`` seconds, start a second copy
+    and return whichever succeeds first, cancelling the other. Only for idempotent calls."""
+    tasks = [asyncio.ensure_future(attempt())]
+    try:
+        if delay <= 0 or (await asyncio.wait(tasks, timeout=delay))[0]:
+            return await tasks[0]
+        tasks.append(asyncio.ensure_future(attempt()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.HEDGED_REQUESTS.labels(provider, "hedge" if task is tasks[1] else "primary").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -2,14 +2,17 @@ import mimetypes
 
 import json
 from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for, send_file, abort, make_response, send_from_directory, jsonify
-import ai_services, utils
-import requests
+import time
+import admission, ai_clients, ai_services, aio, cache, http_client, image_prep, jobs, metrics, pipeline, ratelimit, resilience, session_store, singleflight, spatial_index, static_assets, text_pipeline, topology, utils, wards
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route("/", methods=["GET"])
 def home():
-    response = send_file("../index.html")
+    if current_app.config.get("STATIC_ASSETS_ENABLED", True):
+        response = make_response(static_assets.render_index(static_assets.FRONTEND_ROOT / "index.html"))
+    else:
+        response = send_file("../index.html")
     # Ensure no caching for the main page
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
@@ -36,14 +39,23 @@ def analyze():
     image_part = None
     image_token = None
     image_mime = None
+    image_stats = None
 
     try:
         if request.is_json:
             payload = request.get_json(silent=True) or {}
+            ward_id = payload.get("ward_id")
             metadata = payload.get("metadata", {}) or {}
+            fast = bool(payload.get("fast"))
+            priority = payload.get("priority") or ratelimit.INTERACTIVE
+            if priority not in jobs.PRIORITY_RANKS:
+                return utils.respond_error(f"priority must be one of: {', '.join(jobs.PRIORITY_RANKS)}")
         else:
+            priority = ratelimit.INTERACTIVE
+            ward_id = request.form.get("ward_id")
+            fast = request.form.get("fast", "").strip().lower() in {"1", "true", "yes", "on"}
             metadata_raw = request.form.get("metadata_json", "")
-            if metadata_raw:
+            if metadata_raw and not ward_id:
                 try:
                     metadata = json.loads(metadata_raw)
                 except json.JSONDecodeError:
@@ -61,9 +73,18 @@ def analyze():
                 )
                 if not utils.allowed_file(image_file.filename):
                     return utils.respond_error("Unsupported file type. Upload PNG, JPG, JPEG, or WEBP.")
-                image_part, image_token, image_mime = utils.prepare_image_for_analysis(image_file)
+                try:
+                    with metrics.stage("image_prep"):
+                        image_part, image_token, image_mime, image_stats = utils.prepare_image_for_analysis(image_file)
+                except image_prep.ImagePrepError as exc:
+                    return utils.respond_error(str(exc))
+
+        if ward_id:
+            # Geometry and population come from the server-side registry, not the client.
+            metadata = wards.get_ward_registry().analysis_metadata(ward_id)
+            if metadata is None:
+                return utils.respond_error(f"Unknown ward id: {ward_id}", 404)
 
-        image_error = None
         if metadata:
             current_app.logger.info(
                 "Metadata parsed",
@@ -79,100 +100,200 @@ def analyze():
         else:
             current_app.logger.warning("Metadata missing from request")
 
-        if image_part is None:
-            if not metadata:
-                return utils.respond_error("Ward metadata is required for analysis.")
-            try:
-                static_image = utils.fetch_static_map_image(metadata)
-            except Exception as exc:
-                current_app.logger.warning("Static map generation failed: %s", exc, exc_info=True)
-                image_part = None
-                image_token = None
-                image_mime = None
-                image_error = "Satellite preview unavailable; proceeding with metadata-only analysis."
-            else:
-                image_part, image_token, image_mime = utils.encode_image_bytes(static_image, "image/png")
+        if image_part is None and not metadata:
+            return utils.respond_error("Ward metadata is required for analysis.")
 
-        metadata_for_ai = utils.build_ai_metadata(metadata)
+        bypass_cache = cache.bypass_requested()
+        if utils.wants_json_response() and current_app.config.get("ASYNC_JOBS_ENABLED", True):
+            job_queue = jobs.get_job_queue()
+            try:
+                admission.check_job_backlog(job_queue, priority)
+            except admission.Rejected as exc:
+                return admission.too_busy(exc)
+            # The queued job holds its own reference, so the sweeper keeps the upload however long the job waits.
+            utils.retain_analysis_image(image_token)
+            try:
+                job_id = job_queue.enqueue({
+                    "metadata": metadata,
+                    "image_token": image_token,
+                    "image_mime": image_mime,
+                    "image_stats": image_stats,
+                    "bypass_cache": bypass_cache,
+                    "fast": fast,
+                }, priority=priority)
+            except Exception:
+                utils.release_analysis_image(image_token)
+                raise
+            session["jobs"] = (session.get("jobs") or [])[-4:] + [job_id]
+            return {
+                "job_id": job_id,
+                "status_url": url_for("main.job_status", job_id=job_id),
+                "events_url": url_for("main.job_events", job_id=job_id),
+            }, 202
 
         try:
-            greenery = ai_services.call_gemini_for_greenery(image_part, metadata_for_ai, current_app.config["GEMINI_API_KEY"])
+            with admission.admit():
+                result = pipeline.analyze_ward(
+                    metadata,
+                    image_part,
+                    image_token,
+                    image_mime,
+                    current_app.config,
+                    ai_cache=cache.get_ai_cache(),
+                    bypass_cache=bypass_cache,
+                    image_stats=image_stats,
+                    fast=fast,
+                )
+        except admission.Rejected as exc:
+            return admission.too_busy(exc)
         except Exception as exc:
             return utils.respond_error(f"Analysis failed: {exc}", 500)
+        stage_timings = result.pop("stage_timings")
+        current_app.logger.info("Analysis stages finished", extra={"stage_timings_ms": stage_timings})
+        metrics.add_server_timing(stage_timings, prefix="analysis_")
 
-        try:
-            trees = ai_services.suggest_trees_via_perplexity(metadata_for_ai, current_app.config["PERPLEXITY_API_KEY"])
-        except requests.HTTPError as http_err:
-            trees = [f"Unable to fetch tree suggestions ({http_err})"]
-        except Exception as exc:
-            trees = [f"Tree suggestion service failed: {exc}"]
-
-        previous_analysis = session.get("analysis") or {}
-        if previous_analysis.get("image_token") and previous_analysis.get("image_token") != image_token:
-            utils.delete_analysis_image(previous_analysis.get("image_token"))
-
-        metadata_for_session = utils.sanitize_metadata(metadata)
-
-        session["analysis"] = {
-            "metadata": metadata_for_session,
-            "greenery": greenery,
-            "trees": trees,
-            "recommendations": None,
-            "recommendations_html": None,
-            "image_token": image_token,
-            "image_mime": image_mime,
-            "image_error": image_error,
-        }
-        wants_json = utils.wants_json_response()
-
-        if wants_json:
-            return {"redirect_url": url_for("main.latest_analysis")}
-
-        image_url = url_for("main.analysis_image", token=image_token) if image_token else None
-        trees_sanitized = [utils.strip_reference_citations(t) for t in trees]
-        trees_normalized = [utils.normalize_tree_bold_markdown(t) for t in trees_sanitized]
-        trees_html = [utils.render_markdown_html(t) for t in trees_normalized]
-        return render_template(
-            "results.html",
-            metadata=metadata_for_session,
-            greenery=greenery,
-            tree_suggestions=trees_normalized,
-            tree_suggestions_html=trees_html,
-            recommendations=None,
-            recommendations_html=None,
-            construction_type=None,
-            image_url=image_url,
-            image_error=image_error,
-            back_to_map_url=current_app.config["FRONTEND_ORIGIN"] or url_for("main.home"),
-        )
+        with metrics.stage("store"):
+            analysis = _store_analysis(result)
+
+        if utils.wants_json_response():
+            return {"redirect_url": url_for("main.latest_analysis"), "stage_timings_ms": stage_timings, "image_stats": analysis["image_stats"]}
+
+        return _render_results(analysis)
 
     except Exception as exc:
         current_app.logger.exception("Unexpected error in /analyze: %s", exc)
         error_response = make_response((json.dumps({"error": str(exc)}), 500, {"Content-Type": "application/json"}))
         return error_response
 
-@main_bp.route("/analysis/latest", methods=["GET"])
-def latest_analysis():
-    analysis = session.get("analysis")
-    if not analysis:
-        flash("Please upload a ward before viewing results.", "error")
-        return redirect(url_for("main.home"))
-
+def _store_analysis(result):
+    """Make ``result`` (from ``pipeline.analyze_ward``) the session's current analysis."""
+    previous_analysis = session.get("analysis") or {}
+    if previous_analysis.get("image_token") != result.get("image_token"):
+        utils.retain_analysis_image(result.get("image_token"))
+        utils.release_analysis_image(previous_analysis.get("image_token"))
+
+    session["analysis"] = {
+        "metadata": result["metadata"],
+        "greenery": result["greenery"],
+        "trees": result["trees"],
+        "recommendations": None,
+        "recommendations_html": None,
+        "image_token": result.get("image_token"),
+        "image_mime": result.get("image_mime"),
+        "image_error": result.get("image_error"),
+        "image_stats": result.get("image_stats"),
+    }
+    text_pipeline.process_analysis(session["analysis"])
+    return session["analysis"]
+
+def _render_results(analysis):
+    with metrics.stage("render"):
+        return _render_results_page(analysis)
+
+def _render_results_page(analysis):
+    trees_display, trees_html = analysis.get("trees_display"), analysis.get("trees_html")
+    if trees_html is None:
+        # Analyses stored before the text pipeline ran on arrival.
+        trees_display, trees_html = text_pipeline.process_trees(analysis.get("trees") or [])
+    tree_grid_html = text_pipeline.memoize_fragment(
+        "tree_grid", [trees_display, trees_html],
+        lambda: render_template("_tree_grid.html", tree_suggestions=trees_display, tree_suggestions_html=trees_html),
+    )
     return render_template(
         "results.html",
         metadata=analysis["metadata"],
         greenery=analysis["greenery"],
-        tree_suggestions=analysis["trees"],
-        tree_suggestions_html=[utils.render_markdown_html(utils.normalize_tree_bold_markdown(utils.strip_reference_citations(t))) for t in (analysis.get("trees") or [])],
+        tree_grid_html=tree_grid_html,
         recommendations=analysis.get("recommendations"),
-        recommendations_html=analysis.get("recommendations_html") or utils.render_markdown_html(analysis.get("recommendations")),
+        recommendations_html=analysis.get("recommendations_html") or text_pipeline.render_markdown_html(analysis.get("recommendations")),
         construction_type=analysis.get("construction_type"),
+        recommend_stream_url=_recommend_stream_url(),
         image_url=url_for("main.analysis_image", token=analysis.get("image_token")) if analysis.get("image_token") else None,
         image_error=analysis.get("image_error"),
         back_to_map_url=current_app.config["FRONTEND_ORIGIN"] or url_for("main.home"),
     )
 
-from pathlib import Path
+def _owned_job(job_id: str):
+    if job_id not in (session.get("jobs") or []):
+        abort(404)
+    job = jobs.get_job_queue().get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+def _job_state(job):
+    state = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+    }
+    if job["preview"]:
+        state.update(job["preview"])
+    if job["status"] == "done":
+        state["redirect_url"] = url_for("main.open_job_result", job_id=job["id"])
+        state["stage_timings_ms"] = (job["result"] or {}).get("stage_timings")
+        state["image_stats"] = (job["result"] or {}).get("image_stats")
+    elif job["status"] == "failed":
+        state["error"] = job["error"]
+    return state
+
+@main_bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str):
+    state = _job_state(_owned_job(job_id))
+    metrics.add_server_timing(state.get("stage_timings_ms") or {}, prefix="analysis_")
+    return state
+
+@main_bp.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id: str):
+    _owned_job(job_id)
+    queue = jobs.get_job_queue()
+    poll_interval = float(current_app.config.get("JOB_POLL_INTERVAL_SECONDS", 0.5))
+    # Resolve URLs up front: the generator runs after the request context is gone.
+    open_url = url_for("main.open_job_result", job_id=job_id)
+
+    def stream():
+        last = None
+        while True:
+            job = queue.get(job_id)
+            if job is None:
+                yield "event: error\ndata: {}\n\n"
+                return
+            state = {"job_id": job_id, "status": job["status"], "stage": job["stage"], "progress": job["progress"], **(job["preview"] or {})}
+            if job["status"] == "done":
+                state["redirect_url"] = open_url
+            elif job["status"] == "failed":
+                state["error"] = job["error"]
+            if state != last:
+                yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+                last = state
+            if job["status"] in ("done", "failed"):
+                return
+            time.sleep(poll_interval)
+
+    response = current_app.response_class(stream(), mimetype="text/event-stream")
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@main_bp.route("/jobs/<job_id>/open", methods=["GET"])
+def open_job_result(job_id: str):
+    job = _owned_job(job_id)
+    if job["status"] != "done":
+        flash(job.get("error") or "Analysis is still running.", "error")
+        return redirect(url_for("main.home"))
+    if session.get("analysis_job") != job_id:
+        _store_analysis(job["result"])
+        session["analysis_job"] = job_id
+    return redirect(url_for("main.latest_analysis"))
+
+@main_bp.route("/analysis/latest", methods=["GET"])
+def latest_analysis():
+    analysis = session.get("analysis")
+    if not analysis:
+        flash("Please upload a ward before viewing results.", "error")
+        return redirect(url_for("main.home"))
+
+    return _render_results(analysis)
 
 @main_bp.route("/analysis/image/<token>", methods=["GET"])
 def analysis_image(token: str):
@@ -180,8 +301,8 @@ def analysis_image(token: str):
     if analysis.get("image_token") != token:
         abort(404)
 
-    path = Path(current_app.instance_path) / "analysis_images" / token
-    if not path.exists():
+    path = utils.analysis_image_path(token)
+    if path is None or not path.exists():
         abort(404)
 
     mime_type = analysis.get("image_mime") or mimetypes.guess_type(str(path))[0] or "image/png"
@@ -200,70 +321,279 @@ def recommend():
         flash("Tell us what type of construction you're planning.", "error")
         return redirect(url_for("main.home"))
 
+    def generate():
+        args = (analysis["metadata"], analysis["greenery"], analysis["trees"], construction_type, current_app.config["GEMINI_API_KEY"])
+        # Only a cache miss needs an admission slot.
+        with admission.admit(), resilience.budget(current_app.config.get("REQUEST_BUDGET_SECONDS")):
+            if current_app.config.get("AIO_PIPELINE_ENABLED", True):
+                return aio.run(resilience.bind(ai_services.generate_construction_recommendations_async(*args)))
+            return ai_services.generate_construction_recommendations(*args)
+
     try:
-        recommendations = ai_services.generate_construction_recommendations(
-            analysis["metadata"],
-            analysis["greenery"],
-            analysis["trees"],
-            construction_type,
-            current_app.config["GEMINI_API_KEY"],
-        )
+        ai_cache = cache.get_ai_cache()
+        with metrics.stage("recommendations"):
+            if ai_cache is None:
+                recommendations = generate()
+            else:
+                recommendations, _ = ai_cache.get_or_compute(_recommendation_cache_key(analysis, construction_type), generate, bypass=cache.bypass_requested())
+    except admission.Rejected as exc:
+        return admission.too_busy(exc)
     except Exception as exc:
         flash(f"Failed to generate recommendations: {exc}", "error")
         return redirect(url_for("main.home"))
 
     session["analysis"]["recommendations"] = recommendations
-    session["analysis"]["recommendations_html"] = utils.render_markdown_html(recommendations)
+    session["analysis"]["recommendations_html"] = text_pipeline.render_markdown_html(recommendations)
     session["analysis"]["construction_type"] = construction_type
     session.modified = True
+    return _render_results(session["analysis"])
 
-    return render_template(
-        "results.html",
+def _recommendation_cache_key(analysis, construction_type: str) -> str:
+    return cache.make_key(
+        "recommendations",
+        ai_services.GEMINI_MODEL,
+        ai_services.RECOMMENDATION_PROMPT_VERSION,
         metadata=analysis["metadata"],
         greenery=analysis["greenery"],
-        tree_suggestions=analysis["trees"],
-        recommendations=recommendations,
-        recommendations_html=session["analysis"]["recommendations_html"],
-        construction_type=construction_type,
-        image_url=url_for("main.analysis_image", token=analysis.get("image_token")) if analysis.get("image_token") else None,
-        image_error=analysis.get("image_error"),
-        back_to_map_url=current_app.config["FRONTEND_ORIGIN"] or url_for("main.home"),
+        trees=analysis["trees"],
+        construction_type=" ".join(construction_type.lower().split()),
     )
 
+def _recommend_stream_url():
+    # The streamed text is saved after the headers are sent, which only a server-side session allows.
+    if not current_app.config.get("RECOMMEND_STREAMING_ENABLED", True):
+        return None
+    if not isinstance(current_app.session_interface, session_store.ServerSessionInterface):
+        return None
+    return url_for("main.recommend_stream")
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@main_bp.route("/recommend/stream", methods=["POST"])
+def recommend_stream():
+    if _recommend_stream_url() is None:
+        abort(404)
+    construction_type = request.form.get("construction_type", "").strip()
+    analysis = session.get("analysis")
+    if not analysis:
+        return jsonify({"error": "Please analyze a ward before requesting recommendations."}), 400
+    if not construction_type:
+        return jsonify({"error": "Tell us what type of construction you're planning."}), 400
+
+    # Everything the generator needs is captured now: it runs after the request context is gone.
+    interface = current_app.session_interface
+    sid = session.sid
+    image_token = analysis.get("image_token")
+    api_key = current_app.config["GEMINI_API_KEY"]
+    logger = current_app.logger
+    budget_seconds = current_app.config.get("REQUEST_BUDGET_SECONDS")
+    ai_cache = cache.get_ai_cache()
+    cache_key = _recommendation_cache_key(analysis, construction_type)
+    cached = None
+    if ai_cache is not None and not cache.bypass_requested():
+        hit, value = ai_cache.get(cache_key)
+        cached = value if hit else None
+
+    def save(recommendations: str, html) -> None:
+        def mutate(data) -> bool:
+            current = data.get("analysis")
+            # Leave the session alone if another ward was analyzed while this one streamed.
+            if not current or current.get("image_token") != image_token or current.get("metadata") != analysis["metadata"]:
+                return False
+            current["recommendations"] = recommendations
+            current["recommendations_html"] = html
+            current["construction_type"] = construction_type
+            return True
+        interface.update(sid, mutate)
+
+    def stream():
+        if cached is not None:
+            html = text_pipeline.render_markdown_html(cached)
+            yield _sse("chunk", {"text": cached, "html": html})
+            save(cached, html)
+            yield _sse("done", {"text": cached, "html": html, "cached": True})
+            return
+        parts = []
+        try:
+            with resilience.budget(budget_seconds):
+                for text in ai_services.stream_construction_recommendations(
+                    analysis["metadata"], analysis["greenery"], analysis["trees"], construction_type, api_key,
+                ):
+                    parts.append(text)
+                    yield _sse("chunk", {"text": text, "html": text_pipeline.render_markdown_html("".join(parts), memoize=False)})
+            recommendations = "".join(parts).strip()
+            if not recommendations:
+                raise ValueError("Gemini returned no recommendation text")
+        except Exception as exc:
+            logger.warning("Streaming recommendations failed: %s", exc)
+            yield _sse("error", {"error": f"Failed to generate recommendations: {exc}"})
+            return
+        html = text_pipeline.render_markdown_html(recommendations)
+        if ai_cache is not None:
+            ai_cache.set(cache_key, recommendations)
+        save(recommendations, html)
+        yield _sse("done", {"text": recommendations, "html": html, "cached": False})
+
+    response = current_app.response_class(stream(), mimetype="text/event-stream")
+    if cached is None:
+        # Generating holds an admission slot until the server closes the stream.
+        queue = admission.get_admission_queue()
+        try:
+            queue.acquire()
+        except admission.Rejected as exc:
+            return admission.too_busy(exc)
+        response.call_on_close(queue.release)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 @main_bp.route("/upload", methods=["GET"])
 def upload_page():
     return render_template("upload.html")
 
-@main_bp.route("/js/<path:path>")
-def serve_js(path):
-    response = send_from_directory("../js", path)
-    # Prevent caching of JavaScript files
+def _send_static(root: str, path: str):
+    if current_app.config.get("STATIC_ASSETS_ENABLED", True):
+        response = static_assets.send_asset(root, path)
+        if response is not None:
+            return response
+    response = send_from_directory(f"../{root}", path)
+    # Without the asset pipeline, prevent caching of JS and CSS files
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
+@main_bp.route("/js/<path:path>")
+def serve_js(path):
+    return _send_static("js", path)
+
 @main_bp.route("/favicon.ico")
 def favicon():
     return send_from_directory("..", "favicon.ico", mimetype="image/vnd.microsoft.icon")
 
 @main_bp.route("/css/<path:path>")
 def serve_css(path):
-    response = send_from_directory("../css", path)
-    # Prevent caching of CSS files
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return _send_static("css", path)
 
 @main_bp.route("/data/<path:path>")
 def serve_data(path):
-    return send_from_directory("../js", path)
+    return _send_static("js", path)
 
 @main_bp.route("/health", methods=["GET"])
 def health_check():
     return {"status": "ok"}
 
+@main_bp.route("/api/wards", methods=["GET"])
+def list_wards():
+    registry = wards.get_ward_registry()
+    response = make_response(registry.summary_json)
+    response.mimetype = "application/json"
+    response.set_etag(registry.etag)
+    return utils.allow_caching(response.make_conditional(request), max_age=3600)
+
+@main_bp.route("/api/wards/at", methods=["GET", "POST"])
+def wards_at():
+    index = spatial_index.get_spatial_index()
+    registry = wards.get_ward_registry()
+    if request.method == "POST":
+        points = (request.get_json(silent=True) or {}).get("points") or []
+        try:
+            lats = [float(point[0]) for point in points]
+            lngs = [float(point[1]) for point in points]
+        except (TypeError, ValueError, IndexError):
+            return {"error": "points must be a list of [lat, lng] pairs."}, 400
+        found = index.locate(lats, lngs, spatial_index.WARD)
+        return {"wards": [index.keys[i] if i >= 0 else None for i in found.tolist()]}
+    try:
+        lat = float(request.args["lat"])
+        lng = float(request.args["lng"])
+    except (KeyError, ValueError):
+        return {"error": "lat and lng query parameters are required."}, 400
+    ward_idx = int(index.locate([lat], [lng], spatial_index.WARD)[0])
+    district_idx = int(index.locate([lat], [lng], spatial_index.DISTRICT)[0])
+    return {
+        "ward": registry.summary(index.keys[ward_idx]) if ward_idx >= 0 else None,
+        "district": index.keys[district_idx] if district_idx >= 0 else None,
+    }
+
+@main_bp.route("/api/wards/in", methods=["GET"])
+def wards_in():
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in request.args["bbox"].split(","))
+    except (KeyError, ValueError):
+        return {"error": "bbox must be min_lng,min_lat,max_lng,max_lat."}, 400
+    index = spatial_index.get_spatial_index()
+    registry = wards.get_ward_registry()
+    ward_hits = index.intersecting(min_lng, min_lat, max_lng, max_lat, spatial_index.WARD)
+    district_hits = index.intersecting(min_lng, min_lat, max_lng, max_lat, spatial_index.DISTRICT)
+    return {
+        "wards": [registry.summary(index.keys[i]) for i in ward_hits],
+        "districts": [index.keys[i] for i in district_hits],
+    }
+
+@main_bp.route("/api/topology", methods=["GET"])
+def ward_topology():
+    """Ward and district boundaries as quantized TopoJSON for ``zoom``, optionally only those crossing ``bbox``."""
+    try:
+        zoom = float(request.args["zoom"]) if "zoom" in request.args else None
+        bbox = [float(v) for v in request.args["bbox"].split(",")] if "bbox" in request.args else None
+    except ValueError:
+        return {"error": "zoom must be a number and bbox must be min_lng,min_lat,max_lng,max_lat."}, 400
+    if bbox is not None and len(bbox) != 4:
+        return {"error": "bbox must be min_lng,min_lat,max_lng,max_lat."}, 400
+    layers = [layer for layer in request.args.get("layers", ",".join(topology.LAYERS)).split(",") if layer]
+    if not layers or any(layer not in topology.LAYERS for layer in layers):
+        return {"error": f"layers must be a comma-separated subset of {', '.join(topology.LAYERS)}."}, 400
+
+    topo = topology.get_topology()
+    level = topo.level_for_zoom(zoom)
+    body, compressed = topo.encoded(level, layers, bbox)
+    use_gzip = bool(request.accept_encodings["gzip"])
+    response = make_response(compressed if use_gzip else body)
+    response.mimetype = "application/json"
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    variant = f"{level}:{','.join(layers)}:{','.join(map(str, bbox)) if bbox else ''}"
+    response.set_etag(f"{topo.etag}-{cache.content_hash(variant)[:12]}{'-gz' if use_gzip else ''}")
+    return utils.allow_caching(response.make_conditional(request), max_age=3600)
+
+@main_bp.route("/api/wards/<ward_id>", methods=["GET"])
+def ward_detail(ward_id: str):
+    registry = wards.get_ward_registry()
+    ward = registry.get(ward_id)
+    if ward is None:
+        abort(404)
+    response = jsonify({**registry.summary(ward["ward_id"]), "boundary": ward["boundary"]})
+    response.set_etag(f"{registry.etag}-{ward['ward_id']}")
+    return utils.allow_caching(response.make_conditional(request), max_age=3600)
+
+@main_bp.route("/api/http/stats", methods=["GET"])
+def http_stats():
+    stats = http_client.get_http_client().stats()
+    stats["async"] = http_client.async_stats()
+    stats["aio"] = aio.stats()
+    stats["ai_clients"] = ai_clients.stats()
+    flights = singleflight.get_singleflight()
+    stats["singleflight"] = dict(flights.stats) if flights is not None else None
+    stats["admission"] = admission.get_admission_queue().snapshot()
+    stats["admission"]["queued_jobs"] = jobs.get_job_queue().depth()
+    stats["rate_limits"] = ratelimit.stats()
+    return jsonify(stats)
+
+@main_bp.route("/api/http/breakers", methods=["GET"])
+def circuit_breakers():
+    # Breakers are per worker process; this shows the one that served the request.
+    return jsonify(resilience.breaker_states())
+
+@main_bp.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    if not current_app.config.get("METRICS_ENABLED", True):
+        abort(404)
+    body, content_type = metrics.render()
+    return current_app.response_class(body, content_type=content_type)
+
 @main_bp.route('/api/maps/sdk_url')
 def get_maps_sdk_url():
     api_key = current_app.config.get("GOOGLE_MAPS_API_KEY")
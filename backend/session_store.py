@@ -0,0 +1,330 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+
+_COMPRESS_MIN_BYTES = 512
+
+def encode_session(data: Dict[str, Any]) -> bytes:
+    """Compact JSON, zlib-compressed once it is large enough to be worth it."""
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) >= _COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+def decode_session(blob: bytes) -> Dict[str, Any]:
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(raw.decode("utf-8"))
+
+class SessionStore:
+    """Backend interface for ``ServerSessionInterface``: one encoded record per session id."""
+
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return ``(data, expires_at)`` for a live session, or None."""
+        raise NotImplementedError
+
+    def save(self, sid: str, data: Dict[str, Any], expires_at: float) -> None:
+        raise NotImplementedError
+
+    def touch(self, sid: str, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, sid: str) -> Optional[Dict[str, Any]]:
+        """Delete a session and return the data it held, or None if there was none."""
+        raise NotImplementedError
+
+    def purge(self) -> List[Dict[str, Any]]:
+        """Delete expired sessions and return their data so callers can release what they held."""
+        raise NotImplementedError
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in ``instance/sessions.sqlite3``; every lookup is a primary-key read.
+
+    The database is memory-mapped (``PRAGMA mmap_size``) so hot rows are served from
+    the page cache shared by all workers.
+    """
+
+    def __init__(self, db_path: Path, mmap_bytes: int = 64 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.mmap_bytes = int(mmap_bytes)
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions(expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        row = self._connect().execute(
+            "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return decode_session(row[0]), row[1]
+        except (ValueError, zlib.error):
+            return None
+
+    def save(self, sid: str, data: Dict[str, Any], expires_at: float) -> None:
+        self._connect().execute(
+            "INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (sid, encode_session(data), expires_at),
+        )
+
+    def touch(self, sid: str, expires_at: float) -> None:
+        self._connect().execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (expires_at, sid))
+
+    def delete(self, sid: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        try:
+            return decode_session(row[0]) if row is not None else None
+        except (ValueError, zlib.error):
+            return None
+
+    def purge(self) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        now = time.time()
+        rows = conn.execute("SELECT sid, data FROM sessions WHERE expires_at <= ?", (now,)).fetchall()
+        expired = []
+        for sid, blob in rows:
+            conn.execute("DELETE FROM sessions WHERE sid = ? AND expires_at <= ?", (sid, now))
+            try:
+                expired.append(decode_session(blob))
+            except (ValueError, zlib.error):
+                continue
+        return expired
+
+class MemorySessionStore(SessionStore):
+    """Per-process store for development and tests; sessions do not survive restarts or span workers."""
+
+    def __init__(self):
+        self._rows: Dict[str, Tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        with self._lock:
+            row = self._rows.get(sid)
+        if row is None or row[1] <= time.time():
+            return None
+        return decode_session(row[0]), row[1]
+
+    def save(self, sid: str, data: Dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            self._rows[sid] = (encode_session(data), expires_at)
+
+    def touch(self, sid: str, expires_at: float) -> None:
+        with self._lock:
+            if sid in self._rows:
+                self._rows[sid] = (self._rows[sid][0], expires_at)
+
+    def delete(self, sid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.pop(sid, None)
+        return decode_session(row[0]) if row is not None else None
+
+    def purge(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._rows.items() if expires_at <= now]
+            blobs = [self._rows.pop(sid)[0] for sid in expired]
+        return [decode_session(blob) for blob in blobs]
+
+class ServerSession(SessionMixin):
+    """Session whose contents live in a ``SessionStore``; only ``sid`` travels in the cookie.
+
+    The record is read on first access, so requests that never touch ``session``
+    (static files, health checks) cost no lookup.
+    """
+
+    def __init__(self, sid: str, store: SessionStore, new: bool = False):
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.expires_at: Optional[float] = None
+        self._store = store
+        self._data: Optional[Dict[str, Any]] = {} if new else None
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def _load(self) -> Dict[str, Any]:
+        self.accessed = True
+        if self._data is None:
+            record = self._store.load(self.sid)
+            if record is None:
+                # Unknown or expired id: start over under a fresh one rather than reusing it.
+                self.sid = secrets.token_urlsafe(32)
+                self._data = {}
+                self.new = True
+            else:
+                self._data, self.expires_at = record
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._load()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key: str) -> None:
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def clear(self) -> None:
+        self._data = {}
+        self.accessed = True
+        self.modified = True
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface that keeps session data in a ``SessionStore``.
+
+    The cookie holds a random session id signed with the app's secret key.
+    Sessions expire ``ttl_seconds`` after their last write; reads refresh the expiry
+    once more than half of it has elapsed. ``on_expire`` receives the data of every
+    purged or cleared session (used to release analysis images).
+    """
+
+    def __init__(self, store: SessionStore, ttl_seconds: float = 7 * 86400, purge_interval_seconds: float = 3600, on_expire: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.store = store
+        self.ttl_seconds = float(ttl_seconds)
+        self.purge_interval_seconds = float(purge_interval_seconds)
+        self.on_expire = on_expire
+        self._last_purge = time.time()
+        self._purge_lock = threading.Lock()
+
+    def _signer(self, app) -> Signer:
+        return Signer(app.secret_key, salt="server-session")
+
+    def open_session(self, app, request) -> Optional[ServerSession]:
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode("ascii")
+            except (BadSignature, UnicodeDecodeError):
+                sid = None
+            if sid:
+                return ServerSession(sid, self.store)
+        return ServerSession(secrets.token_urlsafe(32), self.store, new=True)
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        self._maybe_purge(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session.loaded:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if not session.new:
+                self._expire(app, self.store.delete(session.sid))
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if session.modified or session.new:
+            self.store.save(session.sid, dict(session), expires_at)
+        elif session.expires_at is not None and session.expires_at - time.time() < self.ttl_seconds / 2:
+            self.store.touch(session.sid, expires_at)
+        else:
+            return
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode("ascii")).decode("ascii"),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def update(self, sid: str, mutate: Callable[[Dict[str, Any]], bool]) -> bool:
+        """Apply ``mutate`` to a stored session outside of a request (e.g. from a streaming response).
+
+        ``mutate`` edits the data in place and returns False to leave the record untouched.
+        Returns whether the session was saved.
+        """
+        record = self.store.load(sid)
+        if record is None or not mutate(record[0]):
+            return False
+        self.store.save(sid, record[0], time.time() + self.ttl_seconds)
+        return True
+
+    def _maybe_purge(self, app) -> None:
+        if time.time() - self._last_purge < self.purge_interval_seconds or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_purge = time.time()
+            for data in self.store.purge():
+                if self.on_expire is not None:
+                    self.on_expire(data)
+        except Exception as exc:
+            app.logger.warning("Session purge failed: %s", exc)
+        finally:
+            self._purge_lock.release()
+
+    def _expire(self, app, data: Optional[Dict[str, Any]]) -> None:
+        """Hand a deleted session's data to ``on_expire``, as ``purge`` does for expired ones."""
+        if data is None or self.on_expire is None:
+            return
+        try:
+            self.on_expire(data)
+        except Exception as exc:
+            app.logger.warning("Releasing a cleared session failed: %s", exc)
+
+def build_session_interface(app, on_expire: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[ServerSessionInterface]:
+    """Session interface for ``SESSION_BACKEND`` (``sqlite`` or ``memory``); None keeps Flask's cookie sessions."""
+    backend = str(app.config.get("SESSION_BACKEND", "sqlite")).lower()
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        store: SessionStore = MemorySessionStore()
+    elif backend == "sqlite":
+        store = SQLiteSessionStore(Path(app.instance_path) / "sessions.sqlite3", mmap_bytes=app.config.get("SESSION_MMAP_BYTES", 64 * 1024 * 1024))
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
+    return ServerSessionInterface(
+        store,
+        ttl_seconds=app.config.get("SESSION_TTL_SECONDS", 7 * 86400),
+        purge_interval_seconds=app.config.get("SESSION_PURGE_INTERVAL_SECONDS", 3600),
+        on_expire=on_expire,
+    )
@@ -0,0 +1,222 @@
+"""Coalesce identical analyses that are in progress at the same time.
+
+When several users open the same ward at once, the first ``/analyze`` becomes
+the leader and makes the upstream calls; identical requests that arrive while
+it runs wait for its result instead. Within a worker process, followers wait on
+an event. Across gunicorn workers the leader holds a lease row in
+``instance/singleflight.sqlite3``, renewed by a heartbeat while it works, and
+publishes its result there; followers poll the row. If the leader's process
+dies, its lease runs out and the first follower to notice takes over.
+
+Only work that is running is shared: a request that arrives after the result
+was published runs again (and usually hits the AI cache).
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from flask import current_app
+import metrics
+import resilience
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Per-key leader election across threads (events) and processes (SQLite leases)."""
+
+    def __init__(self, db_path: Path, lease_seconds: float = 15, poll_interval: float = 0.1, retention_seconds: float = 300):
+        self.db_path = Path(db_path)
+        self.lease_seconds = float(lease_seconds)
+        self.poll_interval = float(poll_interval)
+        self.retention_seconds = float(retention_seconds)
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._finished_since_purge = 0
+        self.stats = {"leaders": 0, "local_followers": 0, "remote_followers": 0, "takeovers": 0}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS flights ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, lease_until REAL NOT NULL,"
+            " result TEXT, error TEXT, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def run(self, key: str, compute: Callable[[], Any], on_wait: Optional[Callable[[], None]] = None) -> Tuple[Any, str]:
+        """Return ``(value, role)``: ``compute()``'s result, or the identical flight's already in progress.
+
+        ``role`` is ``leader``, ``local`` (joined a flight in this process) or ``remote``
+        (another worker's). A leader's exception is raised in its followers too. Waiting
+        is bounded by the request's latency budget; ``on_wait`` is called once a follower
+        starts waiting. ``value`` must be JSON-serializable.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if on_wait:
+                on_wait()
+            left = resilience.remaining()
+            if not flight.done.wait(None if left is None else max(0.0, left)):
+                raise resilience.DeadlineExceeded("Timed out waiting for an identical analysis in progress")
+            if flight.error is not None:
+                raise flight.error
+            self.stats["local_followers"] += 1
+            return copy.deepcopy(flight.value), "local"
+        try:
+            flight.value, role = self._run_shared(key, compute, on_wait)
+            return copy.deepcopy(flight.value), role
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _run_shared(self, key: str, compute: Callable[[], Any], on_wait: Optional[Callable[[], None]]) -> Tuple[Any, str]:
+        owner = uuid.uuid4().hex
+        try:
+            while True:
+                claimed, current = self._claim(key, owner)
+                if claimed:
+                    break
+                if on_wait:
+                    on_wait()
+                    on_wait = None
+                outcome = self._wait(key, current)
+                if outcome is not None:
+                    status, result, error = outcome
+                    if status == "failed":
+                        raise RuntimeError(error)
+                    self.stats["remote_followers"] += 1
+                    return json.loads(result), "remote"
+                # The leader's lease ran out or its row was replaced: try to claim the key again.
+        except sqlite3.Error:
+            # Without the shared store, coalesce within this process only.
+            return compute(), "leader"
+
+        self.stats["leaders"] += 1
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(key, owner, stop), name="singleflight-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            value = compute()
+        except BaseException as exc:
+            stop.set()
+            self._finish(key, owner, "failed", None, str(exc) or type(exc).__name__)
+            raise
+        stop.set()
+        self._finish(key, owner, "done", json.dumps(value, separators=(",", ":")), None)
+        return value, "leader"
+
+    def _claim(self, key: str, owner: str) -> Tuple[bool, str]:
+        """Take the lease on ``key`` unless a live leader holds it; returns ``(claimed, holder)``."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, status, lease_until FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] == "running" and row[2] >= now:
+                conn.execute("COMMIT")
+                return False, row[0]
+            if row is not None and row[1] == "running":
+                self.stats["takeovers"] += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO flights (key, owner, status, lease_until, result, error, updated_at)"
+                " VALUES (?, ?, 'running', ?, NULL, NULL, ?)",
+                (key, owner, now + self.lease_seconds, now),
+            )
+            conn.execute("COMMIT")
+            return True, owner
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _wait(self, key: str, leader: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """Poll until ``leader`` publishes; None if its lease expires or another process takes over."""
+        conn = self._connect()
+        while True:
+            row = conn.execute("SELECT owner, status, lease_until, result, error FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] != leader:
+                return None
+            if row[1] != "running":
+                return row[1], row[3], row[4]
+            if row[2] < time.time():
+                return None
+            left = resilience.remaining()
+            if left is not None and left <= 0:
+                raise resilience.DeadlineExceeded("Timed out waiting for an identical analysis in progress")
+            time.sleep(self.poll_interval if left is None else min(self.poll_interval, left))
+
+    def _heartbeat(self, key: str, owner: str, stop: threading.Event) -> None:
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                self._connect().execute(
+                    "UPDATE flights SET lease_until = ?, updated_at = ? WHERE key = ? AND owner = ? AND status = 'running'",
+                    (time.time() + self.lease_seconds, time.time(), key, owner),
+                )
+            except sqlite3.Error:
+                pass
+
+    def _finish(self, key: str, owner: str, status: str, result: Optional[str], error: Optional[str]) -> None:
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE flights SET status = ?, result = ?, error = ?, updated_at = ? WHERE key = ? AND owner = ?",
+                (status, result, error, now, key, owner),
+            )
+            self._finished_since_purge += 1
+            if self._finished_since_purge >= 64:
+                self._finished_since_purge = 0
+                conn.execute("DELETE FROM flights WHERE status != 'running' AND updated_at < ?", (now - self.retention_seconds,))
+        except sqlite3.Error:
+            pass
+
+def record_saved_calls(role: str, providers) -> None:
+    """Count the upstream calls a follower did not make (``providers`` it would have called)."""
+    if role == "leader":
+        return
+    metrics.COALESCED_ANALYSES.labels(role).inc()
+    for provider in providers:
+        metrics.UPSTREAM_CALLS_SAVED.labels(provider).inc()
+
+_flights: Optional[SingleFlight] = None
+_flights_lock = threading.Lock()
+
+def get_singleflight() -> Optional[SingleFlight]:
+    """Return the process-wide coalescer for the current app, or None when disabled."""
+    global _flights
+    config = current_app.config
+    if not config.get("SINGLEFLIGHT_ENABLED", True):
+        return None
+    if _flights is None:
+        with _flights_lock:
+            if _flights is None:
+                _flights = SingleFlight(
+                    Path(current_app.instance_path) / "singleflight.sqlite3",
+                    lease_seconds=config.get("SINGLEFLIGHT_LEASE_SECONDS", 15),
+                    poll_interval=config.get("SINGLEFLIGHT_POLL_INTERVAL_SECONDS", 0.1),
+                )
+    return _flights
@@ -0,0 +1,205 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from flask import current_app
+import wards
+
+WARD = 0
+DISTRICT = 1
+_ARRAYS = ("poly_bbox", "poly_kind", "edge_start", "edges", "cell_start", "cell_polys", "grid")
+
+def _polygon_rings(geometry: Dict[str, Any]) -> List[Sequence[Sequence[float]]]:
+    gtype = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+    if gtype == "Polygon":
+        return list(coordinates)
+    if gtype == "MultiPolygon":
+        return [ring for polygon in coordinates for ring in polygon]
+    return []
+
+def build_arrays(polygons: List[Tuple[int, List[Sequence[Sequence[float]]]]], cells_per_axis: int = 64) -> Dict[str, np.ndarray]:
+    """Flatten polygons into edge arrays plus a uniform grid of candidate polygons per cell.
+
+    ``polygons`` is a list of ``(kind, rings)``; all rings of a polygon are tested
+    together with the even-odd rule, so holes need no special handling.
+    """
+    edges, edge_start, bboxes, kinds = [], [0], [], []
+    for kind, rings in polygons:
+        count = 0
+        for ring in rings:
+            pts = np.asarray(ring, dtype=float)[:, :2]
+            if len(pts) < 3:
+                continue
+            edges.append(np.hstack((pts, np.roll(pts, -1, axis=0))))
+            count += len(pts)
+        stacked = np.vstack([np.asarray(r, dtype=float)[:, :2] for r in rings])
+        bboxes.append((*stacked.min(axis=0), *stacked.max(axis=0)))
+        kinds.append(kind)
+        edge_start.append(edge_start[-1] + count)
+    poly_bbox = np.asarray(bboxes, dtype=float)
+    min_x, min_y = poly_bbox[:, 0].min(), poly_bbox[:, 1].min()
+    max_x, max_y = poly_bbox[:, 2].max(), poly_bbox[:, 3].max()
+    cell_w = (max_x - min_x) / cells_per_axis or 1.0
+    cell_h = (max_y - min_y) / cells_per_axis or 1.0
+
+    def cell_range(lo: float, hi: float, origin: float, size: float) -> range:
+        first = int(np.clip((lo - origin) // size, 0, cells_per_axis - 1))
+        last = int(np.clip((hi - origin) // size, 0, cells_per_axis - 1))
+        return range(first, last + 1)
+
+    buckets: List[List[int]] = [[] for _ in range(cells_per_axis * cells_per_axis)]
+    for index, (x0, y0, x1, y1) in enumerate(poly_bbox):
+        for cy in cell_range(y0, y1, min_y, cell_h):
+            for cx in cell_range(x0, x1, min_x, cell_w):
+                buckets[cy * cells_per_axis + cx].append(index)
+    cell_start = np.zeros(len(buckets) + 1, dtype=np.int64)
+    cell_start[1:] = np.cumsum([len(b) for b in buckets])
+    return {
+        "poly_bbox": poly_bbox,
+        "poly_kind": np.asarray(kinds, dtype=np.int8),
+        "edge_start": np.asarray(edge_start, dtype=np.int64),
+        "edges": np.vstack(edges),
+        "cell_start": cell_start,
+        "cell_polys": np.asarray([i for b in buckets for i in b], dtype=np.int32),
+        "grid": np.asarray([min_x, min_y, cell_w, cell_h, cells_per_axis], dtype=float),
+    }
+
+class SpatialIndex:
+    """Grid-bucketed point-in-polygon and viewport lookups over ward and district polygons."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], keys: List[str]):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.keys = keys
+        self._cells = int(self.grid[4])
+
+    def _cell_ids(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        min_x, min_y, cell_w, cell_h, cells = self.grid
+        cx = np.floor((xs - min_x) / cell_w).astype(np.int64)
+        cy = np.floor((ys - min_y) / cell_h).astype(np.int64)
+        inside = (cx >= 0) & (cx < cells) & (cy >= 0) & (cy < cells)
+        return np.where(inside, cy * int(cells) + cx, -1)
+
+    def _contains(self, poly: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        seg = self.edges[self.edge_start[poly]:self.edge_start[poly + 1]]
+        x1, y1, x2, y2 = seg[:, 0], seg[:, 1], seg[:, 2], seg[:, 3]
+        py = ys[:, None]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        crossings = straddles & (xs[:, None] < cross_x)
+        return (np.count_nonzero(crossings, axis=1) % 2) == 1
+
+    def locate(self, lats: Sequence[float], lngs: Sequence[float], kind: int = WARD) -> np.ndarray:
+        """Index of the polygon of ``kind`` containing each point, or -1."""
+        ys = np.asarray(lats, dtype=float).ravel()
+        xs = np.asarray(lngs, dtype=float).ravel()
+        result = np.full(len(xs), -1, dtype=np.int64)
+        cells = self._cell_ids(xs, ys)
+        valid = np.flatnonzero(cells >= 0)
+        if not len(valid):
+            return result
+        # Expand (point, candidate polygon) pairs, then test each polygon once against its points.
+        starts = self.cell_start[cells[valid]]
+        counts = self.cell_start[cells[valid] + 1] - starts
+        point_idx = np.repeat(valid, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        poly_idx = self.cell_polys[np.repeat(starts, counts) + offsets]
+        keep = self.poly_kind[poly_idx] == kind
+        point_idx, poly_idx = point_idx[keep], poly_idx[keep]
+        bbox = self.poly_bbox[poly_idx]
+        px, py = xs[point_idx], ys[point_idx]
+        keep = (px >= bbox[:, 0]) & (px <= bbox[:, 2]) & (py >= bbox[:, 1]) & (py <= bbox[:, 3])
+        point_idx, poly_idx = point_idx[keep], poly_idx[keep]
+        order = np.argsort(poly_idx, kind="stable")
+        point_idx, poly_idx = point_idx[order], poly_idx[order]
+        boundaries = np.flatnonzero(np.diff(poly_idx)) + 1
+        for points, polys in zip(np.split(point_idx, boundaries), np.split(poly_idx, boundaries)):
+            if not len(points):
+                continue
+            hits = points[self._contains(int(polys[0]), xs[points], ys[points])]
+            result[hits] = polys[0]
+        return result
+
+    def intersecting(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float, kind: int = WARD) -> List[int]:
+        """Polygons of ``kind`` that overlap the viewport rectangle."""
+        bbox = self.poly_bbox
+        candidates = np.flatnonzero(
+            (self.poly_kind == kind) & (bbox[:, 0] <= max_lng) & (bbox[:, 2] >= min_lng)
+            & (bbox[:, 1] <= max_lat) & (bbox[:, 3] >= min_lat)
+        )
+        corners_x = np.array([min_lng, max_lng, max_lng, min_lng])
+        corners_y = np.array([min_lat, min_lat, max_lat, max_lat])
+        rect = np.column_stack((corners_x, corners_y, np.roll(corners_x, -1), np.roll(corners_y, -1)))
+        found = []
+        for poly in candidates.tolist():
+            x0, y0, x1, y1 = self.poly_bbox[poly]
+            if x0 >= min_lng and x1 <= max_lng and y0 >= min_lat and y1 <= max_lat:
+                found.append(poly)
+                continue
+            seg = self.edges[self.edge_start[poly]:self.edge_start[poly + 1]]
+            vertex_inside = (seg[:, 0] >= min_lng) & (seg[:, 0] <= max_lng) & (seg[:, 1] >= min_lat) & (seg[:, 1] <= max_lat)
+            if vertex_inside.any() or self._contains(poly, corners_x, corners_y).any() or _segments_cross(seg, rect):
+                found.append(poly)
+        return found
+
+def _segments_cross(a: np.ndarray, b: np.ndarray) -> bool:
+    """Whether any segment in ``a`` properly crosses any segment in ``b`` (rows are x1, y1, x2, y2)."""
+    def orient(px, py, qx, qy, rx, ry):
+        return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+    ax1, ay1, ax2, ay2 = (a[:, i][:, None] for i in range(4))
+    bx1, by1, bx2, by2 = (b[:, i][None, :] for i in range(4))
+    d1 = orient(ax1, ay1, ax2, ay2, bx1, by1)
+    d2 = orient(ax1, ay1, ax2, ay2, bx2, by2)
+    d3 = orient(bx1, by1, bx2, by2, ax1, ay1)
+    d4 = orient(bx1, by1, bx2, by2, ax2, ay2)
+    return bool(((d1 * d2 < 0) & (d3 * d4 < 0)).any())
+
+def _registry_polygons(registry: "wards.WardRegistry") -> Tuple[List[Tuple[int, list]], List[str]]:
+    polygons, keys = [], []
+    for ward_id, ward in registry.wards.items():
+        polygons.append((WARD, _polygon_rings(ward["geometry"])))
+        keys.append(ward_id)
+    for district in registry.districts:
+        polygons.append((DISTRICT, district["rings"]))
+        keys.append(district["name"])
+    return polygons, keys
+
+def load_or_build(registry: "wards.WardRegistry", cache_dir: Path) -> SpatialIndex:
+    """Memory-map a previously built index for this registry version, building it if missing.
+
+    Every worker maps the same ``.npy`` files, so the arrays live once in the page cache.
+    """
+    target = Path(cache_dir) / registry.etag
+    if not (target / "keys.json").exists():
+        polygons, keys = _registry_polygons(registry)
+        arrays = build_arrays(polygons)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=target.parent, prefix=".build-"))
+        for name, array in arrays.items():
+            np.save(staging / f"{name}.npy", array)
+        (staging / "keys.json").write_text(json.dumps(keys), encoding="utf-8")
+        try:
+            os.replace(staging, target)
+        except OSError:
+            # Another worker published the same version first.
+            for leftover in staging.iterdir():
+                leftover.unlink()
+            staging.rmdir()
+    arrays = {name: np.load(target / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+    return SpatialIndex(arrays, json.loads((target / "keys.json").read_text(encoding="utf-8")))
+
+_index: Optional[SpatialIndex] = None
+_index_lock = threading.Lock()
+
+def get_spatial_index() -> SpatialIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_or_build(wards.get_ward_registry(), Path(current_app.instance_path) / "spatial_index")
+    return _index
@@ -0,0 +1,208 @@
+"""Fingerprinted, precompressed frontend assets.
+
+``build`` hashes every file under ``../js`` and ``../css`` and writes a copy named
+``<stem>.<hash><suffix>`` under ``instance/static_assets/``, with ``.gz`` and ``.br``
+variants for text files. Output is keyed by content hash, so unchanged files
+are never rewritten: the first worker (or ``python static_assets.py`` at deploy
+time) does the work and the others reuse it.
+
+JavaScript modules import each other by relative path; those imports are
+rewritten to the fingerprinted names, so a module's hash also covers what it
+imports and the whole graph can be cached as immutable.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from flask import current_app, request, send_file
+import utils
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+FRONTEND_ROOT = Path(__file__).resolve().parent.parent
+ROOTS = {"js": FRONTEND_ROOT / "js", "css": FRONTEND_ROOT / "css"}
+COMPRESSIBLE_SUFFIXES = {".js", ".mjs", ".css", ".json", ".geojson", ".csv", ".svg", ".txt", ".html"}
+MIN_COMPRESS_BYTES = 1024
+IMMUTABLE_MAX_AGE = 365 * 86400
+EXTRA_MIME_TYPES = {".geojson": "application/geo+json", ".js": "text/javascript", ".mjs": "text/javascript"}
+
+_JS_IMPORT = re.compile(r"""(\bfrom\s*|\bimport\s*\(?\s*)(["'])(\.{1,2}/[^"'\s]+?\.m?js)\2""")
+_HTML_ASSET_REF = re.compile(r"""\b(href|src)="/?((?:css|js)/[^"?#]+)(?:\?[^"]*)?\"""")
+
+class AssetManifest:
+    """Logical asset paths (``js/script.js``) mapped to their fingerprinted, precompressed copies."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.assets: Dict[str, Dict[str, Any]] = {}
+        self.fingerprinted: Dict[str, Dict[str, Any]] = {}
+
+    def url_for(self, logical_path: str) -> str:
+        logical_path = logical_path.lstrip("/")
+        asset = self.assets.get(logical_path)
+        return f"/{asset['url_path']}" if asset else f"/{logical_path}"
+
+    def lookup(self, root: str, path: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return ``(asset, immutable)``; fingerprinted names are immutable, logical names revalidate."""
+        key = f"{root}/{path}"
+        asset = self.fingerprinted.get(key)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(key), False
+
+def _write_once(path: Path, data: bytes) -> None:
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(data)
+    os.replace(tmp, path)
+
+def _mime_type(path: Path) -> str:
+    return EXTRA_MIME_TYPES.get(path.suffix.lower()) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+def build(output_dir: Path) -> AssetManifest:
+    manifest = AssetManifest(output_dir)
+    sources = {
+        f"{root}/{path.relative_to(directory).as_posix()}": path
+        for root, directory in ROOTS.items() if directory.is_dir()
+        for path in sorted(directory.rglob("*")) if path.is_file() and not path.name.startswith(".")
+    }
+    in_progress = set()
+
+    def process(logical: str) -> Dict[str, Any]:
+        if logical in manifest.assets:
+            return manifest.assets[logical]
+        in_progress.add(logical)
+        source = sources[logical]
+        data = source.read_bytes()
+        if source.suffix in (".js", ".mjs"):
+            data = _rewrite_imports(logical, data.decode("utf-8"), sources, in_progress, process).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        root, _, rel = logical.partition("/")
+        rel_path = Path(rel)
+        url_path = f"{root}/{rel_path.with_name(f'{rel_path.stem}.{digest}{rel_path.suffix}').as_posix()}"
+        output = manifest.output_dir / url_path
+        _write_once(output, data)
+        encodings: Dict[str, Path] = {}
+        if source.suffix.lower() in COMPRESSIBLE_SUFFIXES and len(data) >= MIN_COMPRESS_BYTES:
+            variants = [("gzip", ".gz", lambda raw: gzip.compress(raw, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ("br", ".br", lambda raw: brotli.compress(raw, quality=11)))
+            for encoding, suffix, compress in variants:
+                compressed_path = output.with_name(output.name + suffix)
+                if not compressed_path.exists():
+                    compressed = compress(data)
+                    if len(compressed) >= len(data):
+                        continue
+                    _write_once(compressed_path, compressed)
+                encodings[encoding] = compressed_path
+        asset = {"path": output, "url_path": url_path, "digest": digest, "mime": _mime_type(source), "size": len(data), "encodings": encodings}
+        manifest.assets[logical] = asset
+        manifest.fingerprinted[url_path] = asset
+        in_progress.discard(logical)
+        return asset
+
+    for logical in sources:
+        process(logical)
+    return manifest
+
+def _rewrite_imports(logical: str, text: str, sources: Dict[str, Path], in_progress, process) -> str:
+    base = Path(logical).parent
+
+    def replace(match: "re.Match[str]") -> str:
+        target = os.path.normpath((base / match.group(3)).as_posix()).replace(os.sep, "/")
+        if target not in sources or target in in_progress:
+            # Unknown file or an import cycle: leave the logical name, which still resolves.
+            return match.group(0)
+        fingerprinted = Path(process(target)["url_path"]).name
+        specifier = match.group(3).rsplit("/", 1)[0] + "/" + fingerprinted
+        return f"{match.group(1)}{match.group(2)}{specifier}{match.group(2)}"
+
+    return _JS_IMPORT.sub(replace, text)
+
+_manifest: Optional[AssetManifest] = None
+_manifest_lock = threading.Lock()
+_index_cache: Dict[str, Any] = {}
+
+def init_app(app) -> Optional[AssetManifest]:
+    """Build the manifest for ``app`` (with ``STATIC_ASSETS_ENABLED``) and expose ``asset_url()`` to templates."""
+    global _manifest
+    if not app.config.get("STATIC_ASSETS_ENABLED", True):
+        app.jinja_env.globals["asset_url"] = lambda logical_path: "/" + logical_path.lstrip("/")
+        return None
+    with _manifest_lock:
+        _manifest = build(Path(app.instance_path) / "static_assets")
+    app.jinja_env.globals["asset_url"] = lambda logical_path: get_manifest().url_for(logical_path)
+    return _manifest
+
+def get_manifest() -> AssetManifest:
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = build(Path(current_app.instance_path) / "static_assets")
+    return _manifest
+
+def _negotiate(asset: Dict[str, Any]) -> Tuple[Optional[str], Path]:
+    accepted = request.accept_encodings
+    for encoding in ("br", "gzip"):
+        if encoding in asset["encodings"] and accepted[encoding]:
+            return encoding, asset["encodings"][encoding]
+    return None, asset["path"]
+
+def send_asset(root: str, path: str):
+    """Serve ``root/path`` from the manifest, or return None if it is not a known asset.
+
+    Fingerprinted names are cached for a year as ``immutable``; logical names are
+    ``no-cache`` so browsers revalidate them with the ETag and get a 304.
+    """
+    asset, immutable = get_manifest().lookup(root, path)
+    if asset is None:
+        return None
+    encoding, file_path = _negotiate(asset)
+    response = send_file(
+        file_path,
+        mimetype=asset["mime"],
+        etag=f"{asset['digest']}-{encoding}" if encoding else asset["digest"],
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if immutable:
+        return utils.allow_caching(response, IMMUTABLE_MAX_AGE, immutable=True)
+    utils.allow_caching(response, 0).cache_control.no_cache = True
+    return response
+
+def render_index(index_path: Path) -> str:
+    """``index.html`` with its ``css/`` and ``js/`` references pointed at fingerprinted URLs."""
+    mtime = index_path.stat().st_mtime
+    if _index_cache.get("mtime") != mtime:
+        manifest = get_manifest()
+        html = index_path.read_text(encoding="utf-8")
+        _index_cache["html"] = _HTML_ASSET_REF.sub(lambda m: f'{m.group(1)}="{manifest.url_for(m.group(2))}"', html)
+        _index_cache["mtime"] = mtime
+    return _index_cache["html"]
+
+if __name__ == "__main__":
+    # Build at deploy time: `python static_assets.py [--output DIR]`; web workers then only hash and reuse.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress frontend assets.")
+    parser.add_argument("--output", type=Path, default=Path(__file__).resolve().parent / "instance" / "static_assets")
+    args = parser.parse_args()
+    built = build(args.output)
+    for logical, entry in sorted(built.assets.items()):
+        sizes = ", ".join(f"{encoding} {path.stat().st_size}" for encoding, path in entry["encodings"].items())
+        print(f"{logical} -> {entry['url_path']} ({entry['size']} bytes{'; ' + sizes if sizes else ''})")
@@ -0,0 +1,22 @@
+"""Shared fixtures. Run from ``backend/``: ``python -m pytest -q``."""
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture
+def api(tmp_path_factory, monkeypatch):
+    """The real app on a temporary instance folder, with no job workers to drain the queue."""
+    monkeypatch.setenv("INSTANCE_PATH", str(tmp_path_factory.mktemp("instance")))
+    for name, value in {
+        "GEMINI_API_KEY": "x", "PERPLEXITY_API_KEY": "x", "GOOGLE_MAPS_API_KEY": "x", "SECRET_KEY": "x",
+        "JOB_WORKER_THREADS": "0", "IMAGE_STORE_SWEEP_INTERVAL_SECONDS": "0", "AI_CLIENT_WARMUP": "false",
+    }.items():
+        monkeypatch.setenv(name, value)
+    import app as app_module
+    import image_store
+    import jobs
+    monkeypatch.setattr(jobs, "_queue", None)
+    monkeypatch.setattr(image_store, "_store", None)
+    return app_module.create_app().test_client()
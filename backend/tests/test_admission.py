@@ -0,0 +1,102 @@
+import threading
+import time
+import pytest
+from flask import Flask
+import admission
+import ratelimit
+
+def _waiter(queue, priority, admitted, timeout=5):
+    def run():
+        with queue.admit(priority, timeout=timeout):
+            admitted.append(priority)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def _wait_for(queue, waiting):
+    for _ in range(500):
+        if sum(queue.snapshot()["waiting"].values()) == waiting:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"never had {waiting} waiting")
+
+def test_interactive_work_is_admitted_before_earlier_background_work():
+    queue = admission.AdmissionQueue(max_active=1, max_waiting=8)
+    admitted = []
+    queue.acquire()
+    threads = []
+    for n, priority in enumerate((ratelimit.BACKGROUND, ratelimit.INTERACTIVE, ratelimit.BACKGROUND, ratelimit.INTERACTIVE)):
+        threads.append(_waiter(queue, priority, admitted))
+        _wait_for(queue, n + 1)
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert admitted == [ratelimit.INTERACTIVE, ratelimit.INTERACTIVE, ratelimit.BACKGROUND, ratelimit.BACKGROUND]
+    assert queue.snapshot()["active"] == 0
+
+def test_full_waiting_line_is_rejected_at_once():
+    queue = admission.AdmissionQueue(max_active=1, max_waiting=1, retry_after=7)
+    admitted = []
+    queue.acquire()
+    thread = _waiter(queue, ratelimit.INTERACTIVE, admitted)
+    _wait_for(queue, 1)
+    began = time.monotonic()
+    with pytest.raises(admission.Rejected) as rejected:
+        queue.acquire()
+    assert time.monotonic() - began < 0.5
+    assert rejected.value.retry_after == 7
+    # Job workers (timeout=None) are never turned away.
+    late = _waiter(queue, ratelimit.BACKGROUND, admitted, timeout=None)
+    _wait_for(queue, 2)
+    queue.release()
+    thread.join()
+    late.join()
+    assert admitted == [ratelimit.INTERACTIVE, ratelimit.BACKGROUND]
+    assert queue.stats["rejected_full"] == 1
+    assert queue.stats["admitted"] == 3
+
+def test_waiting_past_the_timeout_is_rejected():
+    queue = admission.AdmissionQueue(max_active=1, max_waiting=4, timeout=0.2)
+    queue.acquire()
+    began = time.monotonic()
+    with pytest.raises(admission.Rejected):
+        queue.acquire()
+    assert 0.2 <= time.monotonic() - began < 1.0
+    assert queue.snapshot()["waiting"] == {ratelimit.INTERACTIVE: 0, ratelimit.BACKGROUND: 0}
+    queue.release()
+    queue.acquire()
+    assert queue.stats == {"admitted": 2, "rejected_full": 0, "rejected_timeout": 1}
+
+def test_rejection_is_a_429_with_retry_after_for_api_clients():
+    app = Flask("test_admission")
+    with app.test_request_context(headers={"Accept": "application/json"}):
+        response = admission.too_busy(admission.Rejected("The server is busy; try again shortly.", 5))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+    assert response.get_json() == {"error": "The server is busy; try again shortly.", "retry_after": 5}
+
+def test_job_backlog_refuses_interactive_jobs_past_the_limit():
+    class Jobs:
+        def __init__(self, depth):
+            self.depth = lambda priority: depth if priority == ratelimit.INTERACTIVE else 0
+
+    app = Flask("test_admission")
+    app.config.update(ADMISSION_MAX_QUEUED_JOBS=3, ADMISSION_RETRY_AFTER_SECONDS=9)
+    with app.app_context():
+        admission.check_job_backlog(Jobs(2))
+        with pytest.raises(admission.Rejected) as rejected:
+            admission.check_job_backlog(Jobs(3))
+    assert rejected.value.retry_after == 9
+
+def test_background_jobs_past_their_limit_get_a_429(api):
+    api.application.config.update(ADMISSION_MAX_QUEUED_JOBS=2, ADMISSION_MAX_QUEUED_BACKGROUND_JOBS=2)
+
+    def submit(priority):
+        return api.post("/analyze", json={"ward_id": "68", "priority": priority}, headers={"Accept": "application/json"})
+
+    assert [submit(ratelimit.BACKGROUND).status_code for _ in range(2)] == [202, 202]
+    refused = submit(ratelimit.BACKGROUND)
+    assert refused.status_code == 429
+    assert "Retry-After" in refused.headers
+    # Counted separately: a bulk backlog does not turn users away.
+    assert submit(ratelimit.INTERACTIVE).status_code == 202
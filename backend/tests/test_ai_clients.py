@@ -0,0 +1,27 @@
+import asyncio
+import pytest
+import ai_clients
+
+pytest.importorskip("google.generativeai")
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(ai_clients, "_models", {})
+    monkeypatch.setattr(ai_clients, "_settings", {"gemini_base_url": None})
+
+def _key(client):
+    return client.transport._credentials.token
+
+def test_each_api_key_gets_its_own_clients(registry):
+    first = ai_clients.get_gemini_model("key-a", "gemini-test")
+    second = ai_clients.get_gemini_model("key-b", "gemini-test")
+    assert (_key(first._client), _key(second._client)) == ("key-a", "key-b")
+    assert ai_clients.get_gemini_model("key-a", "gemini-test") is first
+
+    async def on_loop():
+        return ai_clients.get_gemini_model("key-b", "gemini-test", bind_async=True)
+
+    assert asyncio.run(on_loop()) is second
+    # Built after key-a's model, yet still key-b's: nothing goes through genai.configure.
+    assert _key(second._async_client) == "key-b"
+    assert first._async_client is None
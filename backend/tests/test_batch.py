@@ -0,0 +1,28 @@
+import asyncio
+import batch
+import ratelimit
+import resilience
+
+class Registry:
+    def get(self, ward_id):
+        return {"name": f"Ward {ward_id}"}
+
+def test_ward_stuck_on_the_quota_fails_at_its_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(ratelimit, "_settings", dict(ratelimit._settings))
+    monkeypatch.setattr(ratelimit, "_buckets", None)
+    # One token, then the next in 100 minutes.
+    ratelimit.configure({"GEMINI_RPM": 0.01, "RATE_LIMIT_BURST_SECONDS": 10}, str(tmp_path))
+
+    async def analyze_one(registry, ward_id, *args):
+        await ratelimit.wait_async("gemini")
+        return {"ward_id": ward_id}
+
+    monkeypatch.setattr(batch, "analyze_one", analyze_one)
+    writer = batch.ResultWriter(tmp_path / "out.ndjson", "ndjson")
+    with ratelimit.priority(ratelimit.BACKGROUND):
+        failed = asyncio.run(resilience.bind(batch.run_batch(
+            Registry(), ["1", "2"], writer, 1, {"BATCH_WARD_BUDGET_SECONDS": 1}, None, False,
+        )))
+    writer.close()
+    assert failed == ["2"]
+    assert batch.read_records(tmp_path / "out.ndjson", "ndjson") == {"1": {"ward_id": "1"}}
@@ -0,0 +1,72 @@
+import pytest
+import cache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace ``time.time`` in ``cache`` with a clock the test moves by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+def _rows(ai_cache):
+    return [key for key, in ai_cache._connect().execute("SELECT key FROM ai_cache ORDER BY key")]
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    ai_cache = cache.AICache(tmp_path / "ai_cache.sqlite3", ttl_seconds=60)
+    ai_cache.set("greenery", {"greenery_score": 40})
+    # Another worker has only the shared file.
+    other = cache.AICache(tmp_path / "ai_cache.sqlite3", ttl_seconds=60)
+    clock[0] += 59
+    assert ai_cache.get("greenery") == (True, {"greenery_score": 40})
+    assert other.get("greenery") == (True, {"greenery_score": 40})
+    clock[0] += 2
+    assert ai_cache.get("greenery") == (False, None)
+    assert other.get("greenery") == (False, None)
+    assert _rows(ai_cache) == []
+    assert ai_cache.stats["memory_hits"] == other.stats["disk_hits"] == 1
+
+def test_prune_drops_expired_rows_then_least_recently_used(tmp_path, clock):
+    value = "x" * 98  # 100 bytes once JSON-encoded
+    ai_cache = cache.AICache(tmp_path / "ai_cache.sqlite3", ttl_seconds=60, max_bytes=300)
+    ai_cache.set("stale", value)
+    clock[0] += 30
+    for key in ("a", "b", "c", "d"):
+        clock[0] += 1
+        ai_cache.set(key, value)
+    # A disk read counts as a use: "a" is now the most recently used.
+    fresh = cache.AICache(tmp_path / "ai_cache.sqlite3", ttl_seconds=60, max_bytes=300)
+    clock[0] += 1
+    assert fresh.get("a")[0]
+    clock[0] += 30
+    assert ai_cache.prune() == 2
+    assert _rows(ai_cache) == ["a", "c", "d"]
+    assert ai_cache.stats["evictions"] == 2
+
+def test_prune_runs_every_32_writes(tmp_path, clock):
+    ai_cache = cache.AICache(tmp_path / "ai_cache.sqlite3", max_bytes=10 * 102)
+    for n in range(32):
+        clock[0] += 1
+        ai_cache.set(f"key-{n:02}", "x" * 100)
+    assert len(_rows(ai_cache)) == 10
+    assert _rows(ai_cache)[0] == "key-22"
+
+def test_bypass_recomputes_and_stores(tmp_path, clock):
+    ai_cache = cache.AICache(tmp_path / "ai_cache.sqlite3")
+    assert ai_cache.get_or_compute("trees", lambda: ["Neem"]) == (["Neem"], False)
+    assert ai_cache.get_or_compute("trees", lambda: pytest.fail("recomputed")) == (["Neem"], True)
+    assert ai_cache.get_or_compute("trees", lambda: ["Peepal"], bypass=True) == (["Peepal"], False)
+    assert ai_cache.get("trees") == (True, ["Peepal"])
+
+def test_callers_cannot_change_a_cached_value(tmp_path, clock):
+    ai_cache = cache.AICache(tmp_path / "ai_cache.sqlite3")
+    value = {"text": "Plant neem", "meta": {}}
+    ai_cache.set("recommendation", value)
+    value["meta"]["ward"] = 68
+    _, hit = ai_cache.get("recommendation")
+    hit["meta"]["ward"] = 66
+    assert ai_cache.get("recommendation") == (True, {"text": "Plant neem", "meta": {}})
+    # The same for an entry read from disk into the memory tier.
+    other = cache.AICache(tmp_path / "ai_cache.sqlite3")
+    other.get("recommendation")[1]["meta"]["ward"] = 66
+    assert other.get("recommendation") == (True, {"text": "Plant neem", "meta": {}})
+    assert other.stats["memory_hits"] == 1
@@ -0,0 +1,48 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import http_client
+import resilience
+
+@pytest.fixture
+def busy_upstream():
+    """A local server that always answers 503 with ``Retry-After``; yields ``(url, hits, set_retry_after)``."""
+    hits = []
+    retry_after = {"seconds": "0"}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(time.monotonic())
+            self.send_response(503)
+            self.send_header("Retry-After", retry_after["seconds"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/", hits, lambda seconds: retry_after.update(seconds=str(seconds))
+    server.shutdown()
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(http_client, "_settings", dict(http_client.DEFAULT_SETTINGS, max_retries=2, backoff_factor=0))
+    return http_client.HttpClient(http_client._settings)
+
+def test_sync_client_retries_without_a_budget(busy_upstream, client):
+    url, hits, _ = busy_upstream
+    assert client.get(url, timeout=5).status_code == 503
+    assert len(hits) == 3
+
+def test_sync_retry_that_does_not_fit_the_budget_is_skipped(busy_upstream, client):
+    url, hits, set_retry_after = busy_upstream
+    set_retry_after(5)
+    started = time.monotonic()
+    with resilience.budget(1.0):
+        response = client.get(url, timeout=resilience.timeout(5))
+    assert response.status_code == 503
+    assert len(hits) == 1
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,69 @@
+import pytest
+import image_store
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(image_store.time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return image_store.ImageStore(tmp_path / "analysis_images", quota_bytes=1000, max_age_seconds=500, orphan_grace_seconds=100)
+
+def _refcount(store, token):
+    row = store._connect().execute("SELECT refcount FROM images WHERE digest = ?", (token.split(".")[0],)).fetchone()
+    return None if row is None else row[0]
+
+def test_identical_bytes_are_stored_once(store):
+    first = store.put(b"a" * 100, "image/png")
+    assert store.put(b"a" * 100, "image/png", alias="staticmap:1") == first
+    assert store.path_for(first).read_bytes() == b"a" * 100
+    assert store.get_by_alias("staticmap:1") == b"a" * 100
+    assert store.get_by_alias("staticmap:2") is None
+
+def test_refcount_follows_sessions_and_never_goes_negative(store):
+    token = store.put(b"a" * 100, "image/jpeg")
+    store.acquire(token)
+    store.acquire(token)
+    assert _refcount(store, token) == 2
+    store.release(token)
+    store.release(token)
+    store.release(token)
+    assert _refcount(store, token) == 0
+    # Malformed tokens are ignored rather than resolved to a path.
+    store.acquire("../../etc/passwd")
+    store.release(None)
+
+def test_sweep_keeps_referenced_and_recent_images(store, clock):
+    held = store.put(b"held" * 25, "image/png")
+    store.acquire(held)
+    orphan = store.put(b"orphan" * 20, "image/png", alias="staticmap:orphan")
+    clock[0] += 50
+    recent = store.put(b"recent" * 20, "image/png")
+    clock[0] += 60
+    assert store.sweep() == {"removed": 1, "evicted": 0, "bytes": 220}
+    assert not store.path_for(orphan).exists()
+    assert store.get_by_alias("staticmap:orphan") is None
+    assert store.path_for(held).exists() and store.path_for(recent).exists()
+    # A reference idle past max_age_seconds belongs to an abandoned session.
+    clock[0] += 500
+    assert store.sweep()["removed"] == 2
+    assert not store.path_for(held).exists()
+
+def test_sweep_evicts_unreferenced_images_first_to_fit_the_quota(store, clock):
+    tokens = []
+    for n in range(5):
+        clock[0] += 1
+        tokens.append(store.put(bytes([n]) * 300, "image/png"))
+    store.acquire(tokens[0])
+    result = store.sweep()
+    assert (result["evicted"], result["bytes"]) == (2, 900)
+    assert [store.path_for(token).exists() for token in tokens] == [True, False, False, True, True]
+
+def test_sweep_is_skipped_when_another_worker_swept_recently(store, clock):
+    assert "skipped" not in store.sweep(min_interval=60)
+    clock[0] += 30
+    assert store.sweep(min_interval=60) == {"skipped": 1}
+    clock[0] += 31
+    assert "skipped" not in store.sweep(min_interval=60)
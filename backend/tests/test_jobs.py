@@ -0,0 +1,111 @@
+import io
+import sqlite3
+import time
+import pytest
+import jobs
+import ratelimit
+
+def test_interactive_jobs_are_claimed_before_earlier_background_ones(tmp_path):
+    queue = jobs.JobQueue(tmp_path / "jobs.sqlite3")
+    batch = queue.enqueue({"ward": 1}, priority=ratelimit.BACKGROUND)
+    user = queue.enqueue({"ward": 2})
+    assert (queue.depth(), queue.depth(ratelimit.INTERACTIVE), queue.depth(ratelimit.BACKGROUND)) == (2, 1, 1)
+    assert queue.claim() == (user, "analysis", {"ward": 2}, ratelimit.INTERACTIVE)
+    assert queue.claim() == (batch, "analysis", {"ward": 1}, ratelimit.BACKGROUND)
+    assert queue.claim() is None
+
+def test_expired_lease_is_reclaimed_until_attempts_run_out(tmp_path):
+    queue = jobs.JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0.5, max_attempts=2)
+    job_id = queue.enqueue({"ward": 1})
+    assert queue.claim()[0] == job_id
+    # Leased: nobody else gets it, and progress updates keep the lease alive.
+    time.sleep(0.3)
+    queue.update(job_id, "greenery", 30)
+    time.sleep(0.3)
+    assert queue.claim() is None
+    # The worker died: once the lease runs out another one picks the job up.
+    time.sleep(0.5)
+    assert queue.claim()[0] == job_id
+    assert queue.get(job_id)["status"] == "running"
+    time.sleep(0.6)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "Analysis worker stopped before finishing this job.")
+
+def test_finished_job_is_not_reclaimed(tmp_path):
+    queue = jobs.JobQueue(tmp_path / "jobs.sqlite3", lease_seconds=0.1)
+    job_id = queue.enqueue({"ward": 1})
+    queue.claim()
+    queue.update(job_id, "greenery", 30, preview={"local_greenery": 41})
+    queue.finish(job_id, {"greenery": {"greenery_score": 40}})
+    time.sleep(0.15)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert (job["status"], job["progress"], job["result"], job["preview"]) == (
+        "done", 100, {"greenery": {"greenery_score": 40}}, {"local_greenery": 41},
+    )
+
+def test_queue_from_before_priorities_is_migrated(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    conn.execute(
+        "CREATE TABLE jobs ("
+        " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT NOT NULL,"
+        " progress INTEGER NOT NULL DEFAULT 0, payload TEXT NOT NULL, result TEXT, error TEXT,"
+        " attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, stage, payload, created_at, updated_at)"
+        " VALUES ('old', 'analysis', 'queued', 'queued', '{\"ward\": 1}', 1, 1)"
+    )
+    conn.close()
+    queue = jobs.JobQueue(path)
+    # A second worker opening the same queue finds the columns already there.
+    jobs.JobQueue(path)
+    queue.enqueue({"ward": 2}, priority=ratelimit.BACKGROUND)
+    assert queue.depth(ratelimit.INTERACTIVE) == 1
+    assert queue.claim() == ("old", "analysis", {"ward": 1}, ratelimit.INTERACTIVE)
+    assert queue.get("old")["preview"] is None
+
+def _png(seed=0):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (40 + seed, 120, 60)).save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+def _refcount(token):
+    import image_store
+    row = image_store.get_image_store()._connect().execute(
+        "SELECT refcount FROM images WHERE digest = ?", (token.split(".")[0],),
+    ).fetchone()
+    return row[0]
+
+def test_queued_job_holds_its_upload_until_it_finishes(api, monkeypatch):
+    import pipeline
+    response = api.post(
+        "/analyze", data={"ward_id": "68", "satellite_image": (_png(), "ward.png")},
+        headers={"Accept": "application/json"}, content_type="multipart/form-data",
+    )
+    assert response.status_code == 202
+    with api.application.app_context():
+        job_id, kind, payload, _ = jobs.get_job_queue().claim()
+        token = payload["image_token"]
+        # Referenced while queued, so a sweep past the orphan grace period keeps it.
+        assert _refcount(token) == 1
+        seen = {}
+        monkeypatch.setattr(pipeline, "analyze_ward", lambda metadata, image_part, *args, **kwargs: seen.update(image=image_part) or {})
+        pipeline.run_analysis_job(payload, lambda *args: None)
+        assert seen["image"] is not None
+        assert _refcount(token) == 0
+
+def test_job_whose_upload_is_gone_fails_instead_of_running_without_it(api):
+    import pipeline
+    import utils
+    with api.application.test_request_context():
+        token = utils.save_analysis_image(_png(1).getvalue(), "image/png")
+        utils.retain_analysis_image(token)
+        utils.analysis_image_path(token).unlink()
+        with pytest.raises(ValueError, match="no longer available"):
+            pipeline.run_analysis_job({"metadata": {"name": "Ward"}, "image_token": token, "image_mime": "image/png"}, lambda *args: None)
+        assert _refcount(token) == 0
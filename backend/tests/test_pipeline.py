@@ -0,0 +1,90 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import ai_services
+import pipeline
+
+CONFIG = {"GEMINI_API_KEY": "x", "PERPLEXITY_API_KEY": "x", "GREENERY_TIMEOUT_SECONDS": 0.5, "TREES_TIMEOUT_SECONDS": 0.5}
+
+@pytest.fixture
+def one_thread(monkeypatch):
+    """A one-thread stage executor, so the tree call queues behind the greenery call."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(pipeline, "_executor", executor)
+    monkeypatch.setattr(pipeline, "_executor_pid", os.getpid())
+    yield
+    executor.shutdown(wait=True)
+
+def _slow(seconds, value):
+    def call(*args, **kwargs):
+        time.sleep(seconds)
+        return value
+    return call
+
+def test_time_queued_for_a_thread_does_not_count_against_the_stage_timeout(one_thread, monkeypatch):
+    monkeypatch.setattr(ai_services, "call_gemini_for_greenery", _slow(0.35, {"greenery_score": 40}))
+    monkeypatch.setattr(ai_services, "suggest_trees_via_perplexity", _slow(0.35, ["Neem"]))
+    greenery, trees, timings = pipeline.run_greenery_and_trees(None, {}, CONFIG)
+    # The tree call finished 0.7 s after submission, past its 0.5 s timeout, but ran for only 0.35 s.
+    assert trees == ["Neem"]
+    assert greenery == {"greenery_score": 40}
+    assert timings["total"] >= 700
+
+def test_a_stage_that_runs_too_long_still_times_out(one_thread, monkeypatch):
+    monkeypatch.setattr(ai_services, "call_gemini_for_greenery", _slow(0.8, {"greenery_score": 40}))
+    monkeypatch.setattr(ai_services, "suggest_trees_via_perplexity", _slow(0, ["Neem"]))
+    with pytest.raises(TimeoutError):
+        pipeline.run_greenery_and_trees(None, {}, CONFIG)
+
+WARD = {
+    "name": "Test ward",
+    "coordinates": {
+        "center": {"lat": 12.97, "lng": 77.59},
+        "bounding_box": {"southwest": {"lat": 12.96, "lng": 77.58}, "northeast": {"lat": 12.98, "lng": 77.60}},
+    },
+    "ward_geojson": {"type": "Polygon", "coordinates": [[[77.58, 12.96], [77.60, 12.96], [77.60, 12.98], [77.58, 12.96]]]},
+}
+
+@pytest.fixture
+def app_context(tmp_path):
+    from flask import Flask
+    # ward_features caches its prompt facts under the instance folder.
+    app = Flask("test_pipeline", instance_path=str(tmp_path))
+    app.config.update(GOOGLE_MAPS_API_KEY="x")
+    with app.app_context():
+        yield
+
+def test_analysis_key_covers_what_is_sent_upstream(app_context):
+    import copy
+    key = pipeline.analysis_key(WARD, None)
+    assert pipeline.analysis_key(copy.deepcopy(WARD), None) == key
+    # sanitize_metadata drops the boundary and view, but the static map request depends on them.
+    moved = copy.deepcopy(WARD)
+    moved["ward_geojson"]["coordinates"][0][2] = [77.61, 12.99]
+    assert pipeline.analysis_key(moved, None) != key
+    shifted = copy.deepcopy(WARD)
+    shifted["coordinates"]["center"] = {"lat": 12.975, "lng": 77.59}
+    assert pipeline.analysis_key(shifted, None) != key
+    assert pipeline.analysis_key(WARD, None, fast=True) != key
+    assert pipeline.analysis_key(WARD, {"mime_type": "image/jpeg", "data": "abc"}) != key
+
+def test_input_fingerprint_has_one_digest_per_input():
+    fingerprint = pipeline.input_fingerprint(b"png", {"name": "Ward 1"})
+    parts = fingerprint.split(".")
+    assert len(parts) == len(pipeline.INPUT_PARTS)
+    assert all(len(part) == 16 for part in parts)
+    assert pipeline.input_fingerprint(b"png", {"name": "Ward 1"}) == fingerprint
+    assert pipeline.input_fingerprint(None, {"name": "Ward 1"}).split(".")[0] == "none"
+
+def test_changed_inputs_names_what_differs(monkeypatch):
+    before = pipeline.input_fingerprint(b"png", {"name": "Ward 1"})
+    assert pipeline.changed_inputs(before, before) == []
+    assert pipeline.changed_inputs(before, pipeline.input_fingerprint(b"new png", {"name": "Ward 1"})) == ["static_map"]
+    assert pipeline.changed_inputs(before, pipeline.input_fingerprint(b"png", {"name": "Ward 2"})) == ["metadata"]
+    assert pipeline.changed_inputs(before, pipeline.input_fingerprint(b"png", {"name": "Ward 1"}, fast=True)) == ["prompts"]
+    monkeypatch.setattr(ai_services, "GREENERY_PROMPT_VERSION", "test")
+    assert pipeline.changed_inputs(before, pipeline.input_fingerprint(b"png", {"name": "Ward 1"})) == ["prompts"]
+    # No usable earlier fingerprint: everything counts as changed.
+    for previous in (None, "", "abc", "a.b"):
+        assert pipeline.changed_inputs(previous, before) == list(pipeline.INPUT_PARTS)
@@ -0,0 +1,85 @@
+import pytest
+import ratelimit
+import resilience
+
+@pytest.fixture
+def buckets(tmp_path, monkeypatch):
+    """Shared buckets in a temporary instance folder: Gemini at 6 rpm (0.1 tokens/s), 10 tokens, half reserved."""
+    monkeypatch.setattr(ratelimit, "_settings", dict(ratelimit._settings))
+    monkeypatch.setattr(ratelimit, "_buckets", None)
+    ratelimit.configure({"GEMINI_RPM": 6, "RATE_LIMIT_BURST_SECONDS": 100, "RATE_LIMIT_INTERACTIVE_RESERVE": 0.5}, str(tmp_path))
+    return ratelimit.get_buckets()
+
+def test_bucket_starts_full_and_refills(tmp_path):
+    buckets = ratelimit.TokenBuckets(tmp_path / "ratelimit.sqlite3")
+    assert [buckets.take("gemini", rate=1.0, capacity=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = buckets.take("gemini", rate=1.0, capacity=3)
+    assert 0 < wait <= 1.0
+    # Pretend the last take was two seconds ago: two tokens have come back.
+    buckets._connect().execute("UPDATE buckets SET updated_at = updated_at - 2")
+    assert buckets.take("gemini", rate=1.0, capacity=3) == 0.0
+    assert buckets.take("gemini", rate=1.0, capacity=3) == 0.0
+
+def test_background_stops_at_reserve_while_interactive_continues(buckets):
+    with ratelimit.priority(ratelimit.BACKGROUND):
+        taken = 0
+        while ratelimit._next_wait("gemini") == 0.0:
+            taken += 1
+            assert taken < 10, "background work emptied the reserve"
+        # Stops with the reserved half of the 10-token bucket left.
+        assert taken == 5
+        assert ratelimit._next_wait("gemini") > 0
+    assert ratelimit.current_priority() == ratelimit.INTERACTIVE
+    assert ratelimit._next_wait("gemini") == 0.0
+
+def test_interactive_can_drain_the_bucket(buckets):
+    assert all(ratelimit._next_wait("gemini") == 0.0 for _ in range(10))
+    assert ratelimit._next_wait("gemini") > 0
+
+def test_wait_past_the_budget_raises_deadline(buckets):
+    for _ in range(10):
+        ratelimit.wait("gemini")
+    with resilience.budget(1.0), pytest.raises(resilience.DeadlineExceeded):
+        ratelimit.wait("gemini")
+
+def test_unconfigured_provider_is_not_limited(buckets):
+    assert ratelimit._next_wait("perplexity") == 0.0
+
+@pytest.fixture
+def breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_breakers_pid", None)
+    return resilience.get_breaker
+
+def test_quota_wait_is_outside_the_breaker(buckets, breakers, monkeypatch):
+    import ai_services
+
+    class Model:
+        def generate_content(self, *args, **kwargs):
+            raise AssertionError("called Gemini without a quota token")
+
+    monkeypatch.setattr(ai_services, "_gemini_model", lambda api_key: Model())
+    for _ in range(10):
+        ratelimit.wait("gemini")
+    with resilience.budget(1.0), pytest.raises(resilience.DeadlineExceeded):
+        ai_services.call_gemini_for_greenery(None, {"name": "Ward 1"}, "key")
+    snapshot = breakers("gemini").snapshot()
+    assert (snapshot["state"], snapshot["calls"], snapshot["failures"]) == ("closed", 0, 0)
+
+def test_open_breaker_fails_before_taking_a_token(buckets, breakers):
+    breaker = breakers("gemini")
+    for _ in range(breaker.failure_threshold):
+        breaker.record(False, ConnectionError("upstream down"))
+    assert breaker.state == "open"
+    with pytest.raises(resilience.CircuitOpenError):
+        ratelimit.wait("gemini")
+    assert breaker.snapshot()["rejected"] == 1
+    breaker.record(False, None)
+    assert all(ratelimit._next_wait("gemini") == 0.0 for _ in range(10))
+
+def test_background_is_served_when_the_bucket_is_smaller_than_the_reserve(buckets):
+    # 5 rpm with a 10 s burst: a one-token bucket, so no room for a 0.25-token reserve on top.
+    ratelimit.configure({"GEMINI_RPM": 5, "RATE_LIMIT_BURST_SECONDS": 10, "RATE_LIMIT_INTERACTIVE_RESERVE": 0.25}, str(buckets.db_path.parent))
+    with ratelimit.priority(ratelimit.BACKGROUND):
+        assert ratelimit._next_wait("gemini") == 0.0
+        assert 0 < ratelimit._next_wait("gemini") <= 12.0
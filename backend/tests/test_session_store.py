@@ -0,0 +1,107 @@
+import pytest
+from flask import Flask, session
+import session_store
+
+TTL = 1000
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [10000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture(params=["sqlite", "memory"])
+def app(request, tmp_path, clock):
+    app = Flask("test_session_store", instance_path=str(tmp_path))
+    app.config.update(SECRET_KEY="test", SESSION_BACKEND=request.param, SESSION_TTL_SECONDS=TTL, SESSION_PURGE_INTERVAL_SECONDS=100)
+    app.expired = []
+    app.session_interface = session_store.build_session_interface(app, on_expire=app.expired.append)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        session["value"] = value
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return session.get("value", "-")
+
+    @app.route("/clear")
+    def clear():
+        session.clear()
+        return "ok"
+
+    @app.route("/static-like")
+    def untouched():
+        return "ok"
+
+    return app
+
+def _expiry(app, client):
+    sid = app.session_interface._signer(app).unsign(client.get_cookie("session").value).decode("ascii")
+    return app.session_interface.store.load(sid)[1]
+
+def test_only_a_signed_id_travels_in_the_cookie(app):
+    client = app.test_client()
+    client.get("/set/" + "x" * 2000)
+    assert len(client.get_cookie("session").value) < 100
+    assert client.get("/get").text == "x" * 2000
+    client.set_cookie("session", client.get_cookie("session").value[:-2] + "zz")
+    assert client.get("/get").text == "-"
+
+def test_reads_refresh_the_expiry_only_past_half_the_ttl(app, clock):
+    client = app.test_client()
+    client.get("/set/a")
+    assert _expiry(app, client) == 10000 + TTL
+    clock[0] += TTL * 0.4
+    response = client.get("/get")
+    assert "Set-Cookie" not in response.headers
+    assert _expiry(app, client) == 10000 + TTL
+    clock[0] += TTL * 0.2
+    response = client.get("/get")
+    assert "Set-Cookie" in response.headers
+    assert _expiry(app, client) == clock[0] + TTL
+    # Requests that never look at the session cost no lookup and no write.
+    assert "Set-Cookie" not in client.get("/static-like").headers
+
+def test_expired_session_starts_over_under_a_new_id(app, clock):
+    client = app.test_client()
+    client.get("/set/a")
+    old_cookie = client.get_cookie("session").value
+    clock[0] += TTL + 1
+    assert client.get("/get").text == "-"
+    client.get("/set/b")
+    assert client.get_cookie("session").value != old_cookie
+
+def test_purge_hands_expired_sessions_to_on_expire(app, clock):
+    stale, live = app.test_client(), app.test_client()
+    stale.get("/set/stale")
+    clock[0] += TTL / 2 + 50
+    live.get("/set/live")
+    clock[0] += TTL / 2
+    # The first request after the purge interval purges, whatever it touches.
+    live.get("/static-like")
+    assert app.expired == [{"value": "stale"}]
+    assert live.get("/get").text == "live"
+    clock[0] += 50
+    live.get("/static-like")
+    assert app.expired == [{"value": "stale"}]
+
+def test_update_edits_a_session_outside_a_request(app):
+    client = app.test_client()
+    client.get("/set/a")
+    sid = app.session_interface._signer(app).unsign(client.get_cookie("session").value).decode("ascii")
+    assert app.session_interface.update(sid, lambda data: data.update(value="streamed") is None)
+    assert not app.session_interface.update(sid, lambda data: False)
+    assert not app.session_interface.update("unknown", lambda data: True)
+    assert client.get("/get").text == "streamed"
+
+def test_cleared_session_is_handed_to_on_expire(app):
+    client = app.test_client()
+    client.get("/set/held")
+    response = client.get("/clear")
+    assert "session=;" in response.headers["Set-Cookie"]
+    assert app.expired == [{"value": "held"}]
+    assert client.get("/get").text == "-"
+    # Nothing is left for a later purge to release twice.
+    assert app.session_interface.store.purge() == []
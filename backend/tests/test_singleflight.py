@@ -0,0 +1,107 @@
+import threading
+import time
+import pytest
+import singleflight
+
+@pytest.fixture
+def flights(tmp_path):
+    return singleflight.SingleFlight(tmp_path / "singleflight.sqlite3", lease_seconds=1, poll_interval=0.01)
+
+@pytest.fixture
+def other_worker(tmp_path):
+    """A second coalescer on the same database, standing in for another gunicorn worker."""
+    return singleflight.SingleFlight(tmp_path / "singleflight.sqlite3", lease_seconds=1, poll_interval=0.01)
+
+def _leader(flights, key, compute):
+    """Start ``flights.run(key, compute)`` on a thread; returns the thread and where its outcome lands."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = flights.run(key, compute)
+        except Exception as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+def _blocking(release, value=None, error=None):
+    def compute():
+        release.wait(5)
+        if error is not None:
+            raise error
+        return value
+    return compute
+
+def _running(flights, key):
+    """Wait until a leader holds ``key``'s lease."""
+    for _ in range(500):
+        row = flights._connect().execute("SELECT status FROM flights WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] == "running":
+            return
+        time.sleep(0.01)
+    raise AssertionError("no leader started")
+
+def test_local_follower_gets_the_leaders_result(flights):
+    release = threading.Event()
+    thread, outcome = _leader(flights, "ward-1", _blocking(release, {"score": 40}))
+    _running(flights, "ward-1")
+    threading.Timer(0.05, release.set).start()
+    value, role = flights.run("ward-1", lambda: pytest.fail("follower computed"))
+    thread.join()
+    assert (value, role) == ({"score": 40}, "local")
+    assert outcome["value"] == ({"score": 40}, "leader")
+    assert flights.stats["leaders"] == flights.stats["local_followers"] == 1
+
+def test_local_follower_gets_the_leaders_error(flights):
+    release = threading.Event()
+    thread, outcome = _leader(flights, "ward-1", _blocking(release, error=ValueError("Gemini said no")))
+    _running(flights, "ward-1")
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(ValueError, match="Gemini said no"):
+        flights.run("ward-1", lambda: pytest.fail("follower computed"))
+    thread.join()
+    assert isinstance(outcome["error"], ValueError)
+
+def test_remote_follower_gets_the_result_or_the_error(flights, other_worker):
+    release = threading.Event()
+    thread, _ = _leader(flights, "ward-1", _blocking(release, {"score": 40}))
+    _running(flights, "ward-1")
+    threading.Timer(0.05, release.set).start()
+    assert other_worker.run("ward-1", lambda: pytest.fail("follower computed")) == ({"score": 40}, "remote")
+    thread.join()
+
+    release = threading.Event()
+    thread, _ = _leader(flights, "ward-2", _blocking(release, error=ValueError("Gemini said no")))
+    _running(flights, "ward-2")
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(RuntimeError, match="Gemini said no"):
+        other_worker.run("ward-2", lambda: pytest.fail("follower computed"))
+    thread.join()
+
+def test_finished_flights_are_not_shared(flights):
+    assert flights.run("ward-1", lambda: 1) == (1, "leader")
+    assert flights.run("ward-1", lambda: 2) == (2, "leader")
+
+def test_follower_takes_over_when_the_leaders_lease_runs_out(flights):
+    # A leader in a worker that died: its lease is never renewed.
+    now = time.time()
+    flights._connect().execute(
+        "INSERT INTO flights (key, owner, status, lease_until, updated_at) VALUES ('ward-1', 'dead', 'running', ?, ?)",
+        (now + 0.2, now),
+    )
+    started = time.monotonic()
+    assert flights.run("ward-1", lambda: {"score": 40}) == ({"score": 40}, "leader")
+    assert time.monotonic() - started >= 0.15
+    assert flights.stats["takeovers"] == 1
+
+def test_heartbeat_keeps_a_slow_leaders_lease(flights, other_worker):
+    release = threading.Event()
+    thread, _ = _leader(flights, "ward-1", _blocking(release, {"score": 40}))
+    _running(flights, "ward-1")
+    # Outlives the 1 s lease; the heartbeat renews it, so the follower keeps waiting.
+    threading.Timer(1.5, release.set).start()
+    assert other_worker.run("ward-1", lambda: pytest.fail("follower took over")) == ({"score": 40}, "remote")
+    thread.join()
+    assert other_worker.stats["takeovers"] == 0
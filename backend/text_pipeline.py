@@ -0,0 +1,126 @@
+"""Post-processing for AI text: list parsing, citation stripping, tree name
+normalization and markdown rendering.
+
+Patterns are compiled once at import. ``process_analysis`` runs the whole
+pipeline when results arrive, so result pages only read its stored output.
+Rendered HTML is memoized by content hash: the same text renders once per
+process however many times it is shown.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import markdown2
+from cache import content_hash
+
+_NUMBERED_ITEM = re.compile(r"^(?:[-•]\s*)?(\d+)[\.\)]\s*(.+)$")
+_BULLET_ITEM = re.compile(r"^(?:[-•]\s*)(.+)$")
+_CITATIONS = re.compile(r"(?:\s*\[\d+\])+")
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.;:)])")
+_REPEATED_SPACES = re.compile(r"\s{2,}")
+_BOLD_NAME_WITH_LATIN = re.compile(r"^(?:\d+[\.)]\s*)?\*\*([^*()]+?)\s*\(([^)]+)\)\*\*(.*)$")
+_INLINE_BULLET = re.compile(r"(?<!\n)\s\*\s")
+_BULLET_NEEDS_BLANK_LINE = re.compile(r"\n\*(?=\s)")
+_MARKDOWN_EXTRAS = ["fenced-code-blocks", "tables", "strike"]
+
+class ContentMemo:
+    """Thread-safe LRU of rendered output keyed by the SHA-256 of its input."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = int(max_entries)
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_render(self, key: str, render: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+            self.stats["misses"] += 1
+        value = render()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+_html_memo = ContentMemo(2048)
+_fragment_memo = ContentMemo(256)
+
+def parse_numbered_list(content: str) -> List[str]:
+    suggestions: List[str] = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        m = _NUMBERED_ITEM.match(line)
+        if m:
+            suggestions.append(m.group(2).strip())
+            continue
+        m2 = _BULLET_ITEM.match(line)
+        if m2:
+            suggestions.append(m2.group(1).strip())
+    return suggestions or [content.strip()]
+
+def strip_reference_citations(text: Optional[str]) -> str:
+    """Remove Perplexity-style reference markers like [1], [2][3] from a line.
+    Keeps the rest of the text intact and collapses extra spaces.
+    """
+    if not isinstance(text, str):
+        return ""
+    cleaned = _CITATIONS.sub("", text)
+    cleaned = _SPACE_BEFORE_PUNCTUATION.sub(r"\1", cleaned)
+    return _REPEATED_SPACES.sub(" ", cleaned).strip()
+
+def normalize_tree_bold_markdown(text: Optional[str]) -> str:
+    """Normalize Perplexity tree suggestion so only the common name is bold.
+    Converts patterns like '**Jamun (Syzygium cumini)** — rationale' to
+    '**Jamun** (Syzygium cumini) — rationale'. If already correct, returns as-is.
+    """
+    if not isinstance(text, str):
+        return ""
+    line = text.strip()
+    m = _BOLD_NAME_WITH_LATIN.match(line)
+    if m:
+        return f"**{m.group(1).strip()}** ({m.group(2).strip()}){m.group(3)}"
+    return line
+
+def _render_markdown(text: str) -> str:
+    normalized = _INLINE_BULLET.sub("\n* ", text)
+    normalized = _BULLET_NEEDS_BLANK_LINE.sub("\n\n*", normalized)
+    try:
+        return markdown2.markdown(normalized, extras=_MARKDOWN_EXTRAS)
+    except Exception:
+        return normalized.replace("\n", "<br>")
+
+def render_markdown_html(text: Optional[str], memoize: bool = True) -> Optional[str]:
+    """Render markdown to HTML. Pass ``memoize=False`` for one-off text such as partial streams."""
+    if not text:
+        return None
+    if not memoize:
+        return _render_markdown(text)
+    return _html_memo.get_or_render(content_hash(text), lambda: _render_markdown(text))
+
+def process_trees(trees: List[str]) -> Tuple[List[str], List[Optional[str]]]:
+    """Return ``(display_text, html)`` for each tree suggestion."""
+    display = [normalize_tree_bold_markdown(strip_reference_citations(tree)) for tree in trees]
+    return display, [render_markdown_html(text) for text in display]
+
+def process_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in ``trees_display``, ``trees_html`` and ``recommendations_html`` on a stored analysis."""
+    analysis["trees_display"], analysis["trees_html"] = process_trees(analysis.get("trees") or [])
+    analysis["recommendations_html"] = render_markdown_html(analysis.get("recommendations"))
+    return analysis
+
+def memoize_fragment(name: str, inputs: Any, render: Callable[[], str]) -> str:
+    """Rendered template fragment ``name`` for ``inputs``, rendered once per distinct input."""
+    return _fragment_memo.get_or_render(f"{name}:{content_hash(inputs)}", render)
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {"markdown": dict(_html_memo.stats), "fragments": dict(_fragment_memo.stats)}
@@ -0,0 +1,318 @@
+"""Quantized, arc-sharing encoding of the ward and district boundaries (TopoJSON).
+
+``build`` snaps every coordinate to a 65536×65536 grid over the city, cuts the
+rings at junctions (points where neighbouring boundaries meet or part) and stores
+each shared border once as an arc that both polygons reference. Every arc vertex
+is tagged with the first zoom level in ``ZOOM_LEVELS`` at which it matters, from
+Douglas–Peucker importance against half a screen pixel at that zoom. Arc
+endpoints are always kept, so adjacent wards stay seamless at every level.
+
+``Topology.encode`` emits standard TopoJSON (delta-encoded arcs) for one zoom
+level, optionally only for the geometries crossing a viewport.
+"""
+import gzip
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from flask import current_app
+import wards
+from geometry import _keep_mask, dp_importance, to_meters
+
+QUANTIZATION = 65536
+ZOOM_LEVELS = (8, 10, 12, 14)
+FULL_DETAIL = 99
+FORMAT_VERSION = 1
+# layer name -> (source file in js/, properties kept for the client)
+LAYERS = {
+    "districts": ("districts.geojson", ("dtname",)),
+    "wards": ("delhi_wards.json", ("Ward_Name", "Ward_No")),
+}
+_CITY_LATITUDE = 28.6
+
+def tolerance_for_zoom(zoom: int) -> float:
+    """Half a Web Mercator pixel at ``zoom``, in meters, at Delhi's latitude."""
+    return 0.5 * 156543.03392 * math.cos(math.radians(_CITY_LATITUDE)) / (2 ** zoom)
+
+def _polygons(geometry: Dict[str, Any]) -> List[List[List[List[float]]]]:
+    gtype = (geometry or {}).get("type")
+    coordinates = (geometry or {}).get("coordinates") or []
+    if gtype == "Polygon":
+        return [coordinates]
+    if gtype == "MultiPolygon":
+        return list(coordinates)
+    return []
+
+def _quantize_ring(ring: Sequence[Sequence[float]], translate: Tuple[float, float], scale: Tuple[float, float]) -> List[Tuple[int, int]]:
+    points = np.asarray(ring, dtype=float)[:, :2]
+    q = np.round((points - translate) / scale).astype(np.int64)
+    keep = np.ones(len(q), dtype=bool)
+    keep[1:] = (q[1:] != q[:-1]).any(axis=1)
+    q = q[keep]
+    out = [tuple(p) for p in q.tolist()]
+    if out and out[0] != out[-1]:
+        out.append(out[0])
+    return out
+
+def _junctions(rings: List[List[Tuple[int, int]]]) -> set:
+    """Points that appear with different neighbours in different places."""
+    seen: Dict[Tuple[int, int], Tuple] = {}
+    junctions = set()
+    for ring in rings:
+        body = ring[:-1]
+        n = len(body)
+        for i, point in enumerate(body):
+            neighbours = tuple(sorted((body[i - 1], body[(i + 1) % n])))
+            previous = seen.setdefault(point, neighbours)
+            if previous != neighbours:
+                junctions.add(point)
+    return junctions
+
+def build(data_dir: Path) -> Dict[str, Any]:
+    """Build the topology for the boundary files in ``data_dir`` as a JSON-serializable dict."""
+    features: Dict[str, List[Dict[str, Any]]] = {}
+    for layer, (filename, keep) in LAYERS.items():
+        collection = json.loads((Path(data_dir) / filename).read_text(encoding="utf-8"))
+        features[layer] = [
+            {"properties": {key: (f.get("properties") or {}).get(key) for key in keep}, "polygons": _polygons(f.get("geometry"))}
+            for f in collection.get("features", [])
+        ]
+    all_points = np.asarray([pt[:2] for layer in features.values() for f in layer for poly in f["polygons"] for ring in poly for pt in ring], dtype=float)
+    lo, hi = all_points.min(axis=0), all_points.max(axis=0)
+    translate = (float(lo[0]), float(lo[1]))
+    scale = (float(hi[0] - lo[0]) / (QUANTIZATION - 1), float(hi[1] - lo[1]) / (QUANTIZATION - 1))
+
+    quantized: Dict[str, List[List[List[List[Tuple[int, int]]]]]] = {}
+    all_rings = []
+    for layer, items in features.items():
+        quantized[layer] = []
+        for feature in items:
+            polys = []
+            for polygon in feature["polygons"]:
+                rings = [r for r in (_quantize_ring(ring, translate, scale) for ring in polygon) if len(r) >= 4]
+                if rings:
+                    polys.append(rings)
+                    all_rings.extend(rings)
+            quantized[layer].append(polys)
+    junctions = _junctions(all_rings)
+
+    arcs: List[List[Tuple[int, int]]] = []
+    arc_ids: Dict[Tuple, int] = {}
+
+    def arc_index(points: List[Tuple[int, int]]) -> int:
+        key = tuple(points)
+        if key in arc_ids:
+            return arc_ids[key]
+        reverse = tuple(reversed(points))
+        if reverse in arc_ids:
+            return ~arc_ids[reverse]
+        arc_ids[key] = len(arcs)
+        arcs.append(points)
+        return arc_ids[key]
+
+    def cut(ring: List[Tuple[int, int]]) -> List[int]:
+        body = ring[:-1]
+        marks = [i for i, point in enumerate(body) if point in junctions]
+        if not marks:
+            # Closed ring with no junction: start it at its smallest point so duplicates match.
+            start = body.index(min(body))
+            return [arc_index(body[start:] + body[:start + 1])]
+        rotated = body[marks[0]:] + body[:marks[0]] + [body[marks[0]]]
+        cuts = [i for i, point in enumerate(rotated) if point in junctions]
+        return [arc_index(rotated[a:b + 1]) for a, b in zip(cuts, cuts[1:])]
+
+    objects: Dict[str, List[Dict[str, Any]]] = {}
+    for layer, items in features.items():
+        objects[layer] = []
+        for feature, polys in zip(items, quantized[layer]):
+            if not polys:
+                continue
+            points = [pt for poly in polys for ring in poly for pt in ring]
+            xs, ys = [p[0] for p in points], [p[1] for p in points]
+            polygon_arcs = [[cut(ring) for ring in poly] for poly in polys]
+            objects[layer].append({
+                "type": "Polygon" if len(polys) == 1 else "MultiPolygon",
+                "arcs": polygon_arcs[0] if len(polys) == 1 else polygon_arcs,
+                "properties": feature["properties"],
+                "bbox": [min(xs), min(ys), max(xs), max(ys)],
+            })
+
+    levels = []
+    for points in arcs:
+        coords = np.asarray(points, dtype=float) * scale + translate
+        importance = dp_importance(to_meters(coords))
+        closed = points[0] == points[-1]
+        level = np.full(len(points), FULL_DETAIL, dtype=np.int64)
+        for zoom in reversed(ZOOM_LEVELS):
+            level[_keep_mask(importance, tolerance_for_zoom(zoom), 2 if closed else 1)] = zoom
+        levels.append(level.tolist())
+
+    return {
+        "version": FORMAT_VERSION,
+        "transform": {"scale": list(scale), "translate": list(translate)},
+        "arcs": [[list(p) for p in points] for points in arcs],
+        "levels": levels,
+        "objects": objects,
+    }
+
+def _arc_refs(arcs: Any) -> List[int]:
+    if isinstance(arcs, int):
+        return [arcs]
+    return [ref for item in arcs for ref in _arc_refs(item)]
+
+def _remap(arcs: Any, mapping: Dict[int, int]) -> Any:
+    if isinstance(arcs, int):
+        return mapping[arcs] if arcs >= 0 else ~mapping[~arcs]
+    return [_remap(item, mapping) for item in arcs]
+
+class Topology:
+    """A built topology with per-zoom encodings memoized (full extent only)."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.scale = np.asarray(data["transform"]["scale"])
+        self.translate = np.asarray(data["transform"]["translate"])
+        self.arcs = [np.asarray(points, dtype=np.int64) for points in data["arcs"]]
+        self.levels = [np.asarray(level, dtype=np.int64) for level in data["levels"]]
+        self.bboxes = {layer: np.asarray([g["bbox"] for g in geoms], dtype=float).reshape(-1, 4) for layer, geoms in data["objects"].items()}
+        self.etag = hashlib.sha256(json.dumps(data, separators=(",", ":")).encode("utf-8")).hexdigest()[:32]
+        self._encoded: Dict[Tuple, Tuple[bytes, bytes]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def level_for_zoom(zoom: Optional[float]) -> int:
+        """The precomputed level to serve for a map at ``zoom``; above the last level, full detail."""
+        if zoom is None:
+            return FULL_DETAIL
+        if zoom > ZOOM_LEVELS[-1]:
+            return FULL_DETAIL
+        return max([level for level in ZOOM_LEVELS if level <= zoom] or [ZOOM_LEVELS[0]])
+
+    def _select(self, layer: str, bbox: Optional[Sequence[float]]) -> List[int]:
+        boxes = self.bboxes[layer]
+        if bbox is None:
+            return list(range(len(boxes)))
+        min_lng, min_lat, max_lng, max_lat = bbox
+        lo = (np.asarray([min_lng, min_lat]) - self.translate) / self.scale
+        hi = (np.asarray([max_lng, max_lat]) - self.translate) / self.scale
+        hits = (boxes[:, 0] <= hi[0]) & (boxes[:, 2] >= lo[0]) & (boxes[:, 1] <= hi[1]) & (boxes[:, 3] >= lo[1])
+        return np.flatnonzero(hits).tolist()
+
+    def encode(self, level: int, layers: Sequence[str] = tuple(LAYERS), bbox: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+        """TopoJSON for ``layers`` at ``level``, limited to geometries whose bbox crosses ``bbox``."""
+        objects: Dict[str, Any] = {}
+        used: Dict[int, int] = {}
+        for layer in layers:
+            geometries = []
+            for index in self._select(layer, bbox):
+                geometry = self.data["objects"][layer][index]
+                for ref in _arc_refs(geometry["arcs"]):
+                    used.setdefault(ref if ref >= 0 else ~ref, len(used))
+                geometries.append(geometry)
+            objects[layer] = {"type": "GeometryCollection", "geometries": geometries}
+        for layer in objects:
+            objects[layer]["geometries"] = [
+                {"type": g["type"], "arcs": _remap(g["arcs"], used), "properties": g["properties"]}
+                for g in objects[layer]["geometries"]
+            ]
+        arcs = []
+        for original in sorted(used, key=used.get):
+            points = self.arcs[original][self.levels[original] <= level]
+            arcs.append(np.vstack((points[:1], np.diff(points, axis=0))).tolist())
+        return {
+            "type": "Topology",
+            "transform": self.data["transform"],
+            "level": level,
+            "objects": objects,
+            "arcs": arcs,
+        }
+
+    def encoded(self, level: int, layers: Sequence[str] = tuple(LAYERS), bbox: Optional[Sequence[float]] = None) -> Tuple[bytes, bytes]:
+        """``(json_bytes, gzip_bytes)``; whole-city documents are built once per level and layer set."""
+        key = (level, tuple(layers))
+        if bbox is None and key in self._encoded:
+            return self._encoded[key]
+        body = json.dumps(self.encode(level, layers, bbox), separators=(",", ":")).encode("utf-8")
+        result = (body, gzip.compress(body, 6))
+        if bbox is None:
+            with self._lock:
+                self._encoded[key] = result
+        return result
+
+def to_geojson(document: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Decode an encoded topology back to one GeoJSON FeatureCollection per layer."""
+    scale = document["transform"]["scale"]
+    translate = document["transform"]["translate"]
+    arcs = []
+    for deltas in document["arcs"]:
+        absolute = np.cumsum(np.asarray(deltas, dtype=np.int64).reshape(-1, 2), axis=0)
+        arcs.append((absolute * scale + translate).tolist())
+
+    def ring(refs: List[int]) -> List[List[float]]:
+        points: List[List[float]] = []
+        for ref in refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            points.extend(arc[1:] if points else arc)
+        return points
+
+    collections = {}
+    for layer, obj in document["objects"].items():
+        features = []
+        for geometry in obj["geometries"]:
+            if geometry["type"] == "Polygon":
+                coordinates = [ring(refs) for refs in geometry["arcs"]]
+            else:
+                coordinates = [[ring(refs) for refs in polygon] for polygon in geometry["arcs"]]
+            features.append({"type": "Feature", "properties": geometry["properties"],
+                             "geometry": {"type": geometry["type"], "coordinates": coordinates}})
+        collections[layer] = {"type": "FeatureCollection", "features": features}
+    return collections
+
+def _source_hash(data_dir: Path) -> str:
+    digest = hashlib.sha256(str(FORMAT_VERSION).encode("ascii"))
+    for filename, _ in LAYERS.values():
+        digest.update((Path(data_dir) / filename).read_bytes())
+    return digest.hexdigest()[:32]
+
+def load_or_build(data_dir: Path, cache_dir: Path) -> Topology:
+    """Load the topology built for the current boundary files, building it if missing."""
+    target = Path(cache_dir) / f"{_source_hash(data_dir)}.json"
+    if not target.exists():
+        data = build(data_dir)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".build-")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(data, handle, separators=(",", ":"))
+        os.replace(tmp, target)
+        return Topology(data)
+    return Topology(json.loads(target.read_text(encoding="utf-8")))
+
+_topology: Optional[Topology] = None
+_topology_lock = threading.Lock()
+
+def get_topology() -> Topology:
+    global _topology
+    if _topology is None:
+        with _topology_lock:
+            if _topology is None:
+                data_dir = current_app.config.get("WARD_DATA_DIR") or wards.DEFAULT_DATA_DIR
+                _topology = load_or_build(data_dir, Path(current_app.instance_path) / "topology")
+    return _topology
+
+if __name__ == "__main__":
+    # Build step: `python topology.py [--data-dir ../js] [--output instance/topology]`.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the quantized ward/district topology.")
+    parser.add_argument("--data-dir", type=Path, default=wards.DEFAULT_DATA_DIR)
+    parser.add_argument("--output", type=Path, default=Path(__file__).resolve().parent / "instance" / "topology")
+    args = parser.parse_args()
+    built = load_or_build(args.data_dir, args.output)
+    for level in (*ZOOM_LEVELS, FULL_DETAIL):
+        body, compressed = built.encoded(level)
+        print(f"level {level:>2}: {len(body):>8} bytes, {len(compressed):>7} gzipped")
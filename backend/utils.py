@@ -1,16 +1,26 @@
+import asyncio
 import base64
 import copy
+import hashlib
+import io
 import json
-import re
-import uuid
 import mimetypes
-import markdown2
 from math import ceil
+from urllib.parse import urlencode
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 from werkzeug.utils import secure_filename
-import requests
 from flask import current_app, request, flash, redirect, url_for
+import aio
+import geometry
+import image_prep
+import image_store
+import metrics
+import ratelimit
+import resilience
+import vegetation
+import ward_features
+from http_client import get_async_http_client, get_http_client
 
 def set_security_headers(response):
     csp = (
@@ -24,11 +34,22 @@ def set_security_headers(response):
         "worker-src blob:;"
     )
     response.headers['Content-Security-Policy'] = csp
+    if getattr(response, "allow_caching", False):
+        return response
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
+def allow_caching(response, max_age: int, immutable: bool = False):
+    """Mark a response as cacheable so set_security_headers keeps its Cache-Control."""
+    response.allow_caching = True
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
 def wants_json_response() -> bool:
     accept_header = request.headers.get("Accept", "")
     return "application/json" in accept_header or request.is_json
@@ -70,6 +91,13 @@ def sanitize_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
 
 def build_ai_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
     trimmed = sanitize_metadata(metadata)
+    facts = ward_features.prompt_facts(metadata.get("wardNumber"))
+    if facts is not None:
+        # Known ward: precomputed area, density and centroid instead of client-side numbers and raw coordinates.
+        trimmed.update(facts)
+        if metadata.get("map_view"):
+            trimmed["map_zoom"] = metadata["map_view"].get("zoom")
+        return trimmed
     coordinates = metadata.get("coordinates", {})
     center = coordinates.get("center")
     if center:
@@ -95,25 +123,52 @@ def build_ai_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
         trimmed["map_zoom"] = metadata["map_view"].get("zoom")
     return trimmed
 
-def save_analysis_image(image_bytes: bytes, mime_type: str) -> str:
-    storage_dir = Path(current_app.instance_path) / "analysis_images"
-    extension = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}.get(mime_type, "png")
-    token = f"{uuid.uuid4().hex}.{extension}"
-    path = storage_dir / token
-    path.write_bytes(image_bytes)
-    return token
+def save_analysis_image(image_bytes: bytes, mime_type: str, alias: Optional[str] = None) -> str:
+    return image_store.get_image_store().put(image_bytes, mime_type, alias=alias)
+
+def retain_analysis_image(token: Optional[str]) -> None:
+    if token:
+        image_store.get_image_store().acquire(token)
 
-def delete_analysis_image(token: Optional[str]) -> None:
+def release_analysis_image(token: Optional[str]) -> None:
     if not token:
         return
-    storage_dir = Path(current_app.instance_path) / "analysis_images"
-    path = storage_dir / token
     try:
-        path.unlink(missing_ok=True)
+        image_store.get_image_store().release(token)
     except Exception:
         pass
 
-def prepare_image_for_analysis(file_storage) -> Tuple[Dict[str, str], str, str]:
+def analysis_image_path(token: str) -> Optional[Path]:
+    return image_store.get_image_store().path_for(token)
+
+def load_image_part(token: str, mime_type: Optional[str]) -> Optional[Dict[str, str]]:
+    path = analysis_image_path(token)
+    if path is None or not path.exists():
+        return None
+    return {"mime_type": mime_type or "image/png", "data": base64.b64encode(path.read_bytes()).decode("utf-8")}
+
+def _preprocess_and_store(source: BinaryIO, size: int, mime_type: str) -> Tuple[Dict[str, str], str, str, Optional[Dict[str, Any]]]:
+    """Downscale and recompress an image for Gemini, store it, and return ``(image_part, token, mime, stats)``.
+
+    With ``IMAGE_PREPROCESS_ENABLED`` off the original is streamed to the store
+    unchanged and ``stats`` is None.
+    """
+    config = current_app.config
+    if not config.get("IMAGE_PREPROCESS_ENABLED", True):
+        token = image_store.get_image_store().put_stream(source, mime_type)
+        return load_image_part(token, mime_type), token, mime_type, None
+    data, out_mime, stats = image_prep.preprocess(
+        source,
+        size,
+        max_edge=int(config.get("IMAGE_MAX_EDGE", 1024)),
+        quality=int(config.get("IMAGE_QUALITY", 85)),
+        max_bytes=int(config.get("IMAGE_MAX_BYTES", 400_000)),
+        fmt=config.get("IMAGE_OUTPUT_FORMAT", "jpeg"),
+    )
+    current_app.logger.info("Image preprocessed", extra={"image_stats": stats})
+    return {"mime_type": out_mime, "data": base64.b64encode(data).decode("utf-8")}, save_analysis_image(data, out_mime), out_mime, stats
+
+def prepare_image_for_analysis(file_storage) -> Tuple[Dict[str, str], str, str, Optional[Dict[str, Any]]]:
     filename = secure_filename(file_storage.filename or "image")
     extension = filename.rsplit(".", 1)[-1].lower()
     mime_type = {
@@ -122,20 +177,18 @@ def prepare_image_for_analysis(file_storage) -> Tuple[Dict[str, str], str, str]:
         "jpeg": "image/jpeg",
         "webp": "image/webp",
     }.get(extension, "image/png")
-    file_bytes = file_storage.read()
-    file_storage.seek(0)
-    return (
-        {"mime_type": mime_type, "data": base64.b64encode(file_bytes).decode("utf-8")},
-        save_analysis_image(file_bytes, mime_type),
-        mime_type,
-    )
+    # Werkzeug spools large uploads to a temp file; read from it instead of loading the bytes.
+    stream = file_storage.stream
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(0)
+    try:
+        return _preprocess_and_store(stream, size, mime_type)
+    finally:
+        stream.seek(0)
 
-def encode_image_bytes(image_bytes: bytes, mime_type: str = "image/png") -> Tuple[Dict[str, str], str, str]:
-    return (
-        {"mime_type": mime_type, "data": base64.b64encode(image_bytes).decode("utf-8")},
-        save_analysis_image(image_bytes, mime_type),
-        mime_type,
-    )
+def encode_image_bytes(image_bytes: bytes, mime_type: str = "image/png") -> Tuple[Dict[str, str], str, str, Optional[Dict[str, Any]]]:
+    return _preprocess_and_store(io.BytesIO(image_bytes), len(image_bytes), mime_type)
 
 def _simplify_path(points: List[List[float]], max_points: int = 100) -> List[List[float]]:
     if len(points) <= max_points:
@@ -143,36 +196,20 @@ def _simplify_path(points: List[List[float]], max_points: int = 100) -> List[Lis
     step = max(1, ceil(len(points) / max_points))
     return points[::step]
 
-def build_static_map_path(geojson: Dict[str, Any]) -> Optional[str]:
+def build_static_map_paths(geojson: Dict[str, Any], max_chars: int) -> List[str]:
+    """Static Maps ``path`` values for every polygon in ``geojson``, fitted into ``max_chars``."""
     if not geojson:
-        return None
-    geometry = geojson.get("geometry", geojson)
-    if not geometry:
-        return None
-    coordinates = geometry.get("coordinates")
-    gtype = geometry.get("type")
-    if not coordinates or not gtype:
-        return None
-    def format_ring(points: List[List[float]]) -> str:
-        simplified = _simplify_path(points)
-        if simplified[0] != simplified[-1]:
-            simplified = simplified + [simplified[0]]
-        return "|".join(f"{lat},{lng}" for lng, lat in simplified)
-    path_body: Optional[str] = None
-    if gtype == "Polygon":
-        path_body = format_ring(coordinates[0])
-    elif gtype == "MultiPolygon":
-        first_polygon = coordinates[0]
-        if first_polygon:
-            path_body = format_ring(first_polygon[0])
-    if not path_body:
-        return None
-    return "fillcolor:0x3300FF66|color:0x0044FF|weight:3|" + path_body
+        return []
+    paths, tolerance = geometry.cached_static_map_paths(geojson, max_chars)
+    if tolerance:
+        current_app.logger.info(f"Ward boundary simplified at {tolerance:.1f} m to fit the Static Maps URL")
+    return paths
 
-def fetch_static_map_image(metadata: Dict[str, Any]) -> bytes:
-    google_maps_api_key = current_app.config["GOOGLE_MAPS_API_KEY"]
-    if not google_maps_api_key:
-        raise RuntimeError("GOOGLE_MAPS_API_KEY is not configured.")
+# Upper bound per fetch; the request's latency budget can only shorten it.
+STATIC_MAP_TIMEOUT_SECONDS = 30
+
+def static_map_view(metadata: Dict[str, Any]) -> Tuple[float, float, int]:
+    """The ``(lat, lng, zoom)`` the ward's static map is centred on and rendered at."""
     center = metadata.get("coordinates", {}).get("center", {})
     bbox = metadata.get("coordinates", {}).get("bounding_box", {})
     lat = center.get("lat")
@@ -203,38 +240,100 @@ def fetch_static_map_image(metadata: Dict[str, Any]) -> bytes:
         if zoom is None:
             zoom = 15
         zoom = max(12, int(zoom) - 1)
-    zoom = max(12, min(int(round(zoom)), 19))
+    return lat, lng, max(12, min(int(round(zoom)), 19))
+
+def _static_map_request(metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any], str]:
+    """Build the Static Maps ``(url, params, image store alias)`` for a ward."""
+    google_maps_api_key = current_app.config["GOOGLE_MAPS_API_KEY"]
+    if not google_maps_api_key:
+        raise RuntimeError("GOOGLE_MAPS_API_KEY is not configured.")
+    lat, lng, zoom = static_map_view(metadata)
     params = {
         "key": google_maps_api_key,
         "center": f"{lat},{lng}",
         "zoom": str(zoom),
-        "size": "640x640",
+        "size": f"{vegetation.STATIC_MAP_SIZE}x{vegetation.STATIC_MAP_SIZE}",
         "maptype": "satellite",
-        "scale": "2",
+        "scale": str(vegetation.STATIC_MAP_SCALE),
         "format": "png",
     }
-    path_param = build_static_map_path(metadata.get("ward_geojson"))
+    static_maps_url = current_app.config.get("STATIC_MAPS_URL", "https://maps.googleapis.com/maps/api/staticmap")
+    base_url_length = len(static_maps_url) + 1 + len(urlencode(params))
+    path_param = build_static_map_paths(
+        metadata.get("ward_geojson"),
+        int(current_app.config.get("STATIC_MAP_URL_MAX_LENGTH", 16384)) - base_url_length - 64,
+    )
     if path_param:
         params["path"] = path_param
-    static_map_url = "https://maps.googleapis.com/maps/api/staticmap?" + "&".join([f"{k}={v}" for k, v in params.items()])
+    store_alias = "staticmap:" + hashlib.sha256(
+        json.dumps({k: v for k, v in params.items() if k != "key"}, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    static_map_url = static_maps_url + "?" + urlencode(params, doseq=True)
     current_app.logger.info(
-        "Fetching static satellite map",
+        "Static satellite map request",
         extra={
             "center": f"{lat},{lng}",
             "zoom": zoom,
             "has_boundary": bool(path_param),
-            "bbox_span": f"{lat_span:.4f}°lat x {lng_span:.4f}°lng" if 'lat_span' in locals() else "N/A",
             "url_length": len(static_map_url),
             "url_preview": static_map_url[:200] + "..." if len(static_map_url) > 200 else static_map_url
         }
     )
-    response = requests.get("https://maps.googleapis.com/maps/api/staticmap", params=params, timeout=30)
-    response.raise_for_status()
-    content_length = len(response.content)
-    current_app.logger.info(f"Static map received: {content_length} bytes, content-type: {response.headers.get('content-type')}")
-    if content_length < 5000:
-        current_app.logger.warning(f"Static map image seems too small ({content_length} bytes) - may contain error message")
-    return response.content
+    return static_maps_url, params, store_alias
+
+def _keep_static_map(content: bytes, content_type: Optional[str], store_alias: str) -> bytes:
+    current_app.logger.info(f"Static map received: {len(content)} bytes, content-type: {content_type}")
+    if len(content) < 5000:
+        current_app.logger.warning(f"Static map image seems too small ({len(content)} bytes) - may contain error message")
+    else:
+        save_analysis_image(content, "image/png", alias=store_alias)
+    return content
+
+def cached_static_map(metadata: Dict[str, Any]) -> Optional[bytes]:
+    """The ward's static map if the image store already has it; never calls Static Maps."""
+    _, _, store_alias = _static_map_request(metadata)
+    return image_store.get_image_store().get_by_alias(store_alias)
+
+def fetch_static_map_image(metadata: Dict[str, Any]) -> bytes:
+    static_maps_url, params, store_alias = _static_map_request(metadata)
+    cached_image = image_store.get_image_store().get_by_alias(store_alias)
+    metrics.cache_lookup("static_map", cached_image is not None)
+    if cached_image is not None:
+        current_app.logger.info(f"Static map served from image store: {len(cached_image)} bytes")
+        return cached_image
+    ratelimit.wait("static_maps")
+    with resilience.guard("static_maps"):
+        with metrics.upstream_call("static_maps", "fetch"):
+            response = get_http_client().get(static_maps_url, params=params, timeout=resilience.timeout(STATIC_MAP_TIMEOUT_SECONDS))
+            response.raise_for_status()
+    metrics.count_bytes("static_maps", received=len(response.content))
+    return _keep_static_map(response.content, response.headers.get("content-type"), store_alias)
+
+async def fetch_static_map_image_async(metadata: Dict[str, Any]) -> bytes:
+    """``fetch_static_map_image`` for the ``aio`` loop; needs an app context in the calling task.
+
+    Image store reads and writes run on worker threads so disk I/O never stalls the loop.
+    A fetch still running after ``STATIC_MAP_HEDGE_SECONDS`` is hedged with a second one.
+    """
+    static_maps_url, params, store_alias = _static_map_request(metadata)
+    cached_image = await asyncio.to_thread(image_store.get_image_store().get_by_alias, store_alias)
+    metrics.cache_lookup("static_map", cached_image is not None)
+    if cached_image is not None:
+        current_app.logger.info(f"Static map served from image store: {len(cached_image)} bytes")
+        return cached_image
+
+    async def attempt():
+        async with aio.limit("static_maps"):
+            response = await get_async_http_client().get(static_maps_url, params=params, timeout=resilience.timeout(STATIC_MAP_TIMEOUT_SECONDS))
+        response.raise_for_status()
+        return response
+
+    hedge_after = float(current_app.config.get("STATIC_MAP_HEDGE_SECONDS", 2) or 0)
+    # Each attempt waits for its own quota token inside the guard; a DeadlineExceeded from that wait is neutral to the breaker.
+    with resilience.guard("static_maps"), metrics.upstream_call("static_maps", "fetch"):
+        response = await resilience.hedge(attempt, hedge_after, "static_maps")
+    metrics.count_bytes("static_maps", received=len(response.content))
+    return await asyncio.to_thread(_keep_static_map, response.content, response.headers.get("content-type"), store_alias)
 
 def _extract_text_from_gemini(response: Any) -> str:
     text = getattr(response, "text", None)
@@ -253,62 +352,3 @@ def _extract_text_from_gemini(response: Any) -> str:
     feedback = getattr(response, "prompt_feedback", None)
     raise ValueError(f"Gemini returned no usable text (feedback={feedback})")
 
-def parse_numbered_list(content: str) -> List[str]:
-    suggestions: List[str] = []
-    for line in content.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        m = re.match(r"^(?:[-•]\s*)?(\d+)[\.\)]\s*(.+)$", line)
-        if m:
-            suggestions.append(m.group(2).strip())
-            continue
-        m2 = re.match(r"^(?:[-•]\s*)(.+)$", line)
-        if m2:
-            suggestions.append(m2.group(1).strip())
-    return suggestions or [content.strip()]
-
-def strip_reference_citations(text: Optional[str]) -> str:
-    """Remove Perplexity-style reference markers like [1], [2][3] from a line.
-    Keeps the rest of the text intact and collapses extra spaces.
-    """
-    if not isinstance(text, str):
-        return ""
-    # Remove one or more occurrences of [digits], optionally preceded by spaces
-    cleaned = re.sub(r"(?:\s*\[\d+\])+", "", text)
-    # Remove stray spaces before punctuation like .,;:)
-    cleaned = re.sub(r"\s+([,.;:)])", r"\1", cleaned)
-    # Collapse multiple spaces
-    cleaned = re.sub(r"\s{2,}", " ", cleaned).strip()
-    return cleaned
-
-def normalize_tree_bold_markdown(text: Optional[str]) -> str:
-    """Normalize Perplexity tree suggestion so only the common name is bold.
-    Converts patterns like '**Jamun (Syzygium cumini)** — rationale' to
-    '**Jamun** (Syzygium cumini) — rationale'. If already correct, returns as-is.
-    """
-    if not isinstance(text, str):
-        return ""
-    line = text.strip()
-    # Regex: optional leading numbering, then **Name (Latin)**, then the rest
-    m = re.match(r"^(?:\d+[\.)]\s*)?\*\*([^*()]+?)\s*\(([^)]+)\)\*\*(.*)$", line)
-    if m:
-        name = m.group(1).strip()
-        latin = m.group(2).strip()
-        tail = m.group(3)
-        return f"**{name}** ({latin}){tail}"
-    return line
-
-def render_markdown_html(text: Optional[str]) -> Optional[str]:
-    if not text:
-        return None
-    normalized = re.sub(r"(?<!\n)\s\*\s", "\n* ", text)
-    normalized = re.sub(r"\n\*(?=\s)", "\n\n*", normalized)
-    if not markdown2:
-        sanitized = normalized.replace("**", "").replace("__", "")
-        sanitized = sanitized.replace("* ", "• ")
-        return sanitized.replace("\n", "<br>")
-    try:
-        return markdown2.markdown(normalized, extras=["fenced-code-blocks", "tables", "strike"])
-    except Exception:
-        return normalized.replace("\n", "<br>")
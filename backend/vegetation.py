@@ -0,0 +1,211 @@
+"""Local, CPU-only greenery estimate from a satellite image.
+
+Counts vegetation pixels with vectorized NumPy: a pixel is vegetation when its
+excess-green index ``(2G - R - B) / (R + G + B)`` is above ``EXG_THRESHOLD``
+and green is its strongest channel (an HSV hue between yellow and cyan) with
+enough saturation and brightness to rule out shadows and grey roofs. For a
+Static Maps image only pixels inside the ward count: the ward polygon is
+projected onto the image (Web Mercator, as Google renders it), rasterized with
+a scanline fill, and the translucent blue fill the map draws over the ward is
+blended back out. An uploaded image is scored whole.
+
+The estimate takes a few milliseconds. ``pipeline`` uses it as a preliminary
+score while Gemini works, in place of Gemini in fast mode, and to decide
+which scale (0-10 or 0-100) a Gemini score is on.
+"""
+import io
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+import geometry
+import metrics
+
+EXG_THRESHOLD = 0.05
+MIN_SATURATION = 0.1
+MIN_VALUE = 0.12
+# Scoring at this resolution is as accurate as full size; JPEG decodes straight to it at 1/4 scale.
+MAX_EDGE = 256
+STATIC_MAP_SIZE = 640
+STATIC_MAP_SCALE = 2
+TILE_SIZE = 256
+
+def _fill_colour() -> Tuple[np.ndarray, float]:
+    # "fillcolor:0xRRGGBBAA" in the path style the static map is requested with.
+    rgba = geometry.STATIC_MAP_PATH_STYLE.split("fillcolor:0x", 1)[1][:8]
+    return np.array([int(rgba[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.float32), int(rgba[6:8], 16) / 255
+
+FILL_RGB, FILL_ALPHA = _fill_colour()
+
+def decode(image_bytes: bytes, max_edge: int = MAX_EDGE) -> np.ndarray:
+    """Decode to an RGB float array no larger than ``max_edge``, box-averaged so blends stay linear."""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("RGB", (max_edge, max_edge))
+    image = image.convert("RGB")
+    factor = max(1, math.ceil(max(image.size) / max_edge))
+    if factor > 1:
+        image = image.reduce(factor)
+    return np.asarray(image, dtype=np.float32)
+
+def _world_pixels(lnglat: np.ndarray, zoom: int) -> np.ndarray:
+    """Web Mercator pixel coordinates of ``[[lng, lat], ...]`` at ``zoom``."""
+    scale = TILE_SIZE * 2 ** zoom
+    lat = np.radians(np.clip(lnglat[:, 1], -85.05, 85.05))
+    x = (lnglat[:, 0] + 180.0) / 360.0 * scale
+    y = (0.5 - np.log(np.tan(np.pi / 4 + lat / 2)) / (2 * np.pi)) * scale
+    return np.column_stack((x, y))
+
+def polygon_mask(rings: List[np.ndarray], height: int, width: int) -> np.ndarray:
+    """Even-odd fill of closed pixel-space rings, sampled at pixel centres, in one pass over all rows."""
+    mask = np.zeros((height, width), dtype=bool)
+    if not rings:
+        return mask
+    edges = np.vstack([np.hstack((ring[:-1], ring[1:])) for ring in rings])
+    x1, y1, x2, y2 = (edges[:, i][None, :] for i in range(4))
+    ys = (np.arange(height) + 0.5)[:, None]
+    rows, cols = np.nonzero((y1 > ys) != (y2 > ys))
+    if not len(rows):
+        return mask
+    x1, y1, x2, y2 = (edge[0, cols] for edge in (x1, y1, x2, y2))
+    crossing_x = x1 + (ys[rows, 0] - y1) * (x2 - x1) / (y2 - y1)
+    # Each crossing flips every pixel whose centre lies to its right.
+    first = np.clip(np.ceil(crossing_x - 0.5), 0, width).astype(np.int64)
+    toggles = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(toggles, (rows, first), 1)
+    return (np.cumsum(toggles, axis=1)[:, :width] & 1).astype(bool)
+
+def ward_mask(geojson: Dict[str, Any], view: Tuple[float, float, int], height: int, width: int) -> np.ndarray:
+    """Pixels of a ``(height, width)`` rendering of the static map ``view`` that lie inside the ward."""
+    lat, lng, zoom = view
+    centre = _world_pixels(np.array([[lng, lat]]), zoom)[0]
+    # The image covers STATIC_MAP_SIZE world pixels across, whatever its resolution.
+    per_world_pixel = np.array([width, height], dtype=float) / STATIC_MAP_SIZE
+    rings = [
+        (_world_pixels(ring, zoom) - centre) * per_world_pixel + np.array([width, height]) / 2
+        for ring in geometry.outer_rings(geojson or {})
+    ]
+    mask = polygon_mask(rings, height, width)
+    # Drop a one-pixel rim: those pixels mix in the boundary stroke and the outside.
+    inner = mask.copy()
+    inner[1:, :] &= mask[:-1, :]
+    inner[:-1, :] &= mask[1:, :]
+    inner[:, 1:] &= mask[:, :-1]
+    inner[:, :-1] &= mask[:, 1:]
+    return inner
+
+def remove_fill(rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Undo the static map's ward fill; returns ``(rgb, valid)``.
+
+    Pixels that cannot be a blend of the fill over a real colour (the boundary
+    stroke, mostly) come out of range and are marked invalid.
+    """
+    original = (rgb - FILL_ALPHA * FILL_RGB) / (1 - FILL_ALPHA)
+    in_range = (original >= -12) & (original <= 267)
+    # Per-channel slices: reducing over a length-3 last axis is far slower in NumPy.
+    valid = in_range[..., 0] & in_range[..., 1] & in_range[..., 2]
+    return np.clip(original, 0, 255, out=original), valid
+
+def vegetation_pixels(rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """``(excess_green, green_hue)`` boolean masks for an RGB float array."""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    total = r + g + b
+    brightest = np.maximum(np.maximum(r, g), b)
+    darkest = np.minimum(np.minimum(r, g), b)
+    # Ratios compared as products, so black pixels need no division.
+    excess_green = (2 * g - r - b) > EXG_THRESHOLD * total
+    saturated = (brightest - darkest) > MIN_SATURATION * brightest
+    green_hue = (g >= r) & (g >= b) & saturated & (brightest > MIN_VALUE * 255)
+    return excess_green, green_hue
+
+def score_pixels(rgb: np.ndarray, mask: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Vegetation ratios over the pixels in ``mask`` (all pixels when None)."""
+    excess_green, green_hue = vegetation_pixels(rgb)
+    selected = np.ones(rgb.shape[:2], dtype=bool) if mask is None else mask
+    pixels = int(np.count_nonzero(selected))
+    if not pixels:
+        raise ValueError("No ward pixels in the image to score.")
+    vegetation = excess_green & green_hue & selected
+    ratio = np.count_nonzero(vegetation) / pixels
+    return {
+        "greenery_score": int(round(ratio * 100)),
+        "vegetation_ratio": round(ratio, 4),
+        "excess_green_ratio": round(np.count_nonzero(excess_green & selected) / pixels, 4),
+        "green_hue_ratio": round(np.count_nonzero(green_hue & selected) / pixels, 4),
+        "pixels": pixels,
+    }
+
+def score_image(image_bytes: bytes, geojson: Optional[Dict[str, Any]] = None, view: Optional[Tuple[float, float, int]] = None) -> Dict[str, Any]:
+    """Score ``image_bytes``: within the ward when it is our Static Maps ``view`` of ``geojson``, else whole.
+
+    Returns ``greenery_score`` (0-100, the share of vegetation pixels), the ratios
+    behind it, the pixel count and the time taken. Raises ``ValueError`` or
+    ``OSError`` if the image cannot be decoded or the ward is not in it.
+    """
+    started = time.perf_counter()
+    rgb = decode(image_bytes)
+    masked = bool(geojson and view)
+    if masked:
+        mask = ward_mask(geojson, view, rgb.shape[0], rgb.shape[1])
+        rgb, valid = remove_fill(rgb)
+        result = score_pixels(rgb, mask & valid)
+    else:
+        result = score_pixels(rgb)
+    result["masked"] = masked
+    result["ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+def as_greenery(local: Dict[str, Any], metadata_for_ai: Dict[str, Any]) -> Dict[str, Any]:
+    """A greenery result in Gemini's shape built from the local estimate alone (fast mode)."""
+    percent = local["vegetation_ratio"] * 100
+    where = "the ward" if local.get("masked") else "the image"
+    population = metadata_for_ai.get("population")
+    area = metadata_for_ai.get("area_sq_km")
+    if isinstance(population, (int, float)) and population > 0 and isinstance(area, (int, float)) and area > 0:
+        per_resident = local["vegetation_ratio"] * area * 1e6 / population
+        density = metadata_for_ai.get("population_density_per_sq_km") or round(population / area)
+        population_context = (
+            f"About {int(population):,} residents at {int(density):,} per sq km, "
+            f"with roughly {per_resident:,.1f} sq m of visible vegetation per resident."
+        )
+    else:
+        population_context = "Population data is not available for this ward."
+    return {
+        "greenery_score": local["greenery_score"],
+        "greenery_summary": f"Quick estimate: about {percent:.0f}% of {where} shows vegetation in the satellite image. No AI review was run.",
+        "population_context": population_context,
+        "observations": [
+            f"{local['excess_green_ratio'] * 100:.0f}% of pixels have a high excess-green index (2G - R - B).",
+            f"{local['green_hue_ratio'] * 100:.0f}% of pixels have a green hue with enough saturation to rule out shadow and grey surfaces.",
+        ],
+        "source": "local",
+    }
+
+def check_model_score(greenery: Dict[str, Any], local: Optional[Dict[str, Any]], tolerance: float = 25) -> Dict[str, Any]:
+    """Put Gemini's ``greenery_score`` on the 0-100 scale and compare it with the local estimate.
+
+    Scores of 10 or less are ambiguous (the model sometimes answers on a 0-10
+    scale); whichever reading is closer to the local estimate wins. Without a local
+    estimate the score is left as it is.
+    """
+    try:
+        model_score = float(greenery.get("greenery_score"))
+    except (TypeError, ValueError):
+        return greenery
+    if local is None:
+        return greenery
+    checked = dict(greenery)
+    local_score = local["greenery_score"]
+    rescaled = 0 < model_score <= 10 and abs(model_score * 10 - local_score) < abs(model_score - local_score)
+    score = model_score * 10 if rescaled else model_score
+    difference = abs(score - local_score)
+    checked["greenery_score"] = int(round(score))
+    checked["score_check"] = {
+        "model_score": model_score,
+        "local_score": local_score,
+        "rescaled": rescaled,
+        "difference": round(difference, 1),
+        "agrees": difference <= tolerance,
+    }
+    metrics.GREENERY_SCORE_CHECKS.labels("rescaled" if rescaled else "agrees" if difference <= tolerance else "disagrees").inc()
+    return checked
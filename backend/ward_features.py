@@ -0,0 +1,180 @@
+"""Per-ward features for the AI prompts, precomputed for every ward at once.
+
+Geodesic area, perimeter, compactness (Polsby-Popper), population density and
+centroid are computed for all wards in one vectorized NumPy pass over the ward
+polygons in ``delhi_wards.json`` joined with ``delhi_ward_population.csv``. The
+result is a single ``(column, ward)`` float64 array saved under
+``instance/ward_features/<fingerprint>/``, where the fingerprint hashes the
+source files: the store is rebuilt only when they change, and every worker
+memory-maps the same file at startup. Looking a ward up is a dict hit plus one
+column read.
+"""
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from flask import current_app
+import geometry
+import wards
+
+COLUMNS = ("area_sq_km", "perimeter_km", "compactness", "population", "density_per_sq_km", "centroid_lat", "centroid_lng")
+SOURCE_FILES = ("delhi_wards.json", "delhi_ward_population.csv")
+# Bump when COLUMNS or the formulas change so existing stores are rebuilt.
+FORMAT_VERSION = "ward-features-v1"
+
+def source_fingerprint(data_dir: Path) -> str:
+    digest = hashlib.sha256(FORMAT_VERSION.encode("utf-8"))
+    for name in SOURCE_FILES:
+        digest.update((Path(data_dir) / name).read_bytes())
+    return digest.hexdigest()[:32]
+
+def compute_columns(rings: List[np.ndarray], ring_ward: np.ndarray, populations: np.ndarray) -> np.ndarray:
+    """Feature columns (``COLUMNS`` x wards) for closed ``[[lng, lat], ...]`` outer rings.
+
+    ``rings[i]`` belongs to ward ``ring_ward[i]``; ``populations`` holds one value per
+    ward, NaN where unknown. Every edge of every ring is processed in one pass.
+    """
+    n_rings, n_wards = len(rings), len(populations)
+    start = np.vstack([ring[:-1] for ring in rings])
+    end = np.vstack([ring[1:] for ring in rings])
+    edge_ring = np.repeat(np.arange(n_rings), [len(ring) - 1 for ring in rings])
+    lng1, lat1 = np.radians(start[:, 0]), np.radians(start[:, 1])
+    lng2, lat2 = np.radians(end[:, 0]), np.radians(end[:, 1])
+    radius = wards.EARTH_RADIUS_KM
+
+    # Area of each ring on the sphere (line integral of sin(lat) d(lng)).
+    ring_area = np.abs(np.bincount(edge_ring, (lng2 - lng1) * (2 + np.sin(lat1) + np.sin(lat2)), n_rings)) * radius ** 2 / 2
+    # Great-circle (haversine) length of each edge.
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    ring_perimeter = np.bincount(edge_ring, 2 * radius * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0))), n_rings)
+    # Shoelace centroid of each ring; scaling longitude to a local plane does not move it.
+    cross = start[:, 0] * end[:, 1] - end[:, 0] * start[:, 1]
+    twice_area = np.bincount(edge_ring, cross, n_rings)
+    first = np.array([ring[0] for ring in rings])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ring_lng = np.where(twice_area != 0, np.bincount(edge_ring, (start[:, 0] + end[:, 0]) * cross, n_rings) / (3 * twice_area), first[:, 0])
+        ring_lat = np.where(twice_area != 0, np.bincount(edge_ring, (start[:, 1] + end[:, 1]) * cross, n_rings) / (3 * twice_area), first[:, 1])
+
+    area = np.bincount(ring_ward, ring_area, n_wards)
+    perimeter = np.bincount(ring_ward, ring_perimeter, n_wards)
+    ring_count = np.bincount(ring_ward, minlength=n_wards)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Area-weighted over a ward's polygons; the plain mean for degenerate (zero-area) wards.
+        centroid_lng = np.where(area > 0, np.bincount(ring_ward, ring_area * ring_lng, n_wards) / area, np.bincount(ring_ward, ring_lng, n_wards) / ring_count)
+        centroid_lat = np.where(area > 0, np.bincount(ring_ward, ring_area * ring_lat, n_wards) / area, np.bincount(ring_ward, ring_lat, n_wards) / ring_count)
+        compactness = np.where(perimeter > 0, 4 * math.pi * area / perimeter ** 2, 0.0)
+        density = np.where(area > 0, populations / area, np.nan)
+    return np.vstack((area, perimeter, compactness, populations, density, centroid_lat, centroid_lng))
+
+def _read_sources(data_dir: Path) -> Tuple[List[str], List[np.ndarray], np.ndarray, np.ndarray]:
+    populations_by_name = wards.read_populations(data_dir)
+    document = json.loads((Path(data_dir) / "delhi_wards.json").read_text(encoding="utf-8"))
+    keys: List[str] = []
+    rings: List[np.ndarray] = []
+    ring_ward: List[int] = []
+    populations: List[float] = []
+    for feature in document.get("features", []):
+        props = feature.get("properties") or {}
+        ward_id = str(props.get("Ward_No") or "").strip()
+        ward_rings = geometry.outer_rings(feature.get("geometry") or {})
+        if not ward_id or not ward_rings:
+            continue
+        population = wards.population_for(populations_by_name, str(props.get("Ward_Name") or "").strip())
+        ring_ward.extend([len(keys)] * len(ward_rings))
+        rings.extend(ward_rings)
+        keys.append(ward_id)
+        populations.append(np.nan if population is None else float(population))
+    return keys, rings, np.asarray(ring_ward, dtype=np.int64), np.asarray(populations, dtype=float)
+
+class WardFeatures:
+    """Memory-mapped feature columns with an index from ward id to column position."""
+
+    def __init__(self, columns: np.ndarray, keys: List[str], fingerprint: str):
+        self.columns = columns
+        self.keys = keys
+        self.fingerprint = fingerprint
+        # Later duplicates win, as in the ward registry.
+        self._positions = {key: position for position, key in enumerate(keys)}
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[COLUMNS.index(name)]
+
+    def get(self, ward_id: Optional[str]) -> Optional[Dict[str, float]]:
+        position = self._positions.get(str(ward_id or "").strip())
+        if position is None:
+            return None
+        return dict(zip(COLUMNS, self.columns[:, position].tolist()))
+
+    def prompt_facts(self, ward_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The ward's features rounded for a prompt; population and density only when known."""
+        values = self.get(ward_id)
+        if values is None:
+            return None
+        facts: Dict[str, Any] = {
+            "area_sq_km": round(values["area_sq_km"], 3),
+            "perimeter_km": round(values["perimeter_km"], 2),
+            "compactness": round(values["compactness"], 3),
+            "center_point": {"lat": round(values["centroid_lat"], 6), "lng": round(values["centroid_lng"], 6)},
+        }
+        if not math.isnan(values["population"]):
+            facts["population"] = int(values["population"])
+        if not math.isnan(values["density_per_sq_km"]):
+            facts["population_density_per_sq_km"] = int(round(values["density_per_sq_km"]))
+        return facts
+
+def load_or_build(data_dir: Path, cache_dir: Path) -> WardFeatures:
+    """Memory-map the store built from the current source files, building it if missing."""
+    fingerprint = source_fingerprint(data_dir)
+    target = Path(cache_dir) / fingerprint
+    if not (target / "keys.json").exists():
+        keys, rings, ring_ward, populations = _read_sources(data_dir)
+        columns = compute_columns(rings, ring_ward, populations)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=target.parent, prefix=".build-"))
+        np.save(staging / "features.npy", columns)
+        (staging / "keys.json").write_text(json.dumps({"columns": list(COLUMNS), "keys": keys}), encoding="utf-8")
+        try:
+            os.replace(staging, target)
+        except OSError:
+            # Another worker published the same version first.
+            for leftover in staging.iterdir():
+                leftover.unlink()
+            staging.rmdir()
+    index = json.loads((target / "keys.json").read_text(encoding="utf-8"))
+    return WardFeatures(np.load(target / "features.npy", mmap_mode="r"), index["keys"], fingerprint)
+
+_features: Optional[WardFeatures] = None
+_features_loaded = False
+_features_lock = threading.Lock()
+
+def _load(app) -> Optional[WardFeatures]:
+    global _features, _features_loaded
+    data_dir = app.config.get("WARD_DATA_DIR") or wards.DEFAULT_DATA_DIR
+    try:
+        _features = load_or_build(Path(data_dir), Path(app.instance_path) / "ward_features")
+    except (OSError, ValueError) as exc:
+        app.logger.warning("Ward feature store unavailable; prompts get the client metadata only: %s", exc)
+        _features = None
+    _features_loaded = True
+    return _features
+
+def init_app(app) -> Optional[WardFeatures]:
+    """Map the feature store (building it when the source files changed) as the worker starts."""
+    with _features_lock:
+        return _load(app)
+
+def get_ward_features() -> Optional[WardFeatures]:
+    if not _features_loaded:
+        with _features_lock:
+            if not _features_loaded:
+                _load(current_app)
+    return _features
+
+def prompt_facts(ward_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    features = get_ward_features()
+    return features.prompt_facts(ward_id) if features is not None else None
@@ -0,0 +1,206 @@
+import csv
+import hashlib
+import json
+import math
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from flask import current_app
+from geometry import simplify_ring
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / "js"
+EARTH_RADIUS_KM = 6371.0088
+BOUNDARY_TOLERANCE_M = 10.0
+
+def normalize_ward_key(name: Optional[str], no_spaces: bool = False) -> str:
+    """Python port of ``normalizeWardKey`` in js/script.js used to join the population CSV."""
+    if not name:
+        return ""
+    s = str(name).upper()
+    s = s.replace("&", " AND ")
+    s = re.sub(r"[.,'’()]", " ", s)
+    s = s.replace("-", " ")
+    s = re.sub(r"\bEXTN\b", " EXTENSION ", s)
+    s = re.sub(r"\bEXT\.?\b", " EXTENSION ", s)
+    s = re.sub(r"\bEXTENTION\b", " EXTENSION ", s)
+    s = re.sub(r"\bI\s*\.?\s*P\b", " IP ", s)
+    s = re.sub(r"\bJAHAGIR\b", " JAHANGIR ", s)
+    s = re.sub(r"\bBHALASWA\b", " BHALSWA ", s)
+    s = re.sub(r"\bPHASE\s*-?\s*I\b", " PHASE 1", s)
+    s = re.sub(r"\bPHASE\s*-?\s*II\b", " PHASE 2", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    if no_spaces:
+        s = s.replace(" ", "")
+    return s
+
+def _outer_rings(geometry: Dict[str, Any]) -> List[List[List[float]]]:
+    gtype = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+    if gtype == "Polygon":
+        return [coordinates[0]] if coordinates else []
+    if gtype == "MultiPolygon":
+        return [polygon[0] for polygon in coordinates if polygon]
+    return []
+
+def _ring_metrics(ring: List[List[float]]) -> Tuple[float, float, float]:
+    """Return (area_km2, centroid_lng, centroid_lat) using a local equirectangular projection."""
+    lat0 = math.radians(sum(pt[1] for pt in ring) / len(ring))
+    kx = math.radians(1) * EARTH_RADIUS_KM * math.cos(lat0)
+    ky = math.radians(1) * EARTH_RADIUS_KM
+    twice_area = cx = cy = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        cross = x1 * y2 - x2 * y1
+        twice_area += cross
+        cx += (x1 + x2) * cross
+        cy += (y1 + y2) * cross
+    if twice_area == 0:
+        return 0.0, ring[0][0], ring[0][1]
+    return abs(twice_area / 2) * kx * ky, cx / (3 * twice_area), cy / (3 * twice_area)
+
+def _point_in_ring(lng: float, lat: float, ring: List[List[float]]) -> bool:
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def read_populations(data_dir: Path) -> Dict[str, int]:
+    """Ward populations from ``delhi_ward_population.csv``, keyed by normalized name (with and without spaces)."""
+    populations: Dict[str, int] = {}
+    with open(Path(data_dir) / "delhi_ward_population.csv", newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            digits = re.sub(r"\D", "", row.get("total_population") or "")
+            if row.get("ward") and digits:
+                populations[normalize_ward_key(row["ward"])] = int(digits)
+                populations[normalize_ward_key(row["ward"], True)] = int(digits)
+    return populations
+
+def population_for(populations: Dict[str, int], name: str) -> Optional[int]:
+    population = populations.get(normalize_ward_key(name))
+    if population is None:
+        population = populations.get(normalize_ward_key(name, True))
+    return population
+
+def _district_display_name(name: str) -> str:
+    # delhi_wards.geojson names districts "North West Delhi"; the map UI uses "North West".
+    if name.endswith(" Delhi") and name != "New Delhi":
+        return name[: -len(" Delhi")]
+    return name
+
+class WardRegistry:
+    """Ward geometry, population and derived metrics parsed once from the files in ``js/``."""
+
+    def __init__(self, data_dir: Path = DEFAULT_DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self.wards: Dict[str, Dict[str, Any]] = {}
+        self.districts: List[Dict[str, Any]] = []
+        self._load()
+        summaries = [self.summary(ward_id) for ward_id in self.wards]
+        self.summary_json = json.dumps({"wards": summaries}, separators=(",", ":"))
+        self.etag = hashlib.sha256(self.summary_json.encode("utf-8")).hexdigest()[:32]
+
+    def _load(self) -> None:
+        populations = read_populations(self.data_dir)
+
+        districts = json.loads((self.data_dir / "delhi_wards.geojson").read_text(encoding="utf-8"))
+        for feature in districts.get("features", []):
+            rings = _outer_rings(feature.get("geometry") or {})
+            if not rings:
+                continue
+            lngs = [pt[0] for ring in rings for pt in ring]
+            lats = [pt[1] for ring in rings for pt in ring]
+            self.districts.append({
+                "name": _district_display_name(feature["properties"].get("name", "")),
+                "rings": rings,
+                "bbox": (min(lngs), min(lats), max(lngs), max(lats)),
+            })
+
+        wards = json.loads((self.data_dir / "delhi_wards.json").read_text(encoding="utf-8"))
+        for feature in wards.get("features", []):
+            props = feature.get("properties") or {}
+            ward_id = str(props.get("Ward_No") or "").strip()
+            geometry = feature.get("geometry") or {}
+            rings = _outer_rings(geometry)
+            if not ward_id or not rings:
+                continue
+            area = wx = wy = 0.0
+            for ring in rings:
+                ring_area, ring_cx, ring_cy = _ring_metrics(ring)
+                area += ring_area
+                wx += ring_cx * ring_area
+                wy += ring_cy * ring_area
+            lngs = [pt[0] for ring in rings for pt in ring]
+            lats = [pt[1] for ring in rings for pt in ring]
+            centroid = (wx / area, wy / area) if area else ((min(lngs) + max(lngs)) / 2, (min(lats) + max(lats)) / 2)
+            name = str(props.get("Ward_Name") or "").strip()
+            population = population_for(populations, name)
+            simplified = [[[round(x, 6), round(y, 6)] for x, y in simplify_ring(ring, BOUNDARY_TOLERANCE_M)] for ring in rings]
+            self.wards[ward_id] = {
+                "ward_id": ward_id,
+                "name": name,
+                "district": self._district_for(*centroid),
+                "population": population,
+                "area_sq_km": round(area, 4),
+                "centroid": {"lat": round(centroid[1], 6), "lng": round(centroid[0], 6)},
+                "bbox": {
+                    "southwest": {"lat": min(lats), "lng": min(lngs)},
+                    "northeast": {"lat": max(lats), "lng": max(lngs)},
+                },
+                "boundary": {
+                    "type": "Feature",
+                    "properties": {"Ward_Name": name, "Ward_No": ward_id},
+                    "geometry": {
+                        "type": "Polygon" if len(simplified) == 1 else "MultiPolygon",
+                        "coordinates": [simplified[0]] if len(simplified) == 1 else [[ring] for ring in simplified],
+                    },
+                },
+                "geometry": geometry,
+            }
+
+    def _district_for(self, lng: float, lat: float) -> Optional[str]:
+        for district in self.districts:
+            min_lng, min_lat, max_lng, max_lat = district["bbox"]
+            if not (min_lng <= lng <= max_lng and min_lat <= lat <= max_lat):
+                continue
+            if any(_point_in_ring(lng, lat, ring) for ring in district["rings"]):
+                return district["name"]
+        return None
+
+    def get(self, ward_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self.wards.get(str(ward_id or "").strip())
+
+    def summary(self, ward_id: str) -> Dict[str, Any]:
+        ward = self.wards[ward_id]
+        return {key: ward[key] for key in ("ward_id", "name", "district", "population", "area_sq_km", "centroid", "bbox")}
+
+    def analysis_metadata(self, ward_id: str) -> Optional[Dict[str, Any]]:
+        """Build the same metadata shape the map client used to post to /analyze."""
+        ward = self.get(ward_id)
+        if ward is None:
+            return None
+        return {
+            "wardName": ward["name"],
+            "wardNumber": ward["ward_id"],
+            "districtName": ward["district"] or "N/A",
+            "population": ward["population"] if ward["population"] is not None else "N/A",
+            "area_sq_km": ward["area_sq_km"],
+            "coordinates": {"bounding_box": ward["bbox"], "center": ward["centroid"]},
+            "ward_geojson": ward["boundary"],
+        }
+
+_registry: Optional[WardRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_ward_registry() -> WardRegistry:
+    """Return the process-wide registry, parsing the data files on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = WardRegistry(current_app.config.get("WARD_DATA_DIR") or DEFAULT_DATA_DIR)
+    return _registry
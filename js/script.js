@@ -4,10 +4,13 @@
 import { initializeMap } from "./map.js";
 import { createInfoPanel, setupBackButton, setupMapTypeToggle } from "./ui.js";
 import { getDistrictStyle, getWardStyle, getSelectedWardStyle, getSatelliteWardBoundaryStyle } from "./layers.js";
+import { fetchTopology } from "./topology.js";
 
 const backendMeta = document.querySelector('meta[name="backend-base-url"]');
 // Use current origin to ensure same-origin requests (avoid CORS issues)
 const BACKEND_BASE_URL = (backendMeta && backendMeta.content) || window.BACKEND_BASE_URL || window.location.origin;
+// Boundary detail level requested from /api/topology (the map zooms to about 14 for a single ward)
+const TOPOLOGY_ZOOM = 14;
 
 // --- Ward Mapping Data ---
 const districtWardMap = {
@@ -404,8 +407,16 @@ async function initMap() {
   setupMapTypeToggle(map);
 
   try {
-    districtDataGeoJson = await fetchGeoJSON("https://raw.githubusercontent.com/datta07/INDIAN-SHAPEFILES/master/STATES/DELHI/DELHI_DISTRICTS.geojson");
-    wardDataGeoJson = await fetchGeoJSON("https://raw.githubusercontent.com/datameet/Municipal_Spatial_Data/refs/heads/master/Delhi/Delhi_Wards.geojson");
+    try {
+      // One compact, shared-border download for both layers, detailed enough for a single ward
+      const layers = await fetchTopology(BACKEND_BASE_URL, { zoom: TOPOLOGY_ZOOM });
+      districtDataGeoJson = layers.districts;
+      wardDataGeoJson = layers.wards;
+    } catch (topologyErr) {
+      console.warn('Topology unavailable, loading the source GeoJSON instead:', topologyErr?.message || topologyErr);
+      districtDataGeoJson = await fetchGeoJSON("https://raw.githubusercontent.com/datta07/INDIAN-SHAPEFILES/master/STATES/DELHI/DELHI_DISTRICTS.geojson");
+      wardDataGeoJson = await fetchGeoJSON("https://raw.githubusercontent.com/datameet/Municipal_Spatial_Data/refs/heads/master/Delhi/Delhi_Wards.geojson");
+    }
     // Load CSV with population data (local file included in js/)
     try {
       const popCsvText = await fetch('./js/delhi_ward_population.csv').then(r => r.text());
@@ -739,7 +750,9 @@ async function submitWardForAnalysis(metadata, imageFile) {
       });
       console.log("Received response at", new Date().toISOString(), "Status:", response.status);
     } else {
-      const jsonBody = JSON.stringify({ metadata });
+      // The backend resolves geometry, center and population from its ward registry,
+      // so only the ward id is sent when we have one.
+      const jsonBody = JSON.stringify(metadata?.wardNumber ? { ward_id: metadata.wardNumber } : { metadata });
       console.log("JSON payload", {
         requestUrl,
         bodyPreview: jsonBody.slice(0, 4000),
@@ -791,6 +804,11 @@ async function submitWardForAnalysis(metadata, imageFile) {
     throw new Error("Backend error " + response.status + ": " + (text || response.statusText));
   }
 
+  if (response.status === 202 && payload && payload.status_url) {
+    console.log("Analysis queued as job", payload.job_id);
+    return waitForAnalysisJob(payload.status_url);
+  }
+
   const result = payload || (await response.json().catch(() => null));
   if (!result || !result.redirect_url) {
     throw new Error("Backend response missing redirect_url.");
@@ -799,6 +817,50 @@ async function submitWardForAnalysis(metadata, imageFile) {
   return result.redirect_url;
 }
 
+const JOB_STAGE_LABELS = {
+  queued: "Waiting for an analysis worker...",
+  static_map: "Fetching satellite preview...",
+  greenery: "Analyzing satellite image...",
+  trees: "Suggesting native tree species...",
+  finalizing: "Finalizing analysis...",
+};
+
+async function waitForAnalysisJob(statusPath) {
+  const JOB_TIMEOUT = 300000; // 5 minutes
+  const POLL_INTERVAL = 1000;
+  const statusUrl = new URL(statusPath, BACKEND_BASE_URL).toString();
+  const startedAt = Date.now();
+  stopLoaderPhases();
+
+  while (Date.now() - startedAt < JOB_TIMEOUT) {
+    let job = null;
+    try {
+      const response = await fetch(statusUrl, { method: "GET", credentials: "include", headers: { Accept: "application/json" } });
+      if (response.status === 404) {
+        throw new Error("Analysis job not found.");
+      }
+      job = await response.json().catch(() => null);
+    } catch (pollError) {
+      if (pollError.message === "Analysis job not found.") throw pollError;
+      console.warn("Job status poll failed; retrying", pollError?.message || pollError);
+    }
+
+    if (job) {
+      // Map the backend's 0-100 job progress onto the part of the bar after submission.
+      const percent = 35 + Math.round((job.progress || 0) * 0.6);
+      setLoaderProgress(Math.max(loaderProgress, percent), JOB_STAGE_LABELS[job.stage] || "Analyzing ward...");
+      if (job.status === "done" && job.redirect_url) {
+        return job.redirect_url;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Analysis failed.");
+      }
+    }
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL));
+  }
+  throw new Error("Request timeout: The analysis is taking too long. Please try again or contact support.");
+}
+
 function featureToGeoJson(feature) {
   return new Promise((resolve) => {
     feature.toGeoJson((geojson) => resolve(geojson));
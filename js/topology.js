@@ -0,0 +1,56 @@
+// js/topology.js
+
+// The server sends ward and district boundaries as TopoJSON: quantized,
+// delta-encoded arcs shared between neighbouring polygons. decodeTopology turns
+// it back into one GeoJSON FeatureCollection per layer for map.data.addGeoJson.
+
+export function decodeTopology(topology) {
+  const [scaleX, scaleY] = topology.transform.scale;
+  const [translateX, translateY] = topology.transform.translate;
+  const arcs = topology.arcs.map((deltas) => {
+    let x = 0;
+    let y = 0;
+    return deltas.map(([dx, dy]) => {
+      x += dx;
+      y += dy;
+      return [x * scaleX + translateX, y * scaleY + translateY];
+    });
+  });
+
+  const ring = (refs) => {
+    const points = [];
+    refs.forEach((ref) => {
+      const arc = ref >= 0 ? arcs[ref] : arcs[~ref].slice().reverse();
+      // Consecutive arcs share their joining point; keep it once.
+      points.push(...(points.length ? arc.slice(1) : arc));
+    });
+    return points;
+  };
+
+  const layers = {};
+  Object.entries(topology.objects).forEach(([name, collection]) => {
+    layers[name] = {
+      type: "FeatureCollection",
+      features: collection.geometries.map((geometry) => ({
+        type: "Feature",
+        properties: { ...geometry.properties },
+        geometry: {
+          type: geometry.type,
+          coordinates: geometry.type === "Polygon"
+            ? geometry.arcs.map(ring)
+            : geometry.arcs.map((polygon) => polygon.map(ring)),
+        },
+      })),
+    };
+  });
+  return layers;
+}
+
+export async function fetchTopology(baseUrl, { zoom, bbox } = {}) {
+  const url = new URL("/api/topology", baseUrl);
+  if (zoom !== undefined) url.searchParams.set("zoom", zoom);
+  if (bbox) url.searchParams.set("bbox", bbox.join(","));
+  const res = await fetch(url.toString(), { headers: { Accept: "application/json" } });
+  if (!res.ok) throw new Error(`HTTP ${res.status} for ${url}`);
+  return decodeTopology(await res.json());
+}